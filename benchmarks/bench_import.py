@@ -0,0 +1,75 @@
+"""Measure the cost of importing Flask-PyMongo, and of creating apps with it,
+in fresh interpreters.
+
+Run with ``python benchmarks/bench_import.py``.
+"""
+
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+
+RUNS = 15
+
+# Each script prints the seconds it measured, and the modules it loaded.
+IMPORT_DEPENDENCIES = """
+import time
+start = time.perf_counter()
+import flask, pymongo
+elapsed = time.perf_counter() - start
+"""
+
+IMPORT_FLASK_PYMONGO = """
+import flask, pymongo
+import time
+start = time.perf_counter()
+import flask_pymongo
+elapsed = time.perf_counter() - start
+"""
+
+CREATE_APPS = """
+import time
+from flask import Flask
+from flask_pymongo import PyMongo
+start = time.perf_counter()
+for i in range(10):
+    app = Flask(f"app{i}")
+    app.config["MONGO_URI"] = "mongodb://localhost:27017/bench?maxPoolSize=10"
+    PyMongo(app)
+elapsed = time.perf_counter() - start
+"""
+
+REPORT = """
+import json, sys
+print(json.dumps([elapsed, sorted(sys.modules)]))
+"""
+
+WATCHED = ("gridfs", "tarfile", "flask_pymongo.archive", "flask_pymongo.uploads")
+
+
+def measure(script: str) -> tuple[float, list[str]]:
+    times = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", script + REPORT], check=True, capture_output=True, text=True
+        ).stdout
+        elapsed, modules = json.loads(output)
+        times.append(elapsed)
+    return statistics.median(times), modules
+
+
+def main() -> None:
+    for label, script in (
+        ("import flask, pymongo", IMPORT_DEPENDENCIES),
+        ("import flask_pymongo (after them)", IMPORT_FLASK_PYMONGO),
+        ("create 10 apps sharing a URI", CREATE_APPS),
+    ):
+        elapsed, modules = measure(script)
+        loaded = ", ".join(name for name in WATCHED if name in modules) or "none"
+        print(f"{label:<36} {elapsed * 1000:>7.1f} ms  (loaded: {loaded})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compare BSONProvider.loads with bson.json_util.loads on request bodies.
+
+Run with ``python benchmarks/bench_json_loads.py``.
+"""
+
+from __future__ import annotations
+
+import json
+import timeit
+from functools import partial
+
+from bson import json_util
+from flask import Flask
+
+from flask_pymongo.helpers import BSONProvider
+
+
+def make_body(n: int, extended: bool) -> bytes:
+    docs = [
+        {
+            "name": f"item-{i}",
+            "price": i * 1.5,
+            "tags": ["a", "b", "c"],
+            "dims": {"w": i, "h": i + 1, "d": i + 2},
+        }
+        for i in range(n)
+    ]
+    if extended:
+        docs[-1]["when"] = {"$date": "2025-01-01T00:00:00Z"}
+    return json.dumps(docs).encode("utf-8")
+
+
+def main() -> None:
+    provider = BSONProvider(Flask(__name__))
+    for extended in (False, True):
+        body = make_body(20000, extended)
+        number = 10
+        before = timeit.timeit(partial(json_util.loads, body), number=number)
+        after = timeit.timeit(partial(provider.loads, body), number=number)
+        print(
+            f"{len(body) / 1e6:.1f} MB, extended={extended}: "
+            f"json_util.loads {before / number * 1000:.1f} ms, "
+            f"BSONProvider.loads {after / number * 1000:.1f} ms "
+            f"({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
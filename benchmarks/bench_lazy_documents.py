@@ -0,0 +1,70 @@
+"""Compare eager decoding with LazyDocument for views that read a few fields.
+
+Run with ``python benchmarks/bench_lazy_documents.py``.
+"""
+
+from __future__ import annotations
+
+import timeit
+import tracemalloc
+from functools import partial
+from typing import Any
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from flask_pymongo.wrappers import LazyDocument
+
+# Fields at the start of the document, and the last one, which LazyDocument
+# has to scan past all the others to find.
+CASES = (("name", "email", "plan"), ("section_199",))
+
+
+def make_document() -> bytes:
+    # About 200 KB: three small fields and a long history of events.
+    doc: dict[str, Any] = {"name": "Ada", "email": "ada@example.com", "plan": "pro"}
+    for i in range(200):
+        doc[f"section_{i}"] = {
+            "title": f"section {i}",
+            "events": [{"n": n, "kind": "view", "score": n * 0.5} for n in range(20)],
+            "notes": "x" * 200,
+        }
+    return bson.encode(doc)
+
+
+def render(raw: bytes, codec_options: CodecOptions[Any], fields: tuple[str, ...]) -> Any:
+    doc = bson.decode(raw, codec_options)
+    return [doc[field] for field in fields]
+
+
+def memory(raw: bytes, codec_options: CodecOptions[Any], fields: tuple[str, ...]) -> int:
+    tracemalloc.start()
+    # Count the raw bytes of each document, which raw documents keep.
+    docs = [bson.decode(bytes(bytearray(raw)), codec_options) for _ in range(20)]
+    for doc in docs:
+        [doc[field] for field in fields]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size // len(docs)
+
+
+def main() -> None:
+    raw = make_document()
+    for fields in CASES:
+        print(f"{len(raw) / 1e3:.0f} KB document, reading {', '.join(fields)}")
+        for name, codec_options in (
+            ("dict", CodecOptions()),
+            ("RawBSONDocument", CodecOptions(document_class=RawBSONDocument)),
+            ("LazyDocument", CodecOptions(document_class=LazyDocument)),
+        ):
+            number = 200
+            seconds = timeit.timeit(partial(render, raw, codec_options, fields), number=number)
+            print(
+                f"{name:>16}: {seconds / number * 1e6:8.1f} us, "
+                f"{memory(raw, codec_options, fields) / 1e3:8.1f} KB per document"
+            )
+
+
+if __name__ == "__main__":
+    main()
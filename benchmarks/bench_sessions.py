@@ -0,0 +1,76 @@
+"""Compare rewriting the session on every request with MongoSessionInterface.
+
+Requires a MongoDB server on localhost. Run with
+``python benchmarks/bench_sessions.py``.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from flask import Flask, session
+
+from flask_pymongo import PyMongo
+from flask_pymongo.sessions import MongoSessionInterface
+
+REQUESTS = 2000
+
+
+class RewritingSessionInterface(MongoSessionInterface):
+    """Writes every session back on every request, with the server's default
+    write concern, like a naive session interface."""
+
+    def __init__(self, collection: Any) -> None:
+        super().__init__(collection, write_concern=collection.write_concern)
+
+    def save_session(self, app: Any, session: Any, response: Any) -> None:
+        session.modified = True
+        super().save_session(app, session, response)
+
+
+def make_app() -> tuple[Flask, PyMongo]:
+    app = Flask(__name__)
+    app.config["MONGO_URI"] = "mongodb://localhost:27017/bench_sessions"
+    app.config["MONGO_SESSION_COLLECTION"] = "sessions"
+    mongo = PyMongo(app)
+
+    @app.route("/login")
+    def login() -> str:
+        session["user"] = "ada"
+        session["cart"] = [{"sku": i, "quantity": 1} for i in range(20)]
+        return ""
+
+    @app.route("/page")
+    def page() -> str:
+        return str(session["user"])
+
+    return app, mongo
+
+
+def requests_per_second(app: Flask) -> float:
+    client = app.test_client()
+    client.get("/login")
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get("/page")
+    return REQUESTS / (time.perf_counter() - start)
+
+
+def main() -> None:
+    app, mongo = make_app()
+    assert mongo.db is not None and mongo.cx is not None
+    try:
+        for name, interface in (
+            ("rewrite every request", RewritingSessionInterface(mongo.db.sessions)),
+            ("MongoSessionInterface", app.session_interface),
+        ):
+            app.session_interface = interface
+            print(f"{name:>22}: {requests_per_second(app):8.0f} requests/s")
+    finally:
+        mongo.cx.drop_database("bench_sessions")
+        mongo.cx.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -27,20 +27,62 @@ from __future__ import annotations
 __all__ = ("PyMongo", "ASCENDING", "DESCENDING", "BSONObjectIdConverter", "BSONProvider")
 
 import hashlib
+import sys
 import warnings
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 from mimetypes import guess_type
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 
 import pymongo
-from flask import Flask, Response, abort, current_app, request
-from gridfs import GridFS, NoFile
-from pymongo import uri_parser
+from flask import Flask, Response, abort, current_app, g, request, url_for
+from pymongo import IndexModel, uri_parser
+from pymongo.client_session import ClientSession
 from pymongo.driver_info import DriverInfo
+from pymongo.errors import (
+    ExecutionTimeout,
+    NetworkTimeout,
+    PyMongoError,
+    ServerSelectionTimeoutError,
+    WTimeoutError,
+)
+from pymongo.read_preferences import _ServerMode, make_read_preference, read_pref_mode_from_name
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
 from werkzeug.wsgi import wrap_file
 
 from flask_pymongo._version import __version__
+from flask_pymongo.changes import ChangeHub, Subscription
+from flask_pymongo.cli import mongo_cli
 from flask_pymongo.helpers import BSONObjectIdConverter, BSONProvider
-from flask_pymongo.wrappers import Database, MongoClient
+from flask_pymongo.indexes import GRIDFS_INDEXES, IndexStatus, check_indexes, ensure_indexes
+from flask_pymongo.limiter import ConcurrencyLimiter, LimitExceeded
+from flask_pymongo.maintenance import PruneResult, delete_orphaned_chunks, prune_revisions
+from flask_pymongo.materialized import MaterializedView
+from flask_pymongo.profiler import QueryProfiler
+from flask_pymongo.sessions import MongoSessionInterface
+from flask_pymongo.shared_cache import SharedCache, _forget_gridfs_files, _gridfs_key
+from flask_pymongo.stale import StaleCache
+from flask_pymongo.wrappers import (
+    BufferedWriteError,
+    Database,
+    MongoClient,
+    _discard_write_buffers,
+    _flush_write_buffers,
+)
+from flask_pymongo.writer import BackgroundWriter
+
+# GridFS, and the modules built on it, are imported on first use, so that
+# apps which do not store files do not pay for them at startup.
+if TYPE_CHECKING:
+    from gridfs import GridOut
+
+    from flask_pymongo.uploads import ResumableUploads
+
+# The errors raised when a request's MongoDB budget runs out.
+_TIMEOUT_ERRORS = (ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WTimeoutError)
 
 DESCENDING = pymongo.DESCENDING
 """Descending sort order."""
@@ -48,6 +90,10 @@ DESCENDING = pymongo.DESCENDING
 ASCENDING = pymongo.ASCENDING
 """Ascending sort order."""
 
+# Databases overridden by :meth:`PyMongo.read_preference`, keyed by PyMongo
+# instance, for the current context.
+_scoped_dbs: ContextVar[dict[PyMongo, Database] | None] = ContextVar("_scoped_dbs", default=None)
+
 
 class PyMongo:
     """Manages MongoDB connections for your Flask app.
@@ -66,7 +112,16 @@ class PyMongo:
         self, app: Flask | None = None, uri: str | None = None, *args: Any, **kwargs: Any
     ) -> None:
         self.cx: MongoClient | None = None
-        self.db: Database | None = None
+        self._db: Database | None = None
+        self.writer: BackgroundWriter | None = None
+        self.profiler: QueryProfiler | None = None
+        self.limiter: ConcurrencyLimiter | None = None
+        self.stale_cache: StaleCache | None = None
+        self.shared_cache: SharedCache | None = None
+        self._indexes: dict[tuple[str | None, str], list[IndexModel]] = {}
+        self._indexes_checked = False
+        self._changes = ChangeHub()
+        self.materialized_views: dict[str, MaterializedView] = {}
 
         if app is not None:
             self.init_app(app, uri, *args, **kwargs)
@@ -85,6 +140,10 @@ class PyMongo:
         The caller is responsible for ensuring that additional positional
         and keyword arguments result in a valid call.
 
+        A ``json_options`` keyword argument, if given, is not passed to the
+        client; it is the :class:`~bson.json_util.JSONOptions` used by the
+        app's :class:`~flask_pymongo.helpers.BSONProvider`.
+
         .. versionchanged:: 2.2
 
            The ``uri`` is no longer required to contain a database name. If it
@@ -97,6 +156,7 @@ class PyMongo:
            configure Flask-PyMongo.
 
         """
+        json_options = kwargs.pop("json_options", None)
         if uri is None:
             uri = app.config.get("MONGO_URI", None)
         if uri is not None:
@@ -106,8 +166,7 @@ class PyMongo:
                 "You must specify a URI or set the MONGO_URI Flask config variable",
             )
 
-        parsed_uri = uri_parser.parse_uri(uri)
-        database_name = parsed_uri["database"]
+        database_name = _database_name(uri)
 
         # Try to delay connecting, in case the app is loaded before forking, per
         # https://www.mongodb.com/docs/languages/python/pymongo-driver/current/faq/#is-pymongo-fork-safe-
@@ -115,14 +174,504 @@ class PyMongo:
         if DriverInfo is not None:
             kwargs.setdefault("driver", DriverInfo("Flask-PyMongo", __version__))
 
+        if app.config.get("MONGO_PROFILE", False):
+            self.profiler = QueryProfiler(app.config.get("MONGO_PROFILE_EXPLAIN_INTERVAL"))
+            kwargs["event_listeners"] = [*kwargs.get("event_listeners", ()), self.profiler]
+
         self.cx = MongoClient(*args, **kwargs)
+        if self.profiler is not None:
+            self.profiler.client = self.cx
+        if app.config.get("MONGO_CONCURRENCY_LIMIT"):
+            limiter_options = {
+                option: app.config[f"MONGO_CONCURRENCY_{option.upper()}"]
+                for option in ("min_limit", "max_limit", "max_wait")
+                if f"MONGO_CONCURRENCY_{option.upper()}" in app.config
+            }
+            limiter_options.setdefault("max_limit", max(200, app.config["MONGO_CONCURRENCY_LIMIT"]))
+            self.limiter = ConcurrencyLimiter(
+                app.config["MONGO_CONCURRENCY_LIMIT"], **limiter_options
+            )
+            self.cx._limiter = self.limiter
+            app.register_error_handler(LimitExceeded, self._handle_overload)
+        stale_options = {
+            option: app.config[f"MONGO_STALE_{option.upper()}"]
+            for option in (
+                "max_entries",
+                "latency",
+                "max_age",
+                "failure_threshold",
+                "reset_timeout",
+            )
+            if f"MONGO_STALE_{option.upper()}" in app.config
+        }
+        self.stale_cache = StaleCache(**stale_options)
+        self.cx._stale_cache = self.stale_cache
+        if app.config.get("MONGO_SHARED_CACHE_PATH"):
+            if sys.platform == "win32":
+                raise ValueError("MONGO_SHARED_CACHE_PATH requires a POSIX system")
+            shared_cache_options = {
+                option: app.config[f"MONGO_SHARED_CACHE_{option.upper()}"]
+                for option in ("size", "slot_size", "ttl")
+                if f"MONGO_SHARED_CACHE_{option.upper()}" in app.config
+            }
+            self.shared_cache = SharedCache(
+                app.config["MONGO_SHARED_CACHE_PATH"], **shared_cache_options
+            )
+            self.cx._shared_cache = self.shared_cache
         if database_name:
-            self.db = self.cx[database_name]
+            self._db = self.cx[database_name]
+            writer_options = {
+                option: app.config[f"MONGO_WRITER_{option.upper()}"]
+                for option in ("max_queue_size", "batch_size", "flush_interval")
+                if f"MONGO_WRITER_{option.upper()}" in app.config
+            }
+            self.writer = BackgroundWriter(self._db, **writer_options)
+        session_collection = app.config.get("MONGO_SESSION_COLLECTION")
+        if session_collection:
+            if self._db is None:
+                raise ValueError("MONGO_SESSION_COLLECTION requires a database in the URI")
+            app.session_interface = MongoSessionInterface(
+                self._db[session_collection],
+                app.config.get("MONGO_SESSION_REFRESH_THRESHOLD"),
+            )
+            self.declare_index(session_collection, "expiresAt", expireAfterSeconds=0)
 
         app.url_map.converters["ObjectId"] = BSONObjectIdConverter
-        app.json = BSONProvider(app)
+        app.json = BSONProvider(app, json_options)
+        app.teardown_appcontext(self._teardown_writes)
+
+        app.extensions.setdefault("pymongo", []).append(self)
+        if "mongo" not in app.cli.commands:
+            app.cli.add_command(mongo_cli)
+        if app.config.get("MONGO_CHECK_INDEXES", False):
+            # Not checked here: indexes are declared after init_app, and
+            # querying now would connect before a pre-forking server forks.
+            app.before_request(self._warn_about_indexes)
+        if app.config.get("MONGO_REQUEST_TIMEOUT") or app.config.get("MONGO_TIMEOUT_HEADER"):
+            status = app.config.get("MONGO_TIMEOUT_STATUS", 503)
+            if status not in app.aborter.mapping:
+                raise ValueError(f"MONGO_TIMEOUT_STATUS {status!r} is not an HTTP error status")
+            app.before_request(self._start_deadline)
+            app.teardown_request(self._end_deadline)
+            for error in _TIMEOUT_ERRORS:
+                app.register_error_handler(error, self._handle_timeout)
+
+    def _teardown_writes(self, exc: BaseException | None) -> None:
+        if exc is not None:
+            _discard_write_buffers(self.cx)
+            return
+        for request_, error in _flush_write_buffers(self.cx):
+            current_app.logger.error(
+                "Buffered write %r failed: %s", request_, error.get("errmsg", error)
+            )
+
+    def _request_budget(self) -> float | None:
+        budgets = []
+        timeout = current_app.config.get("MONGO_REQUEST_TIMEOUT")
+        if timeout:
+            budgets.append(float(timeout))
+        header = current_app.config.get("MONGO_TIMEOUT_HEADER")
+        if header and header in request.headers:
+            try:
+                remaining = float(request.headers[header]) / 1000
+            except ValueError:
+                pass
+            else:
+                if remaining > 0:
+                    budgets.append(remaining)
+        return min(budgets) if budgets else None
+
+    def _start_deadline(self) -> None:
+        # With several PyMongo instances, the first one sets the deadline,
+        # which applies to every client.
+        if "_pymongo_deadline" in g:
+            return
+        budget = self._request_budget()
+        if budget is None:
+            return
+        deadline = pymongo.timeout(budget)
+        deadline.__enter__()
+        g._pymongo_deadline = deadline
+
+    def _end_deadline(self, exc: BaseException | None) -> None:
+        deadline = g.pop("_pymongo_deadline", None)
+        if deadline is not None:
+            deadline.__exit__(None, None, None)
+
+    def _handle_timeout(self, exc: PyMongoError) -> Any:
+        # abort() would escape the error handling, so this goes through
+        # whatever handler the app has for the status instead.
+        status = current_app.config.get("MONGO_TIMEOUT_STATUS", 503)
+        return current_app.handle_http_exception(current_app.aborter.mapping[status]())
+
+    def _handle_overload(self, exc: LimitExceeded) -> Any:
+        return current_app.handle_http_exception(ServiceUnavailable())
+
+    def flush_writes(self) -> None:
+        """Send the writes queued with
+        :meth:`~flask_pymongo.wrappers.Collection.buffer_write` now.
+
+        Raises :class:`~flask_pymongo.wrappers.BufferedWriteError`, mapping
+        each failure back to the operation that caused it, if any write
+        fails. Writes to other collections are still sent.
+        """
+        failures = _flush_write_buffers(self.cx)
+        if failures:
+            raise BufferedWriteError(failures)
+
+    def declare_index(
+        self, collection: str, keys: Any, db: str | None = None, **kwargs: Any
+    ) -> None:
+        """Declare an index that ``collection`` should have.
+
+        Declared indexes are created by :meth:`ensure_indexes`, or by the
+        ``flask mongo ensure-indexes`` command. They are built in the
+        background on servers older than MongoDB 4.2, which otherwise block
+        the collection while an index is built.
+
+        .. code-block:: python
+
+            mongo = PyMongo(app)
+            mongo.declare_index("users", "email", unique=True)
+            mongo.declare_index("posts", [("author", ASCENDING), ("date", DESCENDING)])
+
+        :param str collection: the name of the collection
+        :param keys: a key name, or a list of ``(key, direction)`` pairs, as
+           for :meth:`~pymongo.collection.Collection.create_index`
+        :param str db: the target database, if different from the default database.
+        :param kwargs: index options, such as ``unique`` or ``name``, passed
+           to :class:`~pymongo.operations.IndexModel`
+        """
+        kwargs.setdefault("background", True)
+        self._declare_index(db, collection, IndexModel(keys, **kwargs))
+
+    def declare_gridfs_indexes(self, base: str = "fs", db: str | None = None) -> None:
+        """Declare the indexes used by GridFS, and by :meth:`send_file`, on
+        the ``files`` and ``chunks`` collections of ``base``.
+
+        :param str base: the base name of the GridFS collections to use
+        :param str db: the target database, if different from the default database.
+        """
+        for suffix, models in GRIDFS_INDEXES.items():
+            for model in models:
+                self._declare_index(db, f"{base}.{suffix}", model)
+
+    def _declare_index(self, db: str | None, collection: str, model: IndexModel) -> None:
+        models = self._indexes.setdefault((db, collection), [])
+        if all(other.document["name"] != model.document["name"] for other in models):
+            models.append(model)
+
+    def check_indexes(self) -> list[IndexStatus]:
+        """Compare the declared indexes with those on the server, and return
+        an :class:`~flask_pymongo.indexes.IndexStatus` for each declared
+        index and each undeclared index on the same collections.
+        """
+        return [
+            status
+            for coll, models in self._declared_indexes()
+            for status in check_indexes(coll, models)
+        ]
+
+    def ensure_indexes(self) -> list[IndexStatus]:
+        """Create the missing declared indexes, and return an
+        :class:`~flask_pymongo.indexes.IndexStatus` for each declared index
+        and each undeclared index on the same collections.
+
+        Indexes whose options differ from their declaration are reported as
+        ``"changed"``, but are left alone.
+        """
+        return [
+            status
+            for coll, models in self._declared_indexes()
+            for status in ensure_indexes(coll, models)
+        ]
+
+    def _declared_indexes(self) -> Iterator[tuple[Any, list[IndexModel]]]:
+        for (db, collection), models in self._indexes.items():
+            db_obj = self.cx[db] if db else self._db  # type: ignore[index]
+            assert db_obj is not None, "Please initialize the app before checking indexes!"
+            yield db_obj[collection], models
+
+    def _warn_about_indexes(self) -> None:
+        if self._indexes_checked:
+            return
+        self._indexes_checked = True
+        try:
+            report = self.check_indexes()
+        except PyMongoError as exc:
+            current_app.logger.warning("Could not check indexes: %s", exc)
+            return
+        for status in report:
+            if status.status in ("missing", "changed"):
+                current_app.logger.warning(
+                    "Index %s on %s is %s; run 'flask mongo ensure-indexes'",
+                    status.name,
+                    status.namespace,
+                    status.status,
+                )
+
+    @property
+    def db(self) -> Database | None:
+        """The :class:`~flask_pymongo.wrappers.Database` named in the URI.
+
+        Inside a :meth:`read_preference` block, this is a copy of the
+        database configured with that block's read preference.
+        """
+        return (_scoped_dbs.get() or {}).get(self, self._db)
+
+    @db.setter
+    def db(self, value: Database | None) -> None:
+        self._db = value
+
+    @contextmanager
+    def read_preference(
+        self,
+        mode: str | _ServerMode,
+        max_staleness: int = -1,
+        tag_sets: list[dict[str, Any]] | None = None,
+        causal_consistency: bool = False,
+    ) -> Iterator[ClientSession | None]:
+        """Route reads through :attr:`db` using the given read preference.
+
+        Collections looked up from :attr:`db` inside the block (or inside a
+        decorated view) use ``mode`` instead of the client's read preference,
+        so read-heavy views can be offloaded to secondaries without changing
+        each query.
+
+        .. code-block:: python
+
+            @app.route("/reports")
+            @mongo.read_preference("secondaryPreferred", max_staleness=120)
+            def reports():
+                return jsonify(mongo.db.reports.find())
+
+        If ``causal_consistency`` is true, a causally consistent
+        :class:`~pymongo.client_session.ClientSession` is started for the
+        block and returned by the context manager. Reads made with that
+        session observe the writes made earlier with it, even when they are
+        served by a secondary. With PyMongo 4.17 or later, the session is
+        bound, and passed to every operation in the block implicitly;
+        otherwise it must be passed as the ``session`` argument.
+
+        .. code-block:: python
+
+            @app.route("/cart", methods=["POST"])
+            def add_to_cart():
+                with mongo.read_preference("secondary", causal_consistency=True) as s:
+                    mongo.db.carts.insert_one(request.json, session=s)
+                    return jsonify(mongo.db.carts.find(session=s))
+
+        :param mode: a read preference name as used in the URI (such as
+           ``"secondaryPreferred"``), or a :mod:`~pymongo.read_preferences`
+           instance, in which case ``max_staleness`` and ``tag_sets`` are
+           ignored
+        :param int max_staleness: the maximum replication lag, in seconds, of
+           secondaries that may serve reads; ``-1`` means no maximum
+        :param list tag_sets: the tag sets used to select eligible members
+        :param bool causal_consistency: start a causally consistent session
+           for the block
+        """
+        if isinstance(mode, str):
+            try:
+                mode = make_read_preference(read_pref_mode_from_name(mode), tag_sets, max_staleness)
+            except ValueError:
+                raise ValueError(f"{mode!r} is not a valid read preference") from None
+        if not isinstance(mode, _ServerMode):
+            raise TypeError("'mode' must be a read preference name or instance")
+
+        assert self.cx is not None, "Please initialize the app before calling read_preference!"
+        scoped = dict(_scoped_dbs.get() or {})
+        if self._db is not None:
+            scoped[self] = Database(self.cx, self._db.name, read_preference=mode)
+        token = _scoped_dbs.set(scoped)
+        try:
+            if not causal_consistency:
+                yield None
+                return
+            with self.cx.start_session(causal_consistency=True) as session:
+                if hasattr(session, "bind"):
+                    with session.bind(end_session=False):
+                        yield session
+                else:
+                    yield session
+        finally:
+            _scoped_dbs.reset(token)
 
     # view helpers
+    def materialize(
+        self,
+        name: str,
+        collection: str,
+        pipeline: list[dict[str, Any]],
+        every: float | None = None,
+        on: str | list[str] = "_id",
+        incremental: bool = False,
+        max_age: float | None = None,
+        lease: float = 300.0,
+        db: str | None = None,
+    ) -> MaterializedView:
+        """Register an aggregation on ``collection`` whose results are kept
+        in the collection ``name`` with ``$merge``, refreshed every
+        ``every`` seconds, or on demand with
+        :meth:`~flask_pymongo.materialized.MaterializedView.refresh` and the
+        ``flask mongo refresh-materialized`` command.
+
+        .. code-block:: python
+
+            mongo.materialize(
+                "sales_by_day",
+                "orders",
+                [{"$group": {"_id": "$day", "total": {"$sum": "$amount"}}}],
+                every=300,
+            )
+
+            @app.route("/dashboard/sales")
+            def sales():
+                view = mongo.materialized("sales_by_day")
+                status = view.status()
+                rows = list(view.collection.find(sort=[("_id", -1)], limit=30))
+                return {"rows": rows, "age": status.age, "stale": status.stale}
+
+        Scheduled refreshes run in a daemon thread of each process, started
+        when the view is first read, and coordinated through the
+        ``materialized_views`` collection so that the pipeline runs once per
+        interval however many processes there are. See
+        :class:`~flask_pymongo.materialized.MaterializedView` for the other
+        parameters. Refreshing requires MongoDB 4.2 or later, for ``$merge``.
+
+        :param str name: the name of the view, and of its collection
+        :param str collection: the name of the collection to aggregate
+        :param list pipeline: the aggregation pipeline, without ``$merge``
+        :param float every: the number of seconds between refreshes, or
+           ``None`` to refresh only on demand
+        :param float lease: the number of seconds after which a refresh
+           that has not finished is abandoned, which should be longer than
+           the pipeline takes
+        :param str db: the target database, if different from the default database.
+        """
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling materialize!"
+        view = MaterializedView(
+            db_obj[collection], pipeline, name, every, on, incremental, max_age, lease
+        )
+        self.materialized_views[name] = view
+        if on != "_id":
+            keys = [on] if isinstance(on, str) else on
+            self.declare_index(name, [(key, ASCENDING) for key in keys], db, unique=True)
+        return view
+
+    def materialized(self, name: str) -> MaterializedView:
+        """Return the :class:`~flask_pymongo.materialized.MaterializedView`
+        registered with :meth:`materialize` as ``name``."""
+        return self.materialized_views[name]
+
+    def subscribe(
+        self,
+        collection: str,
+        pipeline: list[dict[str, Any]] | None = None,
+        filter: Callable[[Any], bool] | None = None,
+        max_queue: int = 100,
+        on_overflow: str = "drop",
+        db: str | None = None,
+        **kwargs: Any,
+    ) -> Subscription:
+        """Subscribe to the changes of ``collection``.
+
+        All the subscriptions of a process to the same collection, with the
+        same ``pipeline`` and options, share a single change stream, read by
+        a background thread, and closed with the last subscription. Each
+        subscription then selects the changes it receives with ``filter``,
+        and buffers them; see :class:`~flask_pymongo.changes.Subscription`.
+
+        This returns once the change stream is open, so that no change
+        made afterwards is missed. It raises the error of
+        :meth:`~pymongo.collection.Collection.watch` if the change stream
+        cannot be opened, and :class:`TimeoutError` if it is not open
+        within 5 seconds.
+
+        :param str collection: the name of the collection to watch
+        :param list pipeline: an aggregation pipeline run by the server on
+           the changes, shared by the subscriptions using the same one
+        :param filter: a function called with each change, returning
+           whether this subscription receives it
+        :param int max_queue: the maximum number of changes buffered
+        :param str on_overflow: ``"drop"`` to drop changes when the buffer
+           is full, or ``"disconnect"`` to close the subscription
+        :param str db: the target database, if different from the default database.
+        :param kwargs: options of :meth:`~pymongo.collection.Collection.watch`,
+           such as ``full_document``
+        """
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling subscribe!"
+        return self._changes.subscribe(
+            db_obj[collection], pipeline, filter, max_queue, on_overflow, **kwargs
+        )
+
+    def send_changes(
+        self,
+        collection: str,
+        pipeline: list[dict[str, Any]] | None = None,
+        filter: Callable[[Any], bool] | None = None,
+        heartbeat: float = 15.0,
+        max_queue: int = 100,
+        on_overflow: str = "disconnect",
+        db: str | None = None,
+        **kwargs: Any,
+    ) -> Response:
+        """Respond with a stream of `Server-Sent Events
+        <https://html.spec.whatwg.org/multipage/server-sent-events.html>`_,
+        one per change of ``collection``, encoded by the app's
+        :class:`~flask_pymongo.helpers.BSONProvider`.
+
+        .. code-block:: python
+
+            @app.route("/rooms/<room>/messages/live")
+            def live_messages(room):
+                return mongo.send_changes(
+                    "messages",
+                    [{"$match": {"operationType": "insert"}}],
+                    filter=lambda change: change["fullDocument"]["room"] == room,
+                )
+
+        The changes come from a change stream shared by every connected
+        client; see :meth:`subscribe`. A client which falls ``max_queue``
+        changes behind is disconnected, and reconnects as browsers do, or,
+        if ``on_overflow`` is ``"drop"``, misses those changes. A comment is
+        sent every ``heartbeat`` seconds without changes, so that proxies
+        do not close the connection.
+
+        :param float heartbeat: the number of seconds between comments sent
+           when there are no changes
+        """
+        app = current_app._get_current_object()  # type: ignore[attr-defined]
+        subscription = self.subscribe(
+            collection, pipeline, filter, max_queue, on_overflow, db, **kwargs
+        )
+
+        def events() -> Iterator[str]:
+            try:
+                yield ": subscribed\n\n"
+                while not subscription.closed:
+                    change = subscription.get(timeout=heartbeat)
+                    if change is None:
+                        yield ": heartbeat\n\n"
+                        continue
+                    data = app.json.dumps(change)
+                    event = "".join(f"data: {line}\n" for line in data.splitlines())
+                    token = change.get("_id", {}).get("_data")
+                    yield (f"id: {token}\n" if token else "") + event + "\n"
+            finally:
+                subscription.close()
+
+        response = current_app.response_class(events(), mimetype="text/event-stream")
+        # The body is never iterated for HEAD requests, nor if the client
+        # disconnects before the first event.
+        response.call_on_close(subscription.close)
+        response.headers["Cache-Control"] = "no-cache"
+        # Ask nginx not to buffer the stream.
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
     def send_file(
         self,
         filename: str,
@@ -158,6 +707,7 @@ class PyMongo:
             raise TypeError("'version' must be an integer")
         if not isinstance(cache_for, int):
             raise TypeError("'cache_for' must be an integer")
+        from gridfs import GridFS, NoFile
 
         if db:
             db_obj = self.cx[db]
@@ -165,17 +715,255 @@ class PyMongo:
             db_obj = self.db
 
         assert db_obj is not None, "Please initialize the app before calling send_file!"
+        try:
+            if version == -1 and self.shared_cache is not None:
+                fileobj = self._latest_version(db_obj, base, filename)
+            else:
+                fileobj = GridFS(db_obj, base).get_version(filename=filename, version=version)
+        except NoFile:
+            abort(404)
+
+        content_type, _ = guess_type(filename)
+        return self._file_response(fileobj, filename, content_type, cache_for)
+
+    def _latest_version(self, db_obj: Any, base: str, filename: str) -> GridOut:
+        # The cached revision is forgotten when this host saves or prunes
+        # revisions of the file (see _forget_gridfs_files), but may be
+        # stale for up to its TTL after changes from other hosts, or a
+        # save racing this lookup.
+        from gridfs import GridOut, NoFile
+
+        assert self.shared_cache is not None
+        files = db_obj[f"{base}.files"]
+        key = _gridfs_key(db_obj, base, filename)
+        try:
+            doc = self.shared_cache.get(key, files.codec_options)
+        except KeyError:
+            doc = files.find_one({"filename": filename}, sort=[("uploadDate", DESCENDING)])
+            if doc is None:
+                raise NoFile(f"no version -1 for filename {filename!r}") from None
+            self.shared_cache.set(key, doc)
+        return GridOut(db_obj[base], file_document=doc)
+
+    def send_file_by_id(
+        self,
+        file_id: Any,
+        base: str = "fs",
+        sha1: str | None = None,
+        cache_for: int = 31536000,
+        db: str | None = None,
+    ) -> Response:
+        """Respond with the file from GridFS with the given ``_id``.
+
+        Unlike :meth:`send_file`, which looks up the latest revision of a
+        filename, this fetches the file by its primary key. A file's
+        content never changes once saved, so the response is marked as
+        ``immutable``, and browsers and CDNs may cache it for ``cache_for``
+        seconds without revalidating. Use :meth:`file_url` to link to it.
+
+        .. code-block:: python
+
+            @app.route("/files/<ObjectId:file_id>/<sha1>/<path:filename>")
+            def get_file(file_id, sha1, filename):
+                return mongo.send_file_by_id(file_id, sha1=sha1)
+
+        :param file_id: the ``_id`` of the file to return
+        :param str base: the base name of the GridFS collections to use
+        :param str sha1: if given, respond with HTTP status 404 unless the
+           file's sha1 (as saved by :meth:`save_file`, or ``"-"`` for files
+           without one) matches it
+        :param int cache_for: number of seconds that browsers should be
+           instructed to cache responses
+        :param str db: the target database, if different from the default database.
+        """
+        if not isinstance(base, str):
+            raise TypeError("'base' must be string or unicode")
+        if not isinstance(cache_for, int):
+            raise TypeError("'cache_for' must be an integer")
+
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling send_file_by_id!"
+        from gridfs import GridFS, NoFile
+
         storage = GridFS(db_obj, base)
 
         try:
-            fileobj = storage.get_version(filename=filename, version=version)
+            fileobj = storage.get(file_id)
         except NoFile:
             abort(404)
+        if sha1 is not None and getattr(fileobj, "sha1", "-") != sha1:
+            abort(404)
+
+        content_type = fileobj.content_type or guess_type(fileobj.filename)[0]
+        response = self._file_response(fileobj, fileobj.filename, content_type, cache_for)
+        response.cache_control.immutable = True
+        return response
+
+    def file_url(
+        self, endpoint: str, file_id: Any, base: str = "fs", db: str | None = None, **values: Any
+    ) -> str:
+        """Build a URL for the file from GridFS with the given ``_id``.
+
+        The URL is built with :func:`~flask.url_for` for ``endpoint``,
+        passing the ``file_id``, ``sha1`` and ``filename`` of the file as
+        values, so that it changes whenever a new revision of the file is
+        saved, and the response to it can be cached forever. Files not
+        saved by :meth:`save_file` have no sha1, and use ``"-"`` instead.
+        See :meth:`send_file_by_id`.
+
+        .. code-block:: python
+
+            file_id = mongo.save_file("report.pdf", request.files["file"])
+            return redirect(mongo.file_url("get_file", file_id))
+
+        :param str endpoint: the endpoint of the view calling
+           :meth:`send_file_by_id`
+        :param file_id: the ``_id`` of the file
+        :param str base: the base name of the GridFS collections to use
+        :param str db: the target database, if different from the default database.
+        :param values: other values passed to :func:`~flask.url_for`
+        """
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling file_url!"
+        doc = db_obj[f"{base}.files"].find_one({"_id": file_id}, {"filename": 1, "sha1": 1})
+        if doc is None:
+            from gridfs import NoFile
+
+            raise NoFile(f"no file in gridfs collection {base!r} with _id {file_id!r}")
+        return url_for(
+            endpoint, file_id=file_id, sha1=doc.get("sha1", "-"), filename=doc["filename"], **values
+        )
+
+    def send_archive(
+        self,
+        filenames_or_query: list[str] | dict[str, Any],
+        filename: str | None = None,
+        format: str = "zip",
+        deflate: bool = False,
+        base: str = "fs",
+        db: str | None = None,
+    ) -> Response:
+        """Respond with a ZIP or TAR archive of several files from GridFS.
+
+        The archive is written as it is sent, from the GridFS chunks of the
+        files, so memory use does not grow with the size or number of
+        files. Stored (not deflated) ZIP archives and TAR archives have a
+        ``Content-Length``; deflated ZIP archives are sent without one.
+
+        .. code-block:: python
+
+            @app.route("/messages/<ObjectId:message_id>/attachments.zip")
+            def get_attachments(message_id):
+                return mongo.send_archive({"metadata.message": message_id})
+
+        :param filenames_or_query: a list of filenames, of which the latest
+           revisions are archived, or a query selecting the files to
+           archive from the ``files`` collection. If any of the filenames
+           does not exist, respond with HTTP status 404.
+        :param str filename: the filename of the archive; by default,
+           ``archive.zip`` or ``archive.tar``
+        :param str format: ``"zip"`` or ``"tar"``
+        :param bool deflate: compress the files in a ZIP archive
+        :param str base: the base name of the GridFS collections to use
+        :param str db: the target database, if different from the default database.
+        """
+        if not isinstance(base, str):
+            raise TypeError("'base' must be string or unicode")
+        if format not in ("zip", "tar"):
+            raise ValueError("'format' must be 'zip' or 'tar'")
+        if deflate and format != "zip":
+            raise ValueError("only ZIP archives can be deflated")
+
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling send_archive!"
+        files = db_obj[f"{base}.files"]
+
+        if isinstance(filenames_or_query, dict):
+            docs = list(files.find(filenames_or_query).sort("_id", 1))
+        else:
+            names = set(filenames_or_query)
+            docs = list(
+                files.aggregate(
+                    [
+                        {"$match": {"filename": {"$in": list(names)}}},
+                        {"$sort": {"uploadDate": -1}},
+                        {"$group": {"_id": "$filename", "doc": {"$first": "$$ROOT"}}},
+                        {"$replaceRoot": {"newRoot": "$doc"}},
+                        {"$sort": {"_id": 1}},
+                    ]
+                )
+            )
+            if len(docs) != len(names):
+                abort(404)
 
+        from flask_pymongo import archive
+
+        members = archive.gridfs_members(db_obj[f"{base}.chunks"], docs)
+        length: int | None
+        if format == "zip":
+            data = archive.zip_stream(members, deflate)
+            length = None if deflate else archive.zip_length(docs)
+            mimetype = "application/zip"
+        else:
+            data = archive.tar_stream(members)
+            length = archive.tar_length(docs)
+            mimetype = "application/x-tar"
+
+        response = current_app.response_class(data, mimetype=mimetype, direct_passthrough=True)
+        filename = filename or f"archive.{format}"
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        if length is not None:
+            response.content_length = length
+        return response
+
+    def prune_gridfs(
+        self,
+        base: str = "fs",
+        keep: int = 1,
+        min_age: int = 3600,
+        batch_size: int = 100,
+        pause: float = 0.1,
+        dry_run: bool = False,
+        db: str | None = None,
+    ) -> PruneResult:
+        """Delete old revisions of GridFS files, and orphaned chunks.
+
+        Every :meth:`save_file` of an existing filename adds a revision,
+        which :meth:`send_file` can still address, so GridFS collections
+        only grow. This keeps the latest ``keep`` revisions of each
+        filename, and deletes the chunks that belong to no file. Work is
+        done ``batch_size`` files at a time, sleeping ``pause`` seconds
+        between batches, so that it can run against a live cluster. The
+        ``flask mongo prune-gridfs`` command does the same.
+
+        .. code-block:: python
+
+            result = mongo.prune_gridfs(keep=3)
+            print(f"{result.revisions} revisions, {result.orphaned_chunks} chunks")
+
+        :param str base: the base name of the GridFS collections to use
+        :param int keep: the number of revisions of each filename to keep
+        :param int min_age: the number of seconds a chunk without a file is
+           kept, so that files being saved are not mistaken for orphans
+        :param int batch_size: the number of files to process per batch
+        :param float pause: the number of seconds to sleep between batches
+        :param bool dry_run: only count what would be deleted
+        :param str db: the target database, if different from the default database.
+        """
+        if not isinstance(base, str):
+            raise TypeError("'base' must be string or unicode")
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling prune_gridfs!"
+        revisions = prune_revisions(db_obj, base, keep, batch_size, pause, dry_run)
+        orphaned_chunks = delete_orphaned_chunks(db_obj, base, min_age, batch_size, pause, dry_run)
+        return PruneResult(revisions, orphaned_chunks)
+
+    def _file_response(
+        self, fileobj: Any, filename: str, content_type: str | None, cache_for: int
+    ) -> Response:
         # mostly copied from flask/helpers.py, with
         # modifications for GridFS
         data = wrap_file(request.environ, fileobj, buffer_size=1024 * 255)
-        content_type, _ = guess_type(filename)
         response = current_app.response_class(
             data,
             mimetype=content_type,
@@ -186,12 +974,15 @@ class PyMongo:
         response.last_modified = fileobj.upload_date
 
         # GridFS does not manage its own checksum.
-        # Try to use a sha1 sum that we have added during a save_file.
+        # Try to use a sha1 sum that we have added during a save_file, or
+        # the etag of a resumable upload.
         # Fall back to a legacy md5 sum if it exists.
         # Otherwise, compute the sha1 sum directly.
         try:
             etag = fileobj.sha1
         except AttributeError:
+            etag = getattr(fileobj, "etag", None)
+        if etag is None:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
                 etag = fileobj.md5
@@ -249,6 +1040,8 @@ class PyMongo:
         else:
             db_obj = self.db
         assert db_obj is not None, "Please initialize the app before calling save_file!"
+        from gridfs import GridFS
+
         storage = GridFS(db_obj, base)
 
         # GridFS does not manage its own checksum, so we attach a sha1 to the file
@@ -257,7 +1050,187 @@ class PyMongo:
         with storage.new_file(filename=filename, content_type=content_type, **kwargs) as grid_file:
             grid_file.write(hashingfile)
             grid_file.sha1 = hashingfile.hash.hexdigest()
-            return grid_file._id
+        _forget_gridfs_files(db_obj, base, [filename])
+        return grid_file._id
+
+    def save_stream(
+        self,
+        filename: str | None = None,
+        field: str = "file",
+        base: str = "fs",
+        content_type: str | None = None,
+        max_size: int | None = None,
+        db: str | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Save the body of the current request to GridFS as it arrives.
+           Return the "_id" of the created file.
+
+        Unlike passing ``request.files["file"]`` to :meth:`save_file`, which
+        first parses the whole request and spools large uploads to a
+        temporary file, this reads :attr:`~flask.Request.stream` and writes
+        each GridFS chunk as soon as it is received.
+
+        If the request is ``multipart/form-data``, the file in the form
+        field ``field`` is saved, and the other fields are skipped. Otherwise
+        the raw request body is saved, and ``filename`` is required.
+
+        .. code-block:: python
+
+            @app.route("/uploads", methods=["POST"])
+            def save_upload():
+                file_id = mongo.save_stream(max_size=100 * 1024 * 1024)
+                return redirect(mongo.file_url("get_file", file_id))
+
+        If the file is larger than ``max_size`` bytes, the chunks written so
+        far are removed, and the request fails with HTTP status 413. The
+        request fails with HTTP status 400, also removing the chunks written
+        so far, if the body is malformed or truncated, or if the form has no
+        file in ``field``, or a file without a filename.
+
+        :param str filename: the filename of the file; by default, the
+           filename sent in the form
+        :param str field: the form field holding the file
+        :param str base: the base name of the GridFS collections to use
+        :param str content_type: the MIME content-type of the file; by
+           default, the content-type sent for the file, or guessed from the
+           filename
+        :param int max_size: the maximum size of the file, in bytes; by
+           default, the ``MONGO_MAX_UPLOAD_SIZE`` Flask configuration
+           variable, if set
+        :param str db: the target database, if different from the default database.
+        :param kwargs: extra attributes to be stored in the file's document,
+           passed directly to :meth:`gridfs.GridFS.new_file`
+        """
+        if not isinstance(base, str):
+            raise TypeError("'base' must be string or unicode")
+        if max_size is None:
+            max_size = current_app.config.get("MONGO_MAX_UPLOAD_SIZE")
+
+        chunks: Iterator[Any]
+        if request.mimetype == "multipart/form-data":
+            boundary = request.mimetype_params.get("boundary", "").encode("latin-1")
+            chunks = _multipart_file_chunks(request.stream, boundary, field)
+            part = next(chunks, None)
+            if part is None:
+                abort(400)
+            filename = filename or part.filename
+            if not filename:
+                # A file input left empty sends a part with no filename.
+                abort(400)
+            content_type = content_type or part.headers.get("Content-Type")
+        else:
+            if not filename:
+                raise ValueError("'filename' is required to save a request body")
+            chunks = iter(lambda: request.stream.read(_STREAM_CHUNK_SIZE), b"")
+            content_type = content_type or request.mimetype or None
+        if content_type is None:
+            content_type, _ = guess_type(filename)
+
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling save_stream!"
+        from gridfs import GridFS
+
+        storage = GridFS(db_obj, base)
+
+        sha1 = hashlib.sha1()
+        size = 0
+        with storage.new_file(filename=filename, content_type=content_type, **kwargs) as grid_file:
+            try:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        abort(413)
+                    sha1.update(chunk)
+                    grid_file.write(chunk)
+            except BaseException:
+                grid_file.abort()
+                raise
+            grid_file.sha1 = sha1.hexdigest()
+        _forget_gridfs_files(db_obj, base, [filename])
+        return grid_file._id
+
+    def resumable_uploads(
+        self, base: str = "fs", expire_after: int = 86400, db: str | None = None
+    ) -> ResumableUploads:
+        """Return a :class:`~flask_pymongo.uploads.ResumableUploads`, to
+        receive files into GridFS over several requests.
+
+        .. code-block:: python
+
+            @app.route("/uploads/<ObjectId:upload_id>", methods=["PATCH"])
+            def append_upload(upload_id):
+                offset = int(request.headers["Upload-Offset"])
+                offset = mongo.resumable_uploads().append(upload_id, request.stream, offset)
+                return "", 204, {"Upload-Offset": str(offset)}
+
+        Files are limited to ``MONGO_MAX_UPLOAD_SIZE`` bytes, if that Flask
+        configuration variable is set.
+
+        :param str base: the base name of the GridFS collections to use
+        :param int expire_after: number of seconds after which an upload that
+           receives no data is abandoned
+        :param str db: the target database, if different from the default database.
+        """
+        db_obj = self.cx[db] if db else self.db  # type: ignore[index]
+        assert db_obj is not None, "Please initialize the app before calling resumable_uploads!"
+        from flask_pymongo.uploads import ResumableUploads
+
+        return ResumableUploads(
+            db_obj,
+            base,
+            expire_after=expire_after,
+            max_size=current_app.config.get("MONGO_MAX_UPLOAD_SIZE"),
+        )
+
+
+# Read request bodies in GridFS-chunk-sized pieces.
+_STREAM_CHUNK_SIZE = 255 * 1024
+
+
+@lru_cache(maxsize=32)
+def _database_name(uri: str) -> str | None:
+    # parse_uri validates every option of the URI and, for mongodb+srv://
+    # URIs, resolves DNS records, so apps sharing a URI parse it only once.
+    database: str | None = uri_parser.parse_uri(uri)["database"]
+    return database
+
+
+def _multipart_file_chunks(stream: Any, boundary: bytes, field: str) -> Iterator[Any]:
+    """Parse a multipart/form-data body incrementally, yielding the
+    :class:`~werkzeug.sansio.multipart.File` event of the first file in
+    ``field``, then its data.
+
+    A malformed or truncated body causes a 400 Bad Request HTTP status.
+    """
+    decoder = MultipartDecoder(boundary)
+    in_file = False
+    while True:
+        data = stream.read(_STREAM_CHUNK_SIZE)
+        decoder.receive_data(data or None)
+        event = _next_multipart_event(decoder)
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, File) and event.name == field:
+                in_file = True
+                yield event
+            elif isinstance(event, (Field, File)):
+                in_file = False
+            elif isinstance(event, Data) and in_file:
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    return
+            event = _next_multipart_event(decoder)
+        if not data or isinstance(event, Epilogue):
+            return
+
+
+def _next_multipart_event(decoder: MultipartDecoder) -> Any:
+    try:
+        return decoder.next_event()
+    except ValueError:
+        # Raised by Werkzeug for malformed and truncated bodies alike.
+        abort(400, description="Malformed multipart/form-data body.")
 
 
 class _Wrapper:
@@ -0,0 +1,314 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("zip_stream", "zip_length", "tar_stream", "tar_length", "gridfs_members")
+
+import queue
+import struct
+import tarfile
+import threading
+import zlib
+from collections.abc import Generator, Iterable, Iterator
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Any
+
+from gridfs.errors import CorruptGridFile
+from pymongo.collection import Collection
+
+Member = tuple[Any, Iterable[bytes]]
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP_FLAGS = 0x08 | 0x800  # sizes in a data descriptor; UTF-8 names
+_TAR_BLOCK = tarfile.BLOCKSIZE
+_TAR_RECORD = tarfile.RECORDSIZE
+
+
+def _name(doc: Any) -> bytes:
+    return str(doc["filename"]).encode("utf-8")
+
+
+def _dos_datetime(value: datetime | None) -> tuple[int, int]:
+    if value is None or value.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    date = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    return time, date
+
+
+def _zip64(doc: Any) -> bool:
+    # Deflate may expand incompressible data slightly.
+    return bool(doc["length"] * 1.05 >= _ZIP64_LIMIT)
+
+
+def _zip_local_header(doc: Any, method: int) -> bytes:
+    name = _name(doc)
+    time, date = _dos_datetime(doc.get("uploadDate"))
+    if _zip64(doc):
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        return (
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                45,
+                _ZIP_FLAGS,
+                method,
+                time,
+                date,
+                0,
+                _ZIP64_LIMIT,
+                _ZIP64_LIMIT,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+    return (
+        struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, _ZIP_FLAGS, method, time, date, 0, 0, 0, len(name), 0
+        )
+        + name
+    )
+
+
+def _zip_descriptor(doc: Any, crc: int, compressed: int) -> bytes:
+    if _zip64(doc):
+        return struct.pack("<IIQQ", 0x08074B50, crc, compressed, doc["length"])
+    return struct.pack("<IIII", 0x08074B50, crc, compressed, doc["length"])
+
+
+def _zip_central_header(doc: Any, method: int, crc: int, compressed: int, offset: int) -> bytes:
+    name = _name(doc)
+    time, date = _dos_datetime(doc.get("uploadDate"))
+    fields = []
+    size = doc["length"]
+    if _zip64(doc):
+        fields += [size, compressed]
+        size = compressed = _ZIP64_LIMIT
+    if offset >= _ZIP64_LIMIT:
+        fields.append(offset)
+        offset = _ZIP64_LIMIT
+    extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+    version = 45 if extra else 20
+    return (
+        struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            0x02014B50,
+            (3 << 8) | version,
+            version,
+            _ZIP_FLAGS,
+            method,
+            time,
+            date,
+            crc,
+            compressed,
+            size,
+            len(name),
+            len(extra),
+            0,
+            0,
+            0,
+            0o100644 << 16,
+            offset,
+        )
+        + name
+        + extra
+    )
+
+
+def _zip_end(count: int, offset: int, size: int) -> bytes:
+    end = b""
+    if count >= 0xFFFF or offset >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+        end = struct.pack(
+            "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, size, offset
+        ) + struct.pack("<IIQI", 0x07064B50, 0, offset + size, 1)
+        count, offset, size = min(count, 0xFFFF), min(offset, _ZIP64_LIMIT), min(size, _ZIP64_LIMIT)
+    return end + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, size, offset, 0)
+
+
+def zip_stream(members: Iterable[Member], deflate: bool = False) -> Iterator[bytes]:
+    """Write a ZIP archive of ``members``, stored or deflated.
+
+    Each member is a GridFS ``files`` document and an iterator of its data.
+    CRCs are not known until the data has been read, so they follow the
+    data in data descriptors.
+    """
+    method = zlib.DEFLATED if deflate else 0
+    central = []
+    offset = 0
+    for doc, data in members:
+        header = _zip_local_header(doc, method)
+        yield header
+        crc = compressed = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        for chunk in data:
+            crc = zlib.crc32(chunk, crc)
+            if deflate:
+                chunk = compressor.compress(chunk)
+            compressed += len(chunk)
+            if chunk:
+                yield chunk
+        if deflate:
+            chunk = compressor.flush()
+            compressed += len(chunk)
+            yield chunk
+        descriptor = _zip_descriptor(doc, crc, compressed)
+        yield descriptor
+        central.append(_zip_central_header(doc, method, crc, compressed, offset))
+        offset += len(header) + compressed + len(descriptor)
+    directory = b"".join(central)
+    yield directory + _zip_end(len(central), offset, len(directory))
+
+
+def zip_length(docs: Iterable[Any]) -> int:
+    """Return the size of the stored (not deflated) ZIP archive of the
+    files ``docs``."""
+    count = offset = size = 0
+    for doc in docs:
+        size += len(_zip_central_header(doc, 0, 0, doc["length"], offset))
+        offset += len(_zip_local_header(doc, 0)) + doc["length"]
+        offset += len(_zip_descriptor(doc, 0, doc["length"]))
+        count += 1
+    return offset + size + len(_zip_end(count, offset, size))
+
+
+def _tar_header(doc: Any) -> bytes:
+    info = tarfile.TarInfo(str(doc["filename"]))
+    info.size = doc["length"]
+    info.mode = 0o644
+    upload_date = doc.get("uploadDate")
+    if upload_date is not None:
+        if upload_date.tzinfo is None:
+            upload_date = upload_date.replace(tzinfo=timezone.utc)
+        info.mtime = int(upload_date.timestamp())
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int, block: int) -> int:
+    return -size % block
+
+
+def tar_stream(members: Iterable[Member]) -> Iterator[bytes]:
+    """Write a TAR archive of ``members``."""
+    offset = 0
+    for doc, data in members:
+        header = _tar_header(doc)
+        yield header
+        yield from data
+        padding = _tar_padding(doc["length"], _TAR_BLOCK)
+        yield b"\0" * padding
+        offset += len(header) + doc["length"] + padding
+    end = 2 * _TAR_BLOCK
+    yield b"\0" * (end + _tar_padding(offset + end, _TAR_RECORD))
+
+
+def tar_length(docs: Iterable[Any]) -> int:
+    """Return the size of the TAR archive of the files ``docs``."""
+    offset = 0
+    for doc in docs:
+        size: int = doc["length"]
+        offset += len(_tar_header(doc)) + size + _tar_padding(size, _TAR_BLOCK)
+    offset += 2 * _TAR_BLOCK
+    return offset + _tar_padding(offset, _TAR_RECORD)
+
+
+def _prefetch(iterator: Iterator[Any], size: int) -> Generator[Any, None, None]:
+    """Consume ``iterator`` in a thread, up to ``size`` items ahead, and
+    close it, as a cursor, once it is exhausted or no longer read."""
+    items: queue.Queue[tuple[str, Any]] = queue.Queue(size)
+    stop = threading.Event()
+
+    def put(item: tuple[str, Any]) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def run() -> None:
+        try:
+            for item in iterator:
+                if not put(("item", item)):
+                    return
+        except BaseException as exc:
+            put(("error", exc))
+        else:
+            put(("done", None))
+        finally:
+            # Otherwise a cursor left early stays open on the server.
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=run, name="flask_pymongo.send_archive", daemon=True).start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def gridfs_members(chunks: Collection[Any], docs: list[Any], prefetch: int = 4) -> Iterator[Member]:
+    """Pair each of the files ``docs``, which must be sorted by ``_id``,
+    with an iterator of its data, read from ``chunks``.
+
+    The chunks of all the files are read with a single cursor, up to
+    ``prefetch`` chunks ahead, so reading moves from one file to the next
+    without a round trip.
+    """
+    cursor = (
+        chunks.find({"files_id": {"$in": [doc["_id"] for doc in docs]}})
+        .sort([("files_id", 1), ("n", 1)])
+        .batch_size(prefetch)
+    )
+    groups = groupby(_prefetch(cursor, prefetch), key=itemgetter("files_id"))
+    group = next(groups, None)
+    for doc in docs:
+        if group is not None and group[0] == doc["_id"]:
+            yield doc, _file_data(doc, group[1])
+            group = next(groups, None)
+        else:
+            yield doc, _file_data(doc, iter(()))
+
+
+def _file_data(doc: Any, chunks: Iterator[Any]) -> Iterator[bytes]:
+    received = 0
+    for n, chunk in enumerate(chunks):
+        if chunk["n"] != n:
+            raise CorruptGridFile(f"missing chunk {n} of file {doc['_id']!r}")
+        received += len(chunk["data"])
+        yield bytes(chunk["data"])
+    if received != doc["length"]:
+        raise CorruptGridFile(f"file {doc['_id']!r} is truncated")
@@ -0,0 +1,266 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("Subscription",)
+
+import logging
+import os
+import queue
+import threading
+from collections.abc import Iterator
+from typing import Any, Callable
+
+from bson import json_util
+from pymongo.collection import Collection
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to reopen a change stream that failed.
+_RETRY_INTERVAL = 1.0
+
+
+class Subscription:
+    """Receives the changes of a change stream shared with other
+    subscriptions, created by :meth:`~flask_pymongo.PyMongo.subscribe`.
+
+    Changes are buffered, up to ``max_queue``, until read with
+    :meth:`get` or by iterating. When the buffer is full, further changes
+    are dropped, and counted in :attr:`dropped`, or, if ``on_overflow`` is
+    ``"disconnect"``, the subscription is closed. Subscriptions are also
+    closed when their change stream fails and cannot be resumed, since
+    changes may have been missed.
+
+    .. code-block:: python
+
+        with mongo.subscribe("orders", [{"$match": {"operationType": "insert"}}]) as orders:
+            for change in orders:
+                print(change["fullDocument"])
+    """
+
+    def __init__(
+        self,
+        stream: _SharedStream,
+        filter: Callable[[Any], bool] | None = None,
+        max_queue: int = 100,
+        on_overflow: str = "drop",
+    ) -> None:
+        if on_overflow not in ("drop", "disconnect"):
+            raise ValueError("'on_overflow' must be 'drop' or 'disconnect'")
+        self.filter = filter
+        self.on_overflow = on_overflow
+        #: The number of changes dropped because the buffer was full.
+        self.dropped = 0
+        #: Whether the subscription was closed, by :meth:`close` or for
+        #: falling behind.
+        self.closed = False
+        self._stream = stream
+        self._queue: queue.Queue[Any] = queue.Queue(max_queue)
+
+    def _offer(self, change: Any) -> None:
+        if self.filter is not None and not self.filter(change):
+            return
+        try:
+            self._queue.put_nowait(change)
+        except queue.Full:
+            if self.on_overflow == "disconnect":
+                self.close()
+            else:
+                self.dropped += 1
+
+    def get(self, timeout: float | None = None) -> Any:
+        """Return the next change, or ``None`` if there is none within
+        ``timeout`` seconds, or the subscription is closed."""
+        if self.closed:
+            return None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self) -> Iterator[Any]:
+        while not self.closed:
+            change = self.get(timeout=1.0)
+            if change is not None:
+                yield change
+
+    def close(self) -> None:
+        """Stop receiving changes; the shared change stream is closed with
+        its last subscription."""
+        if not self.closed:
+            self.closed = True
+            self._stream.unsubscribe(self)
+            # Wake up a get() waiting without a timeout.
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def __enter__(self) -> Subscription:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class _SharedStream:
+    """One change stream, read by a thread, and fanned out to its
+    subscriptions."""
+
+    def __init__(
+        self, hub: ChangeHub, key: Any, collection: Collection[Any], pipeline: Any, **kwargs: Any
+    ) -> None:
+        self.hub = hub
+        self.key = key
+        self.collection = collection
+        self.pipeline = pipeline
+        self.kwargs = kwargs
+        self.subscriptions: list[Subscription] = []
+        self.stopped = threading.Event()
+        self.ready = threading.Event()
+        # Why the change stream could not be opened, raised by subscribe().
+        self.error: PyMongoError | None = None
+        self.thread = threading.Thread(
+            target=self.run, name=f"flask_pymongo.changes {collection.full_name}", daemon=True
+        )
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.hub.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+            if not self.subscriptions:
+                self.stopped.set()
+                if self.hub.streams.get(self.key) is self:
+                    del self.hub.streams[self.key]
+
+    def run(self) -> None:
+        resume_after = None
+        while not self.stopped.is_set():
+            try:
+                with self.collection.watch(
+                    self.pipeline, resume_after=resume_after, max_await_time_ms=1000, **self.kwargs
+                ) as stream:
+                    self.ready.set()
+                    while stream.alive and not self.stopped.is_set():
+                        change = stream.try_next()
+                        resume_after = stream.resume_token
+                        if change is not None:
+                            self.publish(change)
+            except PyMongoError as exc:
+                if not self.ready.is_set():
+                    self.fail(exc)
+                    return
+                if not isinstance(exc, ConnectionFailure):
+                    # PyMongo already retried resumable errors, so the resume
+                    # token is too old, or the stream was invalidated.
+                    logger.exception(
+                        "Change stream on %s cannot be resumed; closing its subscriptions",
+                        self.collection.full_name,
+                    )
+                    self.close_subscriptions()
+                    return
+                logger.warning(
+                    "Change stream on %s failed, resuming: %s", self.collection.full_name, exc
+                )
+                self.stopped.wait(_RETRY_INTERVAL)
+
+    def fail(self, exc: PyMongoError) -> None:
+        """Give up on a change stream which could not be opened, for
+        subscribe() to raise ``exc`` to its subscribers."""
+        self.error = exc
+        with self.hub.lock:
+            self.stopped.set()
+            if self.hub.streams.get(self.key) is self:
+                del self.hub.streams[self.key]
+        self.ready.set()
+
+    def close_subscriptions(self) -> None:
+        with self.hub.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.close()
+
+    def publish(self, change: Any) -> None:
+        with self.hub.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            # A failing filter closes only its own subscription.
+            try:
+                subscription._offer(change)
+            except Exception:
+                logger.exception("Change stream subscriber failed")
+                subscription.close()
+
+
+class ChangeHub:
+    """The change streams shared by the subscriptions of a process."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.streams: dict[Any, _SharedStream] = {}
+        self._pid = os.getpid()
+
+    def subscribe(
+        self,
+        collection: Collection[Any],
+        pipeline: Any = None,
+        filter: Callable[[Any], bool] | None = None,
+        max_queue: int = 100,
+        on_overflow: str = "drop",
+        ready_timeout: float = 5.0,
+        **kwargs: Any,
+    ) -> Subscription:
+        key = (
+            collection.full_name,
+            json_util.dumps(pipeline or []),
+            json_util.dumps(kwargs, sort_keys=True),
+        )
+        with self.lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's threads are not ours.
+                self.streams = {}
+                self._pid = os.getpid()
+            stream = self.streams.get(key)
+            created = stream is None
+            if stream is None:
+                stream = self.streams[key] = _SharedStream(
+                    self, key, collection, pipeline or [], **kwargs
+                )
+            subscription = Subscription(stream, filter, max_queue, on_overflow)
+            stream.subscriptions.append(subscription)
+        if created:
+            stream.thread.start()
+        # Changes made once subscribe() returns are not missed.
+        if not stream.ready.wait(ready_timeout):
+            subscription.close()
+            raise TimeoutError(
+                f"The change stream on {collection.full_name} did not open "
+                f"within {ready_timeout} seconds"
+            )
+        if stream.error is not None:
+            subscription.close()
+            raise stream.error
+        return subscription
@@ -0,0 +1,127 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from flask_pymongo.profiler import read_system_profile
+
+mongo_cli = AppGroup("mongo", help="Manage the MongoDB databases used by Flask-PyMongo.")
+
+
+@mongo_cli.command("ensure-indexes")
+@click.option("--dry-run", is_flag=True, help="Only report, do not create missing indexes.")
+def ensure_indexes_command(dry_run: bool) -> None:
+    """Create missing declared indexes, and report drift."""
+    drift = False
+    for mongo in current_app.extensions["pymongo"]:
+        report = mongo.check_indexes() if dry_run else mongo.ensure_indexes()
+        for status in report:
+            click.echo(f"{status.status:>10}  {status.namespace}  {status.name}")
+            drift = drift or status.status in ("missing", "changed")
+    if drift:
+        raise click.exceptions.Exit(1)
+
+
+@mongo_cli.command("profile")
+@click.option("--top", default=20, show_default=True, help="Number of query shapes to show.")
+@click.option("--explain", is_flag=True, help="Explain each shape to flag scans and sorts.")
+def profile_command(top: int, explain: bool) -> None:
+    """Report the slowest query shapes recorded by the server's profiler.
+
+    Enable the profiler on the database first, for instance with
+    db.setProfilingLevel(1, 50) in the MongoDB shell.
+    """
+    for mongo in current_app.extensions["pymongo"]:
+        if mongo.db is None:
+            continue
+        for stats in read_system_profile(mongo.db, top):
+            if explain:
+                stats.explain(mongo.cx)
+            click.echo(
+                f"{stats.total_ms:>10.1f} ms {stats.count:>8}x {stats.mean_ms:>8.1f} ms avg  "
+                f"{stats.namespace} {stats.command_name} {stats.shape}  "
+                f"{' '.join(sorted(stats.flags))}"
+            )
+
+
+@mongo_cli.command("cleanup-uploads")
+@click.option("--base", multiple=True, default=["fs"], show_default=True, help="GridFS base name.")
+def cleanup_uploads_command(base: tuple[str, ...]) -> None:
+    """Remove abandoned resumable uploads, and their chunks."""
+    from flask_pymongo.uploads import ResumableUploads
+
+    for mongo in current_app.extensions["pymongo"]:
+        if mongo.db is None:
+            continue
+        for name in base:
+            removed = ResumableUploads(mongo.db, name).cleanup()
+            click.echo(f"{removed:>10}  {mongo.db.name}.{name}.uploads")
+
+
+@mongo_cli.command("prune-gridfs")
+@click.option("--base", multiple=True, default=["fs"], show_default=True, help="GridFS base name.")
+@click.option("--keep", default=1, show_default=True, help="Revisions to keep per filename.")
+@click.option(
+    "--min-age",
+    default=3600,
+    show_default=True,
+    help="Seconds before a fileless chunk is orphaned.",
+)
+@click.option("--batch-size", default=100, show_default=True, help="Files per batch.")
+@click.option("--pause", default=0.1, show_default=True, help="Seconds to sleep between batches.")
+@click.option("--dry-run", is_flag=True, help="Only report, do not delete.")
+def prune_gridfs_command(
+    base: tuple[str, ...], keep: int, min_age: int, batch_size: int, pause: float, dry_run: bool
+) -> None:
+    """Delete old GridFS file revisions and orphaned chunks."""
+    for mongo in current_app.extensions["pymongo"]:
+        if mongo.db is None:
+            continue
+        for name in base:
+            result = mongo.prune_gridfs(name, keep, min_age, batch_size, pause, dry_run)
+            click.echo(
+                f"{result.revisions:>10} revisions  {result.orphaned_chunks:>10} chunks  "
+                f"{mongo.db.name}.{name}"
+            )
+
+
+@mongo_cli.command("refresh-materialized")
+@click.argument("names", nargs=-1)
+def refresh_materialized_command(names: tuple[str, ...]) -> None:
+    """Refresh the materialized views NAMES, or all of them."""
+    for mongo in current_app.extensions["pymongo"]:
+        for name, view in mongo.materialized_views.items():
+            if names and name not in names:
+                continue
+            started = time.monotonic()
+            if view.refresh():
+                click.echo(f"{time.monotonic() - started:>10.1f} s  {name}")
+            else:
+                click.echo(f"{'refreshing':>12}  {name}")
@@ -0,0 +1,118 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ()
+
+from collections.abc import Iterator
+from typing import Any
+
+from pymongo.collection import Collection
+
+# pyarrow and pymongoarrow are optional, and slow to import, so they are
+# imported on first use.
+
+
+def make_schema(schema: Any) -> Any:
+    """Return ``schema`` as a :class:`pymongoarrow.api.Schema`, raising
+    :class:`ImportError` if PyMongoArrow is not installed."""
+    try:
+        from pymongoarrow.api import Schema
+    except ImportError as exc:
+        raise ImportError(
+            "Columnar results require PyMongoArrow: pip install 'Flask-PyMongo[arrow]'"
+        ) from exc
+    return schema if isinstance(schema, Schema) else Schema(schema)
+
+
+def find_record_batches(
+    collection: Collection[Any], filter: Any, schema: Any, **kwargs: Any
+) -> Iterator[Any]:
+    """Decode each raw batch of a ``find`` on ``collection`` into a
+    :class:`pyarrow.RecordBatch` with ``schema``."""
+    from pymongoarrow.context import PyMongoArrowContext
+
+    schema = make_schema(schema)
+    kwargs.setdefault("projection", {"_id": False, **dict.fromkeys(schema, True)})
+    for raw in collection.find_raw_batches(filter, **kwargs):
+        context = PyMongoArrowContext(schema, codec_options=collection.codec_options)
+        context.process_bson_stream(raw)
+        yield from context.finish().to_batches()
+
+
+def find_table(collection: Collection[Any], filter: Any, schema: Any, **kwargs: Any) -> Any:
+    import pyarrow
+
+    schema = make_schema(schema)
+    batches = find_record_batches(collection, filter, schema, **kwargs)
+    return pyarrow.Table.from_batches(batches, schema=schema.to_arrow())
+
+
+class _Sink:
+    """A file-like object collecting what pyarrow writes to it, so it can
+    be yielded to the WSGI server."""
+
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_ipc(batches: Iterator[Any], schema: Any) -> Iterator[bytes]:
+    """Write ``batches`` in the Arrow IPC streaming format."""
+    import pyarrow.ipc
+
+    sink = _Sink()
+    with pyarrow.ipc.new_stream(sink, make_schema(schema).to_arrow()) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+
+def stream_csv(batches: Iterator[Any], schema: Any) -> Iterator[bytes]:
+    """Write ``batches`` as CSV, with a header row."""
+    import pyarrow.csv
+
+    sink = _Sink()
+    with pyarrow.csv.CSVWriter(sink, make_schema(schema).to_arrow()) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
@@ -24,15 +24,17 @@
 # POSSIBILITY OF SUCH DAMAGE.
 from __future__ import annotations
 
-__all__ = ("BSONObjectIdConverter", "BSONProvider")
+__all__ = ("BSONObjectIdConverter", "BSONProvider", "requested_projection")
 
+import json
+from collections.abc import Iterable
 from typing import Any
 
 from bson import json_util
 from bson.errors import InvalidId
-from bson.json_util import RELAXED_JSON_OPTIONS
+from bson.json_util import RELAXED_JSON_OPTIONS, JSONOptions
 from bson.objectid import ObjectId
-from flask import abort
+from flask import abort, request
 from flask.json.provider import JSONProvider
 from werkzeug.routing import BaseConverter
 
@@ -45,6 +47,61 @@ def _iteritems(obj: Any) -> Any:
     raise TypeError(f"{obj!r} missing iteritems() and items()")
 
 
+def requested_projection(
+    allowed: Iterable[str],
+    arg: str = "fields",
+    default: Iterable[str] | None = None,
+    required: Iterable[str] = (),
+) -> dict[str, bool] | None:
+    """Return a projection of the fields listed in the ``arg`` argument of
+    the current request, such as ``?fields=name,address.city``, to pass to
+    the queries of a view, so that the server sends only those fields.
+
+    .. code-block:: python
+
+        @app.route("/user/<username>")
+        def user_profile(username):
+            projection = requested_projection(["name", "email", "address"])
+            return mongo.db.users.send_document({"_id": username}, projection)
+
+    Each field must be in ``allowed``, or be a sub-field of one which is;
+    others, and paths with empty segments or segments starting with ``$``,
+    cause a 400 Bad Request HTTP status on the request. As with any
+    projection, ``_id`` is included unless excluded.
+
+    :param allowed: the fields the client may request
+    :param str arg: the name of the request argument
+    :param default: the fields to return if the argument is missing or
+       empty, or ``None`` to return ``None``, for whole documents
+    :param required: fields the view needs, such as the sort keys of
+       :meth:`~flask_pymongo.wrappers.Collection.paginate`, added to those
+       requested
+    """
+    fields = [field.strip() for field in request.args.get(arg, "").split(",")]
+    fields = [field for field in fields if field]
+    if not fields:
+        if default is None:
+            return None
+        fields = list(default)
+    else:
+        permitted = set(allowed)
+        for field in fields:
+            parts = field.split(".")
+            # Empty and $-prefixed path segments are not field names.
+            if any(not part or part.startswith("$") for part in parts):
+                abort(400, description=f"Cannot select field {field!r}.")
+            if not any(".".join(parts[:i]) in permitted for i in range(1, len(parts) + 1)):
+                abort(400, description=f"Cannot select field {field!r}.")
+
+    # MongoDB rejects projecting both a field and one of its sub-fields,
+    # which sorting puts after it.
+    projection: dict[str, bool] = {}
+    for field in sorted({*fields, *required}):
+        if not any(field.startswith(f"{other}.") for other in projection):
+            projection[field] = True
+    return projection
+
+
 class BSONObjectIdConverter(BaseConverter):
     """A simple converter for the RESTful URL routing system of Flask.
 
@@ -97,19 +154,36 @@ class BSONProvider(JSONProvider):
 
     A :class:`~flask_pymongo.helpers.JSONProvider` is automatically
     automatically installed on the :class:`~flask_pymongo.PyMongo`
-    instance at creation time, using
-    :const:`~bson.json_util.RELAXED_JSON_OPTIONS`.
+    instance at creation time, using the ``json_options`` passed to
+    :class:`~flask_pymongo.PyMongo`, or
+    :const:`~bson.json_util.RELAXED_JSON_OPTIONS` by default.
     """
 
-    def __init__(self, app: Any) -> None:
-        self._default_kwargs = {"json_options": RELAXED_JSON_OPTIONS}
+    def __init__(self, app: Any, json_options: JSONOptions | None = None) -> None:
+        self.json_options = json_options or RELAXED_JSON_OPTIONS
+        self._default_kwargs = {"json_options": self.json_options}
 
         super().__init__(app)
 
     def dumps(self, obj: Any, **kwargs: Any) -> str:
         """Serialize MongoDB object types using :mod:`bson.json_util`."""
-        return json_util.dumps(obj)
+        return json_util.dumps(obj, json_options=self.json_options)
 
     def loads(self, s: str | bytes, **kwargs: Any) -> Any:
-        """Deserialize MongoDB object types using :mod:`bson.json_util`."""
-        return json_util.loads(s)
+        """Deserialize MongoDB object types using :mod:`bson.json_util`.
+
+        Extended JSON types are always written with ``$``-prefixed keys, so
+        documents without a ``$`` character cannot contain any, and are
+        parsed by :func:`json.loads` directly, skipping the per-object hook
+        that :mod:`bson.json_util` runs to find them.
+        """
+        if self.json_options.document_class is dict and not _may_be_extended_json(s):
+            return json.loads(s)
+        return json_util.loads(s, json_options=self.json_options)
+
+
+def _may_be_extended_json(s: str | bytes) -> bool:
+    # "\u0024" is "$" escaped, which json.loads would also decode to "$".
+    if isinstance(s, str):
+        return "$" in s or "\\u0024" in s
+    return b"$" in s or b"\\u0024" in s
@@ -0,0 +1,138 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("IndexStatus",)
+
+from typing import Any, NamedTuple
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+
+# Index options that do not change which queries an index can serve, that
+# the server may not report back, or that it adds on its own.
+_IGNORED_OPTIONS = frozenset(
+    ("v", "ns", "key", "name", "background", "textIndexVersion", "2dsphereIndexVersion")
+)
+
+# The options the server reports for a text index declared without them.
+_TEXT_DEFAULTS = {"default_language": "english", "language_override": "language"}
+
+GRIDFS_INDEXES = {
+    "files": [IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)])],
+    "chunks": [IndexModel([("files_id", ASCENDING), ("n", ASCENDING)], unique=True)],
+}
+
+
+class IndexStatus(NamedTuple):
+    """The state of one index, as reported by
+    :meth:`~flask_pymongo.PyMongo.check_indexes` and
+    :meth:`~flask_pymongo.PyMongo.ensure_indexes`.
+
+    ``status`` is one of:
+
+    - ``"ok"``: the declared index exists
+    - ``"missing"``: the declared index does not exist
+    - ``"created"``: the declared index was missing, and has been created
+    - ``"changed"``: an index exists on the declared keys, with different
+      options; it must be dropped by hand to be recreated
+    - ``"undeclared"``: the index exists, but was not declared
+    """
+
+    namespace: str
+    name: str
+    status: str
+
+
+def _options(spec: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in spec.items() if key not in _IGNORED_OPTIONS}
+
+
+def _declared(model: IndexModel) -> tuple[tuple[tuple[str, Any], ...], dict[str, Any]]:
+    """Return the key and options of ``model`` as the server reports them
+    once the index is built."""
+    document = model.document
+    key = list(document["key"].items())
+    options = _options(document)
+    text = [field for field, kind in key if kind == "text"]
+    if text:
+        # The text fields are stored as the weights of a single _fts key.
+        weights = dict.fromkeys(text, 1)
+        weights.update(options.get("weights", {}))
+        options = {**_TEXT_DEFAULTS, **options, "weights": weights}
+        first = next(i for i, (_, kind) in enumerate(key) if kind == "text")
+        key = [(field, kind) for field, kind in key if kind != "text"]
+        key[first:first] = [("_fts", "text"), ("_ftsx", 1)]
+    return tuple(key), options
+
+
+def _same_options(found: dict[str, Any], declared: dict[str, Any]) -> bool:
+    found = _options(found)
+    if "collation" in declared and "collation" in found:
+        # The server fills in the collation options left to their defaults.
+        found["collation"] = {
+            option: found["collation"].get(option) for option in declared["collation"]
+        }
+    return found == declared
+
+
+def check_indexes(collection: Collection[Any], models: list[IndexModel]) -> list[IndexStatus]:
+    """Compare the indexes ``models`` declared on ``collection`` with its
+    existing indexes.
+    """
+    existing = {
+        tuple(spec["key"]): (name, spec) for name, spec in collection.index_information().items()
+    }
+    report = []
+    for model in models:
+        key, options = _declared(model)
+        found = existing.pop(key, None)
+        if found is None:
+            report.append(IndexStatus(collection.full_name, model.document["name"], "missing"))
+        elif not _same_options(found[1], options):
+            report.append(IndexStatus(collection.full_name, found[0], "changed"))
+        else:
+            report.append(IndexStatus(collection.full_name, found[0], "ok"))
+    for name, _ in existing.values():
+        if name != "_id_":
+            report.append(IndexStatus(collection.full_name, name, "undeclared"))
+    return report
+
+
+def ensure_indexes(collection: Collection[Any], models: list[IndexModel]) -> list[IndexStatus]:
+    """Create the missing indexes of ``models`` on ``collection``."""
+    report = check_indexes(collection, models)
+    missing = {status.name for status in report if status.status == "missing"}
+    if not missing:
+        return report
+    collection.create_indexes([model for model in models if model.document["name"] in missing])
+    # Report what the server now has, rather than assuming each index was
+    # built as declared.
+    return [
+        status._replace(status="created")
+        if status.name in missing and status.status == "ok"
+        else status
+        for status in check_indexes(collection, models)
+    ]
@@ -0,0 +1,204 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("ConcurrencyLimiter", "LimitExceeded")
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any
+
+from flask import has_request_context
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+# Set around background work which a request starts but does not wait on,
+# such as the refreshes of a StaleCache, so that it is not limited.
+_exempt: ContextVar[bool] = ContextVar("flask_pymongo.limiter.exempt", default=False)
+
+
+def _limits_context() -> bool:
+    """Whether operations run here are limited: only those serving a
+    request are, and not those of background threads."""
+    return has_request_context() and not _exempt.get()
+
+
+@contextmanager
+def _exempted() -> Iterator[None]:
+    token = _exempt.set(True)
+    try:
+        yield
+    finally:
+        _exempt.reset(token)
+
+
+class LimitExceeded(PyMongoError):
+    """Raised when an operation waits longer than ``max_wait`` seconds for
+    a :class:`ConcurrencyLimiter` slot."""
+
+
+class ConcurrencyLimiter:
+    """Limits the number of operations in flight, adapting the limit to
+    their latency.
+
+    While the limit is reached, it grows by one for each ``limit``
+    operations completing without delay, and it shrinks by ``backoff`` when an operation takes more
+    than ``tolerance`` times the shortest latency recently seen, or times
+    out, at most once per mean latency, in the manner of TCP congestion
+    control. An operation finding the limit reached waits up to
+    ``max_wait`` seconds for another to complete, then fails with
+    :class:`LimitExceeded`, so that excess requests are shed instead of
+    queueing on the connection pool.
+
+    A :class:`ConcurrencyLimiter` is created by
+    :meth:`~flask_pymongo.PyMongo.init_app` as
+    :attr:`~flask_pymongo.PyMongo.limiter` when the
+    ``MONGO_CONCURRENCY_LIMIT`` configuration variable is set, and applies
+    to the operations which views run on
+    :class:`~flask_pymongo.wrappers.Collection` instances while handling a
+    request: ``find_one``, ``aggregate``, the counts, and the writes.
+    Batches of cursors, GridFS, and operations of background threads (such
+    as those of :class:`~flask_pymongo.writer.BackgroundWriter` or
+    :class:`~flask_pymongo.materialized.MaterializedView`) are not limited.
+    Requests failing with :class:`LimitExceeded` are answered with a 503
+    Service Unavailable HTTP status.
+
+    .. code-block:: python
+
+        @app.route("/health/limiter")
+        def limiter_health():
+            return mongo.limiter.stats
+
+    :param int initial_limit: the limit to start from
+    :param int min_limit: the smallest the limit may shrink to
+    :param int max_limit: the largest the limit may grow to
+    :param float max_wait: the number of seconds an operation waits for a
+       slot before failing
+    :param float tolerance: how many times the shortest recent latency an
+       operation may take before the limit shrinks
+    :param float backoff: the factor the limit shrinks by
+    :param int window: the number of operations after which the shortest
+       latency seen is forgotten, so that the baseline follows the server
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        max_wait: float = 0.1,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        window: int = 1000,
+    ) -> None:
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("'min_limit', 'initial_limit' and 'max_limit' must be increasing")
+        if not 0 < backoff < 1:
+            raise ValueError("'backoff' must be between 0 and 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_wait = max_wait
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+
+        self._condition = threading.Condition()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._rejected = 0
+        self._baseline = float("inf")
+        self._window_min = float("inf")
+        self._samples = 0
+        self._mean = 0.0
+        self._last_backoff = 0.0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """The current ``limit``, the number of operations ``in_flight``, and
+        the number ``rejected`` with :class:`LimitExceeded`.
+        """
+        with self._condition:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
+
+    def acquire(self) -> None:
+        """Wait for a slot, or raise :class:`LimitExceeded`."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._in_flight < int(self._limit), self.max_wait
+            ):
+                self._rejected += 1
+                raise LimitExceeded(
+                    f"{self._in_flight} operations in flight, limit is {int(self._limit)}"
+                )
+            self._in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """Give back a slot, taken by an operation which ran for
+        ``latency`` seconds, and adapt the limit. ``overloaded`` operations,
+        such as those which timed out, shrink the limit regardless of
+        their latency."""
+        with self._condition:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+
+            self._samples += 1
+            self._window_min = min(self._window_min, latency)
+            if self._samples >= self.window:
+                self._baseline, self._window_min, self._samples = self._window_min, latency, 0
+            baseline = min(self._baseline, self._window_min)
+            self._mean = 0.9 * self._mean + 0.1 * latency if self._mean else latency
+
+            now = time.monotonic()
+            if overloaded or latency > self.tolerance * baseline:
+                # Back off once per round trip, not once per slow operation
+                # of the same congestion.
+                if now - self._last_backoff > self._mean:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_backoff = now
+            elif saturated:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._condition.notify(max(1, int(self._limit) - self._in_flight))
+
+    @contextmanager
+    def slot(self, context: Any = None) -> Iterator[Any]:
+        """Run the block in a slot, entering ``context`` (if given) inside
+        it, and release the slot with the block's latency."""
+        self.acquire()
+        start = time.monotonic()
+        overloaded = False
+        try:
+            with context if context is not None else nullcontext() as value:
+                yield value
+        except PyMongoError as exc:
+            overloaded = exc.timeout or isinstance(exc, ConnectionFailure)
+            raise
+        finally:
+            self.release(time.monotonic() - start, overloaded)
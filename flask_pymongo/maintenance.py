@@ -0,0 +1,153 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("PruneResult",)
+
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, NamedTuple
+
+from bson.objectid import ObjectId
+from pymongo import DESCENDING
+from pymongo.database import Database
+
+from flask_pymongo.shared_cache import _forget_gridfs_files
+
+
+class PruneResult(NamedTuple):
+    """What :meth:`~flask_pymongo.PyMongo.prune_gridfs` removed, or would
+    remove in a dry run: the number of old ``revisions``, and of
+    ``orphaned_chunks`` belonging to no file.
+    """
+
+    revisions: int
+    orphaned_chunks: int
+
+
+def _batches(iterable: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def prune_revisions(
+    database: Database[Any],
+    base: str = "fs",
+    keep: int = 1,
+    batch_size: int = 100,
+    pause: float = 0.1,
+    dry_run: bool = False,
+) -> int:
+    """Delete all but the latest ``keep`` revisions of each file in the
+    GridFS collections ``base``, and return how many were deleted.
+
+    Files are read in index order, newest revision first, and deleted
+    ``batch_size`` at a time, sleeping ``pause`` seconds between batches.
+    """
+    if keep < 1:
+        raise ValueError("'keep' must be at least 1")
+    files = database[f"{base}.files"]
+    chunks = database[f"{base}.chunks"]
+
+    def old_revisions() -> Iterator[Any]:
+        filename, seen = None, 0
+        cursor = files.find({}, {"filename": 1}).sort(
+            [("filename", DESCENDING), ("uploadDate", DESCENDING)]
+        )
+        for doc in cursor:
+            if doc.get("filename") != filename:
+                filename, seen = doc.get("filename"), 0
+            seen += 1
+            if seen > keep:
+                yield doc
+
+    deleted = 0
+    for batch in _batches(old_revisions(), batch_size):
+        if not dry_run:
+            ids = [doc["_id"] for doc in batch]
+            # Like GridFS.delete(): an interrupted run leaves orphaned
+            # chunks, which delete_orphaned_chunks() collects, rather than
+            # files missing their chunks.
+            files.delete_many({"_id": {"$in": ids}})
+            chunks.delete_many({"files_id": {"$in": ids}})
+            # A cached revision may be older than the latest, if it was
+            # cached while a newer one was being saved.
+            _forget_gridfs_files(database, base, {doc.get("filename") for doc in batch})
+            time.sleep(pause)
+        deleted += len(batch)
+    return deleted
+
+
+def delete_orphaned_chunks(
+    database: Database[Any],
+    base: str = "fs",
+    min_age: int = 3600,
+    batch_size: int = 100,
+    pause: float = 0.1,
+    dry_run: bool = False,
+) -> int:
+    """Delete the chunks in the GridFS collections ``base`` which belong
+    to no file, and return how many were deleted.
+
+    Chunks are written before their file's document, and the chunks of a
+    :class:`~flask_pymongo.uploads.ResumableUploads` upload have no file
+    until it is finalized, so chunks written less than ``min_age`` seconds
+    ago, or belonging to a pending upload, are kept.
+    """
+    files = database[f"{base}.files"]
+    chunks = database[f"{base}.chunks"]
+    uploads = database[f"{base}.uploads"]
+    cutoff = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=min_age))
+
+    # $sort then $group with $first lets the server walk the distinct
+    # files_id values of the {files_id: 1, n: 1} index.
+    files_ids = (
+        doc["_id"]
+        for doc in chunks.aggregate(
+            [
+                {"$sort": {"files_id": 1, "n": 1}},
+                {"$group": {"_id": "$files_id", "n": {"$first": "$n"}}},
+            ],
+            allowDiskUse=True,
+        )
+    )
+    deleted = 0
+    for batch in _batches(files_ids, batch_size):
+        query = {"_id": {"$in": batch}}
+        known = {doc["_id"] for doc in files.find(query, {"_id": 1})}
+        known.update(doc["_id"] for doc in uploads.find(query, {"_id": 1}))
+        orphans = [files_id for files_id in batch if files_id not in known]
+        if not orphans:
+            continue
+        orphaned = {"files_id": {"$in": orphans}, "_id": {"$lt": cutoff}}
+        if dry_run:
+            deleted += chunks.count_documents(orphaned)
+        else:
+            deleted += chunks.delete_many(orphaned).deleted_count
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,246 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("MaterializedStatus", "MaterializedView")
+
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple
+
+from bson import ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# The collection recording when each view was last refreshed.
+METADATA_COLLECTION = "materialized_views"
+
+
+class MaterializedStatus(NamedTuple):
+    """Returned by :meth:`MaterializedView.status`: when the view was last
+    ``refreshed_at``, its ``age`` and the ``duration`` of that refresh in
+    seconds, and whether it is ``stale``. All but ``stale`` are ``None``
+    if the view has never been refreshed.
+    """
+
+    refreshed_at: datetime | None
+    age: float | None
+    duration: float | None
+    stale: bool
+
+
+class MaterializedView:
+    """An aggregation whose results are written to a collection with
+    ``$merge``, so that requests read them instead of running the
+    pipeline; see :meth:`~flask_pymongo.PyMongo.materialize`.
+
+    A full refresh stamps each result with a ``_refresh`` field, and then
+    deletes the documents left by previous refreshes, so that readers see
+    the old results until the new ones replace them. An ``incremental``
+    view merges its results into the existing documents, and deletes
+    nothing, for pipelines computing only what changed.
+
+    Each refresh takes a lease in the ``materialized_views`` collection,
+    so that a view refreshed on a schedule by every process of a
+    deployment runs once per interval, and records when it ended there.
+    A refresh outliving its lease may be taken over by another process; it
+    then leaves the older results to that refresh, and records nothing.
+
+    :param source: the :class:`~pymongo.collection.Collection` to aggregate
+    :param list pipeline: the aggregation pipeline, without ``$merge``
+    :param str name: the name of the view, and of the collection its
+       results are written to, in the database of ``source``
+    :param float every: the number of seconds between scheduled refreshes,
+       or ``None`` to refresh only on demand
+    :param on: the field, or list of fields, identifying a result; other
+       than ``_id``, they require a unique index on the view
+    :param bool incremental: whether to merge results into the existing
+       documents instead of replacing them all
+    :param float max_age: the number of seconds after which the view is
+       stale; defaults to twice ``every``
+    :param float lease: the number of seconds after which a refresh that
+       has not finished, as in a process that died, is abandoned
+    """
+
+    def __init__(
+        self,
+        source: Collection[Any],
+        pipeline: list[dict[str, Any]],
+        name: str,
+        every: float | None = None,
+        on: str | list[str] = "_id",
+        incremental: bool = False,
+        max_age: float | None = None,
+        lease: float = 300.0,
+    ) -> None:
+        self.source = source
+        self.pipeline = list(pipeline)
+        self.name = name
+        self.every = every
+        self.on = on
+        self.incremental = incremental
+        self.max_age = max_age if max_age is not None or every is None else 2 * every
+        self.lease = lease
+        self._metadata = source.database[METADATA_COLLECTION]
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    @property
+    def collection(self) -> Collection[Any]:
+        """The collection holding the results, a
+        :class:`~flask_pymongo.wrappers.Collection` when ``source`` is one.
+        Reading it starts the scheduled refreshes of this process.
+        """
+        self.start()
+        return self.source.database[self.name]
+
+    def status(self) -> MaterializedStatus:
+        """Return when the view was last refreshed, and whether it is stale."""
+        self.start()
+        meta = self._metadata.find_one(
+            {"_id": self.name}, projection={"refreshedAt": True, "duration": True}
+        )
+        if meta is None or meta.get("refreshedAt") is None:
+            return MaterializedStatus(None, None, None, True)
+        refreshed_at = meta["refreshedAt"]
+        if refreshed_at.tzinfo is None:
+            refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+        age = max((datetime.now(timezone.utc) - refreshed_at).total_seconds(), 0.0)
+        stale = self.max_age is not None and age > self.max_age
+        return MaterializedStatus(refreshed_at, age, meta.get("duration"), stale)
+
+    def refresh(self) -> bool:
+        """Run the pipeline and write its results to the view.
+
+        Return ``False``, without running it, if another process is
+        refreshing the view, or without completing it, if another process
+        took the refresh over once its lease expired.
+        """
+        # Identifies this refresh, as the owner of the lease, and as the
+        # writer of its results.
+        stamp = ObjectId()
+        if not self._acquire(stamp):
+            return False
+        started = time.monotonic()
+        try:
+            if self.incremental:
+                stages = [{"$merge": self._merge("merge")}]
+            else:
+                stages = [{"$set": {"_refresh": stamp}}, {"$merge": self._merge("replace")}]
+            self.source.aggregate([*self.pipeline, *stages])
+            if not self._renew(stamp):
+                logger.warning("Refresh of materialized view %s outlived its lease", self.name)
+                return False
+            if not self.incremental:
+                # Only older results, should a newer refresh take over.
+                self.source.database[self.name].delete_many({"_refresh": {"$not": {"$gte": stamp}}})
+        except BaseException:
+            self._release(stamp, {})
+            raise
+        self._release(
+            stamp,
+            {"refreshedAt": datetime.now(timezone.utc), "duration": time.monotonic() - started},
+        )
+        return True
+
+    def start(self) -> None:
+        """Start refreshing the view every ``every`` seconds from a daemon
+        thread of this process, if it is not already."""
+        pid = os.getpid()
+        if self.every is None or self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"flask_pymongo.MaterializedView({self.name})", daemon=True
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def _merge(self, when_matched: str) -> dict[str, Any]:
+        return {
+            "into": {"db": self.source.database.name, "coll": self.name},
+            "on": self.on,
+            "whenMatched": when_matched,
+            "whenNotMatched": "insert",
+        }
+
+    def _acquire(self, owner: ObjectId) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            # A lease held by another process does not match, so the upsert
+            # collides with its document instead.
+            self._metadata.update_one(
+                {"_id": self.name, "leaseUntil": {"$not": {"$gt": now}}},
+                {
+                    "$set": {
+                        "leaseUntil": now + timedelta(seconds=self.lease),
+                        "leaseOwner": owner,
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def _renew(self, owner: ObjectId) -> bool:
+        """Extend the lease, if ``owner`` still holds it."""
+        until = datetime.now(timezone.utc) + timedelta(seconds=self.lease)
+        result = self._metadata.update_one(
+            {"_id": self.name, "leaseOwner": owner}, {"$set": {"leaseUntil": until}}
+        )
+        return result.matched_count == 1
+
+    def _release(self, owner: ObjectId, fields: dict[str, Any]) -> None:
+        """Give up the lease, and set ``fields``, if ``owner`` still holds
+        it."""
+        update: dict[str, Any] = {"$unset": {"leaseUntil": "", "leaseOwner": ""}}
+        if fields:
+            update["$set"] = fields
+        self._metadata.update_one({"_id": self.name, "leaseOwner": owner}, update)
+
+    def _run(self) -> None:
+        assert self.every is not None
+        while True:
+            try:
+                age = self.status().age
+                if age is None or age >= self.every:
+                    self.refresh()
+                    age = 0.0
+                wait = self.every - age
+            except Exception as exc:
+                logger.warning("Could not refresh materialized view %s: %s", self.name, exc)
+                wait = self.every
+            # Spread the processes polling the same view.
+            time.sleep(wait + random.uniform(0, self.every / 10))
@@ -0,0 +1,341 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("QueryProfiler", "ShapeStats", "query_shape", "read_system_profile")
+
+import json
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any
+
+from pymongo import monitoring
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+from pymongo.mongo_client import MongoClient
+
+logger = logging.getLogger(__name__)
+
+# The field holding the query of each profiled command.
+_QUERY_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "update": "updates",
+    "delete": "deletes",
+    "aggregate": "pipeline",
+}
+
+# Command fields that explain does not accept.
+_NOT_EXPLAINABLE = frozenset(("lsid", "txnNumber", "autocommit", "readConcern", "writeConcern"))
+
+_LOGICAL_OPERATORS = frozenset(("$and", "$or", "$nor"))
+
+
+def _normalize(value: Any) -> Any:
+    """Replace the values in a query with ``"?"``, keeping its operators."""
+    if isinstance(value, Mapping):
+        return {key: _normalize(value[key]) for key in sorted(value)}
+    return "?"
+
+
+def _normalize_query(query: Any) -> Any:
+    if not isinstance(query, Mapping):
+        return "?"
+    shape = {}
+    for key in sorted(query):
+        if key in _LOGICAL_OPERATORS and isinstance(query[key], list):
+            # Clauses differing only in values are one clause in the shape.
+            clauses = {json.dumps(_normalize_query(clause)) for clause in query[key]}
+            shape[key] = [json.loads(clause) for clause in sorted(clauses)]
+        else:
+            shape[key] = _normalize(query[key])
+    return shape
+
+
+def _normalize_stage(stage: Mapping[str, Any]) -> dict[str, Any]:
+    shape = {}
+    for name, body in stage.items():
+        if name == "$match":
+            shape[name] = _normalize_query(body)
+        elif name == "$sort":
+            shape[name] = body
+        else:
+            shape[name] = "?"
+    return shape
+
+
+def query_shape(command_name: str, command: Mapping[str, Any]) -> str:
+    """Return the shape of a command: its query with values removed, and
+    its sort and projection keys, as a string.
+
+    Commands that differ only in the values they query for have the same
+    shape, and are likely served by the same query plan.
+
+    .. code-block:: pycon
+
+        >>> query_shape("find", {"find": "users", "filter": {"age": {"$gt": 21}}})
+        '{"filter": {"age": {"$gt": "?"}}}'
+    """
+    shape: dict[str, Any] = {}
+    query = command.get(_QUERY_FIELDS.get(command_name, "filter"))
+    if command_name == "aggregate" and isinstance(query, list):
+        shape["pipeline"] = [_normalize_stage(stage) for stage in query]
+    elif command_name in ("update", "delete") and isinstance(query, list) and query:
+        shape["filter"] = _normalize_query(query[0].get("q"))
+    else:
+        shape["filter"] = _normalize_query(query or {})
+    if command.get("sort"):
+        shape["sort"] = list(command["sort"].items())
+    if command.get("projection") or command.get("fields"):
+        shape["projection"] = sorted(command.get("projection") or command["fields"])
+    return json.dumps(shape, default=str)
+
+
+class ShapeStats:
+    """Statistics for the commands sharing one :func:`query_shape`.
+
+    ``flags`` holds ``"COLLSCAN"`` if the query plan scans the whole
+    collection, and ``"SORT"`` if it sorts in memory rather than using an
+    index, once known.
+    """
+
+    def __init__(self, namespace: str, command_name: str, shape: str) -> None:
+        self.namespace = namespace
+        self.command_name = command_name
+        self.shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.flags: set[str] = set()
+        self.sample: dict[str, Any] | None = None
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+    def record(self, duration_ms: float) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def explain(self, client: MongoClient[Any]) -> None:
+        """Run ``explain`` on a sample of the command, and update
+        :attr:`flags` from its query plan."""
+        if self.sample is None:
+            return
+        database, _ = self.namespace.split(".", 1)
+        plan = client[database].command("explain", self.sample, verbosity="queryPlanner")
+        self.flags |= _plan_flags(plan)
+
+    def __repr__(self) -> str:
+        return (
+            f"ShapeStats({self.namespace!r}, {self.command_name!r}, {self.shape!r}, "
+            f"count={self.count}, total_ms={self.total_ms:.1f})"
+        )
+
+
+def _plan_flags(plan: Any) -> set[str]:
+    flags = set()
+    if isinstance(plan, Mapping):
+        if plan.get("stage") == "COLLSCAN":
+            flags.add("COLLSCAN")
+        elif plan.get("stage") == "SORT":
+            flags.add("SORT")
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                flags |= _plan_flags(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            flags |= _plan_flags(item)
+    return flags
+
+
+def _explainable(command: Mapping[str, Any]) -> dict[str, Any]:
+    return {
+        key: value
+        for key, value in command.items()
+        if not key.startswith("$") and key not in _NOT_EXPLAINABLE
+    }
+
+
+def _top(stats: list[ShapeStats], top: int | None) -> list[ShapeStats]:
+    stats.sort(key=lambda s: s.total_ms, reverse=True)
+    return stats if top is None else stats[:top]
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """Aggregates the count and latency of the commands sent by a client
+    per :func:`query_shape`.
+
+    A :class:`QueryProfiler` is registered on the client by
+    :meth:`~flask_pymongo.PyMongo.init_app` as
+    :attr:`~flask_pymongo.PyMongo.profiler` when the ``MONGO_PROFILE``
+    configuration variable is true. If ``explain_interval`` is set (by
+    ``MONGO_PROFILE_EXPLAIN_INTERVAL``), the ``explain_top`` slowest shapes
+    are explained from a background thread at most that often, so that
+    shapes scanning the whole collection or sorting in memory are flagged.
+
+    .. code-block:: python
+
+        for stats in mongo.profiler.report(top=10):
+            print(stats.namespace, stats.shape, stats.count, stats.mean_ms, stats.flags)
+
+    :param float explain_interval: the minimum number of seconds between
+       automatic explains, or ``None`` to only explain on demand
+    :param int explain_top: the number of shapes to explain
+    :param int max_shapes: the maximum number of shapes to track; commands
+       with new shapes are ignored beyond it
+    """
+
+    def __init__(
+        self,
+        explain_interval: float | None = None,
+        explain_top: int = 5,
+        max_shapes: int = 1000,
+    ) -> None:
+        self.client: MongoClient[Any] | None = None
+        self.explain_interval = explain_interval
+        self.explain_top = explain_top
+        self.max_shapes = max_shapes
+
+        self._lock = threading.Lock()
+        self._explaining = threading.Lock()
+        self._last_explain = time.monotonic()
+        self._started: dict[int, tuple[str, str, str, Mapping[str, Any]]] = {}
+        self._stats: dict[tuple[str, str], ShapeStats] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        name = event.command_name
+        if name not in _QUERY_FIELDS:
+            return
+        namespace = f"{event.database_name}.{event.command.get(name)}"
+        with self._lock:
+            self._started[event.request_id] = (
+                namespace,
+                name,
+                query_shape(name, event.command),
+                event.command,
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        with self._lock:
+            started = self._started.pop(event.request_id, None)
+            if started is None:
+                return
+            namespace, name, shape, command = started
+            stats = self._stats.get((namespace, shape))
+            if stats is None:
+                if len(self._stats) >= self.max_shapes:
+                    return
+                stats = self._stats[(namespace, shape)] = ShapeStats(namespace, name, shape)
+                stats.sample = _explainable(command)
+            stats.record(event.duration_micros / 1000)
+
+        if (
+            self.explain_interval is not None
+            and time.monotonic() - self._last_explain >= self.explain_interval
+        ):
+            self._last_explain = time.monotonic()
+            threading.Thread(target=self._explain_quietly, daemon=True).start()
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        with self._lock:
+            self._started.pop(event.request_id, None)
+
+    def report(self, top: int | None = None) -> list[ShapeStats]:
+        """Return the ``top`` shapes, or all of them, by total time spent."""
+        with self._lock:
+            return _top(list(self._stats.values()), top)
+
+    def explain(self, top: int | None = None) -> list[ShapeStats]:
+        """Explain the ``top`` shapes by total time spent (``explain_top`` by
+        default), and return them with their :attr:`~ShapeStats.flags` set.
+        """
+        assert self.client is not None, "Please initialize the app before calling explain!"
+        stats = self.report(self.explain_top if top is None else top)
+        for shape in stats:
+            shape.explain(self.client)
+        return stats
+
+    def reset(self) -> None:
+        """Forget all statistics."""
+        with self._lock:
+            self._stats.clear()
+
+    def _explain_quietly(self) -> None:
+        if not self._explaining.acquire(blocking=False):
+            return
+        try:
+            for stats in self.explain():
+                if stats.flags:
+                    logger.warning(
+                        "Query shape %s on %s uses %s",
+                        stats.shape,
+                        stats.namespace,
+                        " and ".join(sorted(stats.flags)),
+                    )
+        except PyMongoError as exc:
+            logger.warning("Could not explain query shapes: %s", exc)
+        finally:
+            self._explaining.release()
+
+
+def read_system_profile(database: Database[Any], top: int | None = None) -> list[ShapeStats]:
+    """Aggregate the server's ``system.profile`` collection of ``database``
+    per :func:`query_shape`, and return the ``top`` shapes, or all of them,
+    by total time spent.
+
+    The server only records commands if profiling is enabled, for example
+    with ``database.command("profile", 1, slowms=50)``. Shapes are flagged
+    from the plan summaries the server records.
+    """
+    stats: dict[tuple[str, str], ShapeStats] = {}
+    for entry in database["system.profile"].find(
+        {"ns": {"$ne": f"{database.name}.system.profile"}}
+    ):
+        command = entry.get("command") or {}
+        if entry.get("op") in ("update", "remove"):
+            name = "update" if entry["op"] == "update" else "delete"
+            command = {name: entry["ns"].split(".", 1)[1], f"{name}s": [command]}
+        else:
+            name = next(iter(command), "")
+        if name not in _QUERY_FIELDS:
+            continue
+
+        shape = query_shape(name, command)
+        shape_stats = stats.get((entry["ns"], shape))
+        if shape_stats is None:
+            shape_stats = stats[(entry["ns"], shape)] = ShapeStats(entry["ns"], name, shape)
+            shape_stats.sample = _explainable(command)
+        shape_stats.record(entry.get("millis", 0))
+        if "COLLSCAN" in entry.get("planSummary", ""):
+            shape_stats.flags.add("COLLSCAN")
+        if entry.get("hasSortStage"):
+            shape_stats.flags.add("SORT")
+    return _top(list(stats.values()), top)
@@ -0,0 +1,195 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("ScanProgress",)
+
+import queue
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, NamedTuple
+
+import bson
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+# Documents sampled per partition to place the partition boundaries.
+_SAMPLES_PER_PARTITION = 100
+
+_DONE = object()
+
+
+class ScanProgress(NamedTuple):
+    """Passed to the ``progress`` callback of
+    :meth:`~flask_pymongo.wrappers.Collection.parallel_scan`: the number of
+    documents ``scanned`` so far, and the number of partitions ``done`` out
+    of ``partitions``.
+    """
+
+    scanned: int
+    done: int
+    partitions: int
+
+
+def partition_bounds(collection: Collection[Any], partitions: int) -> list[Any]:
+    """Return up to ``partitions - 1`` ``_id`` values splitting
+    ``collection`` into ranges of about equal size, estimated from a
+    random sample of its documents."""
+    if partitions < 2:
+        return []
+    buckets = collection.aggregate(
+        [
+            {"$sample": {"size": partitions * _SAMPLES_PER_PARTITION}},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": partitions}},
+        ]
+    )
+    return [bucket["_id"]["min"] for bucket in buckets][1:]
+
+
+def _partition_query(filter: Any, lower: Any, upper: Any, last: Any) -> dict[str, Any]:
+    id_range = {}
+    if lower is not None:
+        id_range["$gte"] = lower
+    if upper is not None:
+        id_range["$lt"] = upper
+    if last is not None:
+        id_range["$gt"] = last
+    conditions = [filter] if filter else []
+    if id_range:
+        conditions.append({"_id": id_range})
+    if len(conditions) > 1:
+        return {"$and": conditions}
+    return conditions[0] if conditions else {}
+
+
+def _scan_key(state: Any, checkpoints: Collection[Any]) -> bytes:
+    # Compared encoded, since a saved filter decodes to different Python
+    # types (naive datetimes, plain dicts) than the caller may have passed.
+    key = {"filter": state.get("filter"), "partitions": state.get("partitions")}
+    return bson.encode(key, codec_options=checkpoints.codec_options)
+
+
+def parallel_scan(
+    collection: Collection[Any],
+    filter: Any = None,
+    partitions: int = 4,
+    callback: Callable[[Any], Any] | None = None,
+    workers: int | None = None,
+    checkpoint: str | None = None,
+    checkpoint_every: int = 1000,
+    progress: Callable[[ScanProgress], Any] | None = None,
+    **kwargs: Any,
+) -> Iterator[Any]:
+    """Scan ``collection`` in ``_id`` ranges on a pool of threads; see
+    :meth:`~flask_pymongo.wrappers.Collection.parallel_scan`."""
+    checkpoints = collection.database[f"{collection.name}.scan_checkpoints"]
+    state = checkpoints.find_one({"_id": checkpoint}) if checkpoint else None
+    if state is not None and _scan_key(state, checkpoints) != _scan_key(
+        {"filter": filter or {}, "partitions": partitions}, checkpoints
+    ):
+        raise ValueError(
+            f"Checkpoint {checkpoint!r} was saved by a scan with a different "
+            "filter or number of partitions"
+        )
+    if state is None:
+        bounds = partition_bounds(collection, partitions)
+        count = len(bounds) + 1
+        state = {
+            "filter": filter or {},
+            "partitions": partitions,
+            "bounds": bounds,
+            "last": [None] * count,
+            "done": [False] * count,
+        }
+        if checkpoint:
+            checkpoints.replace_one({"_id": checkpoint}, state, upsert=True)
+    edges = [None, *state["bounds"], None]
+    last, done = state["last"], state["done"]
+
+    items: queue.Queue[tuple[int, Any, Any]] = queue.Queue(maxsize=4 * len(done))
+    stop = threading.Event()
+
+    def put(item: tuple[int, Any, Any]) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def scan(i: int) -> None:
+        try:
+            query = _partition_query(filter, edges[i], edges[i + 1], last[i])
+            for doc in collection.find(query, sort=[("_id", ASCENDING)], **kwargs):
+                value = doc if callback is None else callback(doc)
+                if not put((i, doc["_id"], value)):
+                    return
+        except BaseException as exc:
+            put((i, _DONE, exc))
+        else:
+            put((i, _DONE, None))
+
+    def save() -> None:
+        if checkpoint:
+            checkpoints.update_one({"_id": checkpoint}, {"$set": {"last": last, "done": done}})
+
+    def report() -> None:
+        if progress is not None:
+            progress(ScanProgress(scanned, sum(done), len(done)))
+
+    pending = [i for i, finished in enumerate(done) if not finished]
+    scanned = 0
+    remaining = len(pending)
+    with ThreadPoolExecutor(workers or remaining or 1) as pool:
+        for i in pending:
+            pool.submit(scan, i)
+        try:
+            while remaining:
+                i, _id, value = items.get()
+                if _id is _DONE:
+                    if value is not None:
+                        raise value
+                    done[i] = True
+                    remaining -= 1
+                    save()
+                    report()
+                    continue
+                # Each partition arrives in _id order, so once the consumer
+                # asks for the next item, everything up to _id is processed.
+                yield value
+                last[i] = _id
+                scanned += 1
+                if scanned % checkpoint_every == 0:
+                    save()
+                    report()
+        finally:
+            stop.set()
+            if remaining:
+                # Interrupted: keep what was done for the next run.
+                save()
+    if checkpoint:
+        checkpoints.delete_one({"_id": checkpoint})
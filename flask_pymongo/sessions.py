@@ -0,0 +1,170 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("MongoSession", "MongoSessionInterface")
+
+import secrets
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from flask import Flask, Request, Response
+from flask.sessions import SecureCookieSession, SessionInterface, SessionMixin
+from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
+
+
+class MongoSession(SecureCookieSession):
+    """A session stored in MongoDB by :class:`MongoSessionInterface`.
+
+    As with Flask's default session, only changes to the session itself
+    are tracked; set :attr:`modified` after changing a mutable value it
+    holds.
+    """
+
+    def __init__(
+        self,
+        initial: Mapping[str, Any] | None = None,
+        sid: str | None = None,
+        expires_at: datetime | None = None,
+    ) -> None:
+        super().__init__(initial)
+        #: The id of the session, or ``None`` if it has not been saved.
+        self.sid = sid
+        #: When the stored session expires, or ``None`` if it has not been
+        #: saved.
+        self.expires_at = expires_at
+
+
+class MongoSessionInterface(SessionInterface):
+    """Stores Flask sessions in a MongoDB collection, with only a random
+    session id in the cookie.
+
+    Each session is a document holding its ``data``, which may contain any
+    BSON type, and an ``expiresAt`` date, which a TTL index uses to remove
+    it :attr:`~flask.Flask.permanent_session_lifetime` after it was last
+    written.
+
+    A session is only written when it was modified, or when it was last
+    written more than ``refresh_threshold`` seconds ago, and then only its
+    expiry is updated. Sessions which are read but not changed, the common
+    case, cost one indexed read by ``_id`` and no write. Writes use
+    ``write_concern``, by default ``w=1``, not waiting for replication:
+    a session lost in a failover means logging in again.
+
+    :class:`MongoSessionInterface` is installed as the app's
+    :attr:`~flask.Flask.session_interface` by
+    :meth:`~flask_pymongo.PyMongo.init_app` if the
+    ``MONGO_SESSION_COLLECTION`` configuration variable is set, using
+    ``MONGO_SESSION_REFRESH_THRESHOLD`` as ``refresh_threshold``, and the
+    TTL index is declared, to be created by ``flask mongo ensure-indexes``.
+
+    :param collection: the collection storing the sessions
+    :param float refresh_threshold: the number of seconds after which a
+       session read but not modified is written again to extend its
+       expiry; ``None`` defaults to a tenth of
+       :attr:`~flask.Flask.permanent_session_lifetime`
+    :param write_concern: the
+       :class:`~pymongo.write_concern.WriteConcern` of writes
+    """
+
+    session_class = MongoSession
+
+    def __init__(
+        self,
+        collection: Collection[Any],
+        refresh_threshold: float | None = None,
+        write_concern: WriteConcern | None = None,
+    ) -> None:
+        self.collection = collection.with_options(
+            write_concern=write_concern if write_concern is not None else WriteConcern(w=1)
+        )
+        self.refresh_threshold = refresh_threshold
+
+    def _refresh_threshold(self, app: Flask) -> timedelta:
+        if self.refresh_threshold is not None:
+            return timedelta(seconds=self.refresh_threshold)
+        return app.permanent_session_lifetime / 10
+
+    def open_session(self, app: Flask, request: Request) -> MongoSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            doc = self.collection.find_one(
+                {"_id": sid, "expiresAt": {"$gt": datetime.now(timezone.utc)}},
+                {"data": True, "expiresAt": True},
+            )
+            if doc is not None:
+                expires_at = doc["expiresAt"]
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                return self.session_class(doc["data"], sid, expires_at)
+        return self.session_class()
+
+    def save_session(self, app: Flask, session: SessionMixin, response: Response) -> None:
+        assert isinstance(session, MongoSession)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and session.sid is not None:
+                self.collection.delete_one({"_id": session.sid})
+                response.delete_cookie(name, domain=domain, path=path)
+                response.vary.add("Cookie")
+            return
+
+        now = datetime.now(timezone.utc)
+        expires_at = now + app.permanent_session_lifetime
+        if session.modified or session.sid is None:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            self.collection.replace_one(
+                {"_id": session.sid},
+                {"data": dict(session), "expiresAt": expires_at},
+                upsert=True,
+            )
+        elif session.expires_at is not None and (
+            expires_at - session.expires_at > self._refresh_threshold(app)
+        ):
+            self.collection.update_one({"_id": session.sid}, {"$set": {"expiresAt": expires_at}})
+        else:
+            return
+        session.expires_at = expires_at
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
@@ -0,0 +1,311 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("SharedCache",)
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS, CodecOptions
+
+_MAGIC = b"FPMC"
+_FORMAT = 1
+# magic, format, slot size, slot count, generation
+_HEADER = struct.Struct("<4sIIIQ")
+_HEADER_SIZE = 64
+# sequence, generation, key hash, expiry, crc, key length, value length
+_SLOT = struct.Struct("<QQQdIII4x")
+_SEQUENCE = struct.Struct("<Q")
+_GENERATION_OFFSET = 16
+
+
+def _gridfs_key(database: Any, base: str, filename: str) -> str:
+    """The key of the latest revision of ``filename``, cached by
+    :meth:`~flask_pymongo.PyMongo.send_file`."""
+    return f"gridfs:{database.name}:{base}:{filename}"
+
+
+def _forget_gridfs_files(database: Any, base: str, filenames: Iterable[str | None]) -> None:
+    """Remove the cached latest revisions of ``filenames``, once they have
+    changed, from the client's shared cache, if it has one."""
+    cache: SharedCache | None = getattr(database.client, "_shared_cache", None)
+    if cache is None:
+        return
+    for filename in filenames:
+        if filename is not None:
+            cache.delete(_gridfs_key(database, base, filename))
+
+
+def _hash(key: bytes) -> int:
+    # hash() is salted per process, so workers would disagree.
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class SharedCache:
+    """A cache of BSON values in a memory-mapped file, shared by all the
+    processes on a host which open the same ``path``.
+
+    The file holds a fixed number of ``slot_size`` byte slots, so it never
+    grows beyond ``size``; each key may be stored in one of two slots, and
+    evicts the entry expiring first when both are taken. Values which do
+    not fit in a slot are not cached.
+
+    Reads take no lock. Each slot has a sequence number, which is odd
+    while the slot is written, and a checksum; a reader which sees the
+    sequence change, or the checksum not match, reads again, or misses.
+    Writes are serialized between processes with :func:`fcntl.flock`, so
+    the cache is only available on POSIX systems. Every entry records the
+    generation of the cache it was written in, and :meth:`clear` starts a
+    new generation, invalidating every entry in every process at once.
+
+    The first process to open the file lays it out with its ``size`` and
+    ``slot_size``; the others use the layout recorded in the file, which is
+    never resized while processes may have it mapped. Remove the file to
+    apply a new size.
+
+    Use a file on a memory file system, such as ``/dev/shm`` on Linux, so
+    that pages are not written back to disk.
+
+    A :class:`SharedCache` is created by :meth:`~flask_pymongo.PyMongo.init_app`
+    as :attr:`~flask_pymongo.PyMongo.shared_cache` if the
+    ``MONGO_SHARED_CACHE_PATH`` configuration variable is set, with the
+    ``MONGO_SHARED_CACHE_SIZE``, ``MONGO_SHARED_CACHE_SLOT_SIZE`` and
+    ``MONGO_SHARED_CACHE_TTL`` Flask configuration variables. It then
+    caches the files found by :meth:`~flask_pymongo.PyMongo.send_file`, and
+    the documents found by
+    :meth:`~flask_pymongo.wrappers.Collection.find_one_cached`.
+
+    :param str path: the path of the file
+    :param int size: the size of the file, in bytes
+    :param int slot_size: the size of a slot, in bytes, bounding the size
+       of a key and its BSON-encoded value
+    :param float ttl: the default number of seconds values are cached for
+    """
+
+    def __init__(
+        self, path: str, size: int = 64 * 1024 * 1024, slot_size: int = 4096, ttl: float = 60.0
+    ) -> None:
+        if slot_size <= _SLOT.size or slot_size % 8:
+            raise ValueError(f"'slot_size' must be a multiple of 8 larger than {_SLOT.size}")
+        self.path = path
+        self.slot_size = slot_size
+        self.slots = (size - _HEADER_SIZE) // slot_size
+        if self.slots < 2:
+            raise ValueError("'size' must hold at least two slots")
+        self.size = _HEADER_SIZE + self.slots * slot_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._fd = -1
+        self._map: mmap.mmap | None = None
+        self._counters = {"hits": 0, "misses": 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Counts of ``hits`` and ``misses`` in this process."""
+        return dict(self._counters)
+
+    def _open(self) -> mmap.mmap:
+        pid = os.getpid()
+        if self._pid == pid and self._map is not None:
+            return self._map
+        import fcntl
+
+        with self._lock:
+            if self._pid == pid and self._map is not None:
+                return self._map
+            # A forked child shares its parent's flock(), so it opens the
+            # file again.
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                if len(header) < _HEADER.size or header[:4] != _MAGIC:
+                    # New, or not a cache: no process has mapped it, so it
+                    # can be laid out afresh.
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, _FORMAT, self.slot_size, self.slots, 1), 0)
+                else:
+                    self._adopt(fd, header)
+            except BaseException:
+                os.close(fd)  # Releases the flock().
+                raise
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, self.size)
+            self._fd = fd
+            self._pid = pid
+            return self._map
+
+    def _adopt(self, fd: int, header: bytes) -> None:
+        # Other processes may have mapped the file, and resizing it under
+        # them would kill them with SIGBUS, so its layout wins over ours.
+        _, file_format, slot_size, slots, _ = _HEADER.unpack(header)
+        if file_format != _FORMAT:
+            raise ValueError(f"{self.path!r} is a cache of another format; remove it")
+        size = _HEADER_SIZE + slots * slot_size
+        if os.fstat(fd).st_size < size:
+            raise ValueError(f"{self.path!r} is shorter than its header says; remove it")
+        self.slot_size, self.slots, self.size = slot_size, slots, size
+
+    def _generation(self, mapped: mmap.mmap) -> int:
+        return int(_SEQUENCE.unpack_from(mapped, _GENERATION_OFFSET)[0])
+
+    def _candidates(self, key_hash: int) -> tuple[int, int]:
+        first = key_hash % self.slots
+        second = (key_hash >> 32) % self.slots
+        if second == first:
+            second = (first + 1) % self.slots
+        return (
+            _HEADER_SIZE + first * self.slot_size,
+            _HEADER_SIZE + second * self.slot_size,
+        )
+
+    def _read(self, mapped: mmap.mmap, offset: int, key: bytes, key_hash: int) -> Any:
+        generation = self._generation(mapped)
+        for _ in range(3):
+            sequence, entry_generation, entry_hash, expires, crc, key_length, value_length = (
+                _SLOT.unpack_from(mapped, offset)
+            )
+            if entry_hash != key_hash or entry_generation != generation:
+                return None
+            if sequence % 2:
+                continue
+            start = offset + _SLOT.size
+            if key_length + value_length > self.slot_size - _SLOT.size:
+                continue
+            data = mapped[start : start + key_length + value_length]
+            if _SEQUENCE.unpack_from(mapped, offset)[0] != sequence:
+                continue
+            if zlib.crc32(data) != crc or data[:key_length] != key:
+                return None
+            if expires < time.time():
+                return None
+            return data[key_length:]
+        return None
+
+    def get(self, key: str, codec_options: CodecOptions[Any] = DEFAULT_CODEC_OPTIONS) -> Any:
+        """Return the value cached for ``key``, or raise :exc:`KeyError`."""
+        mapped = self._open()
+        encoded = key.encode("utf-8")
+        key_hash = _hash(encoded)
+        for offset in self._candidates(key_hash):
+            value = self._read(mapped, offset, encoded, key_hash)
+            if value is not None:
+                self._counters["hits"] += 1
+                return bson.decode(value, codec_options)["v"]
+        self._counters["misses"] += 1
+        raise KeyError(key)
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """Cache ``value``, which must be encodable as BSON, for ``ttl``
+        seconds, or :attr:`ttl` by default. Return ``False`` if it is too
+        large to cache."""
+        # Opened first, since the file may have a different slot size.
+        self._open()
+        encoded = key.encode("utf-8")
+        data = encoded + bson.encode({"v": value})
+        if len(data) > self.slot_size - _SLOT.size:
+            return False
+        self._write(encoded, data, time.time() + (self.ttl if ttl is None else ttl))
+        return True
+
+    def delete(self, key: str) -> None:
+        """Remove ``key`` from the cache, in every process."""
+        encoded = key.encode("utf-8")
+        self._write(encoded, None, 0.0)
+
+    def clear(self) -> None:
+        """Invalidate every entry, in every process."""
+        mapped = self._open()
+        with self._locked():
+            generation = self._generation(mapped) + 1
+            _SEQUENCE.pack_into(mapped, _GENERATION_OFFSET, generation)
+
+    def _write(self, key: bytes, data: bytes | None, expires: float) -> None:
+        mapped = self._open()
+        key_hash = _hash(key)
+        now = time.time()
+        with self._locked():
+            generation = self._generation(mapped)
+            candidates = []
+            for offset in self._candidates(key_hash):
+                _, entry_generation, entry_hash, entry_expires, _, _, _ = _SLOT.unpack_from(
+                    mapped, offset
+                )
+                if entry_generation == generation and entry_hash == key_hash:
+                    target = offset
+                    break
+                live = entry_generation == generation and entry_expires > now
+                candidates.append((live, entry_expires, offset))
+            else:
+                if data is None:
+                    return
+                target = min(candidates)[2]
+
+            sequence = _SEQUENCE.unpack_from(mapped, target)[0]
+            # Odd while writing; a writer which died half-way left it odd.
+            sequence |= 1
+            _SEQUENCE.pack_into(mapped, target, sequence)
+            if data is None:
+                _SLOT.pack_into(mapped, target, sequence, 0, 0, 0.0, 0, 0, 0)
+            else:
+                start = target + _SLOT.size
+                mapped[start : start + len(data)] = data
+                _SLOT.pack_into(
+                    mapped,
+                    target,
+                    sequence,
+                    generation,
+                    key_hash,
+                    expires,
+                    zlib.crc32(data),
+                    len(key),
+                    len(data) - len(key),
+                )
+            _SEQUENCE.pack_into(mapped, target, sequence + 1)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        import fcntl
+
+        # flock() does not exclude the threads of a process from each other.
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,217 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("StaleCache",)
+
+import contextvars
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+
+from flask import abort
+from pymongo.collection import Collection
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from flask_pymongo.limiter import _exempted
+
+
+def _unavailable(exc: BaseException) -> bool:
+    return isinstance(exc, ConnectionFailure) or (isinstance(exc, PyMongoError) and exc.timeout)
+
+
+class StaleCache:
+    """Keeps the last result of each query made with
+    :meth:`~flask_pymongo.wrappers.Collection.find_one_or_404` and
+    ``serve_stale=True``, to serve when MongoDB is slow or unavailable.
+
+    When a query has a cached result, it is sent from a thread pool, and
+    waited for at most ``latency`` seconds. If it takes longer, or fails
+    to reach the server (as during an election), the cached result is
+    returned instead, and the query, left to complete in the background,
+    refreshes it for the next request.
+
+    After ``failure_threshold`` consecutive failures, the circuit opens:
+    queries are not sent for ``reset_timeout`` seconds, and cached results
+    are served, or, for queries with none, a 503 Service Unavailable HTTP
+    status. A single query is then let through to probe the server.
+
+    A :class:`StaleCache` is created by :meth:`~flask_pymongo.PyMongo.init_app`
+    as :attr:`~flask_pymongo.PyMongo.stale_cache`, configured by the
+    ``MONGO_STALE_MAX_ENTRIES``, ``MONGO_STALE_LATENCY``,
+    ``MONGO_STALE_MAX_AGE``, ``MONGO_STALE_FAILURE_THRESHOLD`` and
+    ``MONGO_STALE_RESET_TIMEOUT`` Flask configuration variables.
+
+    :param int max_entries: the maximum number of results to keep; the
+       least recently used are evicted beyond it
+    :param float latency: the number of seconds to wait for a query before
+       serving its cached result
+    :param float max_age: the number of seconds after which a cached
+       result is too old to serve
+    :param int failure_threshold: the number of consecutive failures
+       opening the circuit
+    :param float reset_timeout: the number of seconds the circuit stays
+       open
+    :param int workers: the number of threads sending queries
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        latency: float = 0.25,
+        max_age: float = 300.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        workers: int = 4,
+    ) -> None:
+        self.max_entries = max_entries
+        self.latency = latency
+        self.max_age = max_age
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._refreshing: dict[Any, Future[Any]] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid: int | None = None
+        self._failures = 0
+        self._open_until = 0.0
+        self._counters = {"fresh": 0, "stale": 0, "failures": 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Counts of results served ``fresh`` and ``stale``, and of
+        ``failures`` to reach the server, plus the number of ``entries``
+        cached.
+        """
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+    @property
+    def circuit_open(self) -> bool:
+        """Whether queries are currently not sent."""
+        with self._lock:
+            return self._failures >= self.failure_threshold and time.monotonic() < self._open_until
+
+    def clear(self) -> None:
+        """Forget all cached results."""
+        with self._lock:
+            self._entries.clear()
+
+    def find_one(self, collection: Collection[Any], *args: Any, **kwargs: Any) -> Any:
+        """Return the result of ``collection.find_one(*args, **kwargs)``, or
+        its cached result if the query is slow or fails."""
+        key = (collection.full_name, repr(args), repr(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] > self.max_age:
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            closed = self._failures < self.failure_threshold
+            if not closed and now >= self._open_until:
+                # Half open: let this query probe the server.
+                self._open_until = now + self.reset_timeout
+                closed = True
+        if not closed:
+            return self._serve_stale(entry)
+        if entry is None:
+            return self._query(key, collection, args, kwargs)
+
+        future = self._refresh(key, collection, args, kwargs)
+        try:
+            return future.result(timeout=self.latency)
+        except FutureTimeoutError:
+            return self._serve_stale(entry)
+        except PyMongoError as exc:
+            if not _unavailable(exc):
+                raise
+            return self._serve_stale(entry)
+
+    def _serve_stale(self, entry: tuple[float, Any] | None) -> Any:
+        if entry is None:
+            abort(503)
+        with self._lock:
+            self._counters["stale"] += 1
+        return copy.deepcopy(entry[1])
+
+    def _query(self, key: Any, collection: Collection[Any], args: Any, kwargs: Any) -> Any:
+        try:
+            result = collection.find_one(*args, **kwargs)
+        except PyMongoError as exc:
+            if _unavailable(exc):
+                with self._lock:
+                    self._counters["failures"] += 1
+                    self._failures += 1
+                    if self._failures == self.failure_threshold:
+                        self._open_until = time.monotonic() + self.reset_timeout
+            raise
+        with self._lock:
+            self._counters["fresh"] += 1
+            self._failures = 0
+            self._entries[key] = (time.monotonic(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def _refresh_query(self, key: Any, collection: Collection[Any], args: Any, kwargs: Any) -> Any:
+        with _exempted():
+            return self._query(key, collection, args, kwargs)
+
+    def _refresh(
+        self, key: Any, collection: Collection[Any], args: Any, kwargs: Any
+    ) -> Future[Any]:
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                # Forked: the parent's threads are not ours.
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="flask_pymongo.stale_cache"
+                )
+                self._refreshing = {}
+                self._pid = pid
+            future = self._refreshing.get(key)
+            if future is None:
+                assert self._executor is not None
+                # Run in a copy of the request's context, so the query keeps
+                # its deadline (MONGO_REQUEST_TIMEOUT), but exempt from the
+                # limiter, since the request does not wait for it.
+                context = contextvars.copy_context()
+                future = self._executor.submit(
+                    context.run, self._refresh_query, key, collection, args, kwargs
+                )
+                self._refreshing[key] = future
+                future.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return future
@@ -0,0 +1,325 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("ResumableUploads",)
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from mimetypes import guess_type
+from typing import Any
+
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from flask import abort
+from gridfs import DEFAULT_CHUNK_SIZE
+from pymongo.database import Database
+
+from flask_pymongo.shared_cache import _forget_gridfs_files
+
+_READ_SIZE = 255 * 1024
+
+# How long an append may go without writing a chunk before another request
+# may take the upload over.
+_CLAIM_TIMEOUT = timedelta(seconds=60)
+
+
+class ResumableUploads:
+    """Resumable uploads into GridFS, over several requests.
+
+    An upload is created with :meth:`create`, receives its content in any
+    number of byte ranges with :meth:`append`, and becomes a GridFS file
+    with :meth:`finalize`. Each range is written to the ``chunks``
+    collection as it arrives, so a client whose connection drops asks for
+    the :meth:`offset` received so far, and resumes from there rather than
+    from zero.
+
+    .. code-block:: python
+
+        @app.route("/uploads", methods=["POST"])
+        def create_upload():
+            upload_id = mongo.resumable_uploads().create(request.args["filename"])
+            return {"id": str(upload_id)}
+
+
+        @app.route("/uploads/<ObjectId:upload_id>", methods=["HEAD"])
+        def upload_offset(upload_id):
+            offset = mongo.resumable_uploads().offset(upload_id)
+            return "", 200, {"Upload-Offset": str(offset)}
+
+
+        @app.route("/uploads/<ObjectId:upload_id>", methods=["PATCH"])
+        def append_upload(upload_id):
+            offset = int(request.headers["Upload-Offset"])
+            offset = mongo.resumable_uploads().append(upload_id, request.stream, offset)
+            return "", 204, {"Upload-Offset": str(offset)}
+
+
+        @app.route("/uploads/<ObjectId:upload_id>", methods=["PUT"])
+        def finalize_upload(upload_id):
+            file_id = mongo.resumable_uploads().finalize(upload_id)
+            return redirect(mongo.file_url("get_file", file_id))
+
+    Unknown or expired uploads cause a 404 Not Found HTTP status, and
+    ranges that do not start at the current offset, or arrive while
+    another range is being appended, a 409 Conflict.
+
+    A SHA-1 hash cannot be resumed in another process, so a finalized file
+    has no ``sha1``. Its ``etag`` is instead the SHA-1 of the SHA-1s of its
+    chunks, followed by ``-`` and the number of chunks, in the manner of
+    multipart uploads to Amazon S3. It is computed without reading the
+    file back, and is the ETag :meth:`~flask_pymongo.PyMongo.send_file`
+    sends for the file.
+
+    Uploads not appended to for ``expire_after`` seconds are removed, with
+    their chunks, by :meth:`cleanup`, or the ``flask mongo cleanup-uploads``
+    command.
+
+    :param database: the database holding the GridFS collections
+    :param str base: the base name of the GridFS collections to use
+    :param int expire_after: number of seconds after which an upload that
+       receives no data is abandoned
+    :param int max_size: the maximum size of a file, in bytes; appending
+       beyond it fails with HTTP status 413
+    """
+
+    def __init__(
+        self,
+        database: Database[Any],
+        base: str = "fs",
+        expire_after: int = 86400,
+        max_size: int | None = None,
+    ) -> None:
+        if not isinstance(base, str):
+            raise TypeError("'base' must be string or unicode")
+        self.database = database
+        self.base = base
+        self.expire_after = expire_after
+        self.max_size = max_size
+        self._uploads = database[f"{base}.uploads"]
+        self._chunks = database[f"{base}.chunks"]
+        self._files = database[f"{base}.files"]
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.expire_after)
+
+    def _get(self, upload_id: Any) -> Any:
+        upload = self._uploads.find_one({"_id": upload_id})
+        if upload is None:
+            abort(404)
+        return upload
+
+    def create(
+        self,
+        filename: str,
+        content_type: str | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        **kwargs: Any,
+    ) -> ObjectId:
+        """Start an upload, and return its id, which will also be the
+        ``_id`` of the file.
+
+        :param str filename: the filename of the file
+        :param str content_type: the MIME content-type of the file. If
+           ``None``, the content-type is guessed from the filename using
+           :func:`~mimetypes.guess_type`
+        :param int chunk_size: the GridFS chunk size of the file
+        :param kwargs: extra attributes to be stored in the file's document
+        """
+        if content_type is None:
+            content_type, _ = guess_type(filename)
+        upload_id = ObjectId()
+        self._uploads.insert_one(
+            {
+                "_id": upload_id,
+                "filename": filename,
+                "contentType": content_type,
+                "chunkSize": chunk_size,
+                "metadata": kwargs,
+                "length": 0,
+                "n": 0,
+                "tail": Binary(b""),
+                "digests": [],
+                "expiresAt": self._expires_at(),
+            }
+        )
+        return upload_id
+
+    def offset(self, upload_id: Any) -> int:
+        """Return the number of bytes received so far."""
+        return int(self._get(upload_id)["length"])
+
+    def append(self, upload_id: Any, data: Any, offset: int) -> int:
+        """Append a range of bytes to an upload, and return the new offset.
+
+        :param upload_id: the id returned by :meth:`create`
+        :param data: the bytes, or a file-like object to read them from,
+           such as :attr:`~flask.Request.stream`
+        :param int offset: the position of the range in the file, which
+           must be the current :meth:`offset`
+        """
+        upload = self._get(upload_id)
+        if offset != upload["length"]:
+            abort(409, description=f"Upload is at offset {upload['length']}, not {offset}.")
+        claim = self._claim(upload_id, offset)
+        try:
+            return self._append(upload, data, offset, claim)
+        except BaseException:
+            self._release(upload_id, claim)
+            raise
+
+    def _claim(self, upload_id: Any, offset: int) -> ObjectId:
+        """Take the upload at ``offset`` for one request, so that no other
+        writes its chunks until it is released, or left unrenewed for
+        ``_CLAIM_TIMEOUT`` seconds."""
+        claim = ObjectId()
+        now = datetime.now(timezone.utc)
+        result = self._uploads.update_one(
+            {
+                "_id": upload_id,
+                "length": offset,
+                "$or": [{"claim": None}, {"claimedUntil": {"$lt": now}}],
+            },
+            {"$set": {"claim": claim, "claimedUntil": now + _CLAIM_TIMEOUT}},
+        )
+        if result.matched_count == 0:
+            abort(409, description="Upload is being appended to concurrently.")
+        return claim
+
+    def _release(self, upload_id: Any, claim: ObjectId) -> None:
+        self._uploads.update_one(
+            {"_id": upload_id, "claim": claim}, {"$unset": {"claim": "", "claimedUntil": ""}}
+        )
+
+    def _renew(self, upload_id: Any, claim: ObjectId) -> None:
+        result = self._uploads.update_one(
+            {"_id": upload_id, "claim": claim},
+            {"$set": {"claimedUntil": datetime.now(timezone.utc) + _CLAIM_TIMEOUT}},
+        )
+        if result.matched_count == 0:
+            abort(409, description="Upload was taken over by another request.")
+
+    def _append(self, upload: Any, data: Any, offset: int, claim: ObjectId) -> int:
+        upload_id = upload["_id"]
+        chunk_size = upload["chunkSize"]
+        n = upload["n"]
+        buffer = bytearray(upload["tail"])
+        digests = []
+        received = 0
+        pieces = (
+            [data]
+            if isinstance(data, (bytes, bytearray))
+            else iter(lambda: data.read(_READ_SIZE), b"")
+        )
+        for piece in pieces:
+            received += len(piece)
+            if self.max_size is not None and offset + received > self.max_size:
+                abort(413)
+            buffer += piece
+            while len(buffer) >= chunk_size:
+                chunk = bytes(buffer[:chunk_size])
+                del buffer[:chunk_size]
+                self._renew(upload_id, claim)
+                # Upsert, so that retrying a range that failed part-way is safe.
+                self._chunks.replace_one(
+                    {"files_id": upload_id, "n": n},
+                    {"files_id": upload_id, "n": n, "data": Binary(chunk)},
+                    upsert=True,
+                )
+                digests.append(Binary(hashlib.sha1(chunk).digest()))
+                n += 1
+
+        result = self._uploads.update_one(
+            {"_id": upload_id, "claim": claim},
+            {
+                "$set": {
+                    "length": offset + received,
+                    "n": n,
+                    "tail": Binary(bytes(buffer)),
+                    "expiresAt": self._expires_at(),
+                },
+                "$push": {"digests": {"$each": digests}},
+                "$unset": {"claim": "", "claimedUntil": ""},
+            },
+        )
+        if result.matched_count == 0:
+            abort(409, description="Upload was taken over by another request.")
+        return offset + received
+
+    def finalize(self, upload_id: Any) -> Any:
+        """Turn a complete upload into a GridFS file, and return its
+        ``_id``."""
+        upload = self._get(upload_id)
+        claim = self._claim(upload_id, upload["length"])
+        try:
+            return self._finalize(upload)
+        except BaseException:
+            self._release(upload_id, claim)
+            raise
+
+    def _finalize(self, upload: Any) -> Any:
+        upload_id = upload["_id"]
+        digests = [bytes(digest) for digest in upload["digests"]]
+        tail = bytes(upload["tail"])
+        if tail:
+            self._chunks.replace_one(
+                {"files_id": upload_id, "n": upload["n"]},
+                {"files_id": upload_id, "n": upload["n"], "data": Binary(tail)},
+                upsert=True,
+            )
+            digests.append(hashlib.sha1(tail).digest())
+        # Chunks written by failed appends which went further.
+        self._chunks.delete_many({"files_id": upload_id, "n": {"$gte": len(digests)}})
+
+        etag = f"{hashlib.sha1(b''.join(digests)).hexdigest()}-{len(digests)}"
+        document = dict(upload["metadata"])
+        document.update(
+            _id=upload_id,
+            filename=upload["filename"],
+            length=upload["length"],
+            chunkSize=upload["chunkSize"],
+            uploadDate=datetime.now(timezone.utc),
+            etag=etag,
+        )
+        if upload["contentType"] is not None:
+            document["contentType"] = upload["contentType"]
+        self._files.insert_one(document)
+        self._uploads.delete_one({"_id": upload_id})
+        _forget_gridfs_files(self.database, self.base, [upload["filename"]])
+        return upload_id
+
+    def cleanup(self) -> int:
+        """Remove the uploads that have expired, and their chunks, and
+        return how many were removed."""
+        expired = [
+            upload["_id"]
+            for upload in self._uploads.find(
+                {"expiresAt": {"$lt": datetime.now(timezone.utc)}}, {"_id": 1}
+            )
+        ]
+        if expired:
+            self._chunks.delete_many({"files_id": {"$in": expired}})
+            self._uploads.delete_many({"_id": {"$in": expired}})
+        return len(expired)
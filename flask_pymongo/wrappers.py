@@ -24,10 +24,194 @@
 # POSSIBILITY OF SUCH DAMAGE.
 from __future__ import annotations
 
-from typing import Any
+import base64
+import binascii
+import functools
+import hashlib
+from collections.abc import ItemsView, Iterator
+from contextlib import AbstractContextManager, nullcontext
+from datetime import datetime
+from typing import Any, Callable
 
-from flask import abort
-from pymongo import collection, database, mongo_client
+import bson
+from bson import _raw_to_dict, json_util
+from bson.codec_options import CodecOptions
+from bson.errors import BSONError, InvalidBSON
+from bson.raw_bson import RawBSONDocument
+from flask import Response, abort, current_app, g, request
+from pymongo import ASCENDING, collection, database, mongo_client
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from flask_pymongo import columnar, scan
+from flask_pymongo.limiter import ConcurrencyLimiter, _limits_context
+from flask_pymongo.scan import ScanProgress
+from flask_pymongo.shared_cache import SharedCache
+from flask_pymongo.stale import StaleCache
+
+
+class BufferedWriteError(PyMongoError):
+    """Raised when writes queued with :meth:`Collection.buffer_write` fail.
+
+    :attr:`failures` holds one ``(request, error)`` pair per failed write,
+    where ``request`` is the originating operation passed to
+    :meth:`Collection.buffer_write` (or ``None`` for write concern errors,
+    and for batches which could not be sent at all, with an ``errmsg`` and
+    the ``ns`` of the batch) and ``error`` is the server's error document.
+
+    """
+
+    def __init__(self, failures: list[tuple[Any, dict[str, Any]]]) -> None:
+        self.failures = failures
+        super().__init__(f"{len(failures)} buffered write(s) failed")
+
+
+class Page(dict[str, Any]):
+    """A page of documents returned by :meth:`Collection.paginate`.
+
+    A page is a :class:`dict` with keys ``documents``, the list of documents
+    on the page, and ``next``, the token for the following page (or
+    ``None`` on the last page), so it can be passed directly to
+    :func:`~flask.json.jsonify`.
+
+    """
+
+    @property
+    def documents(self) -> list[Any]:
+        return self["documents"]  # type: ignore[no-any-return]
+
+    @property
+    def next(self) -> str | None:
+        return self["next"]  # type: ignore[no-any-return]
+
+
+class LazyDocument(RawBSONDocument):
+    """A read-only document that decodes each field on first access.
+
+    Like :class:`~bson.raw_bson.RawBSONDocument`, it keeps the raw BSON
+    bytes of the document, but rather than decoding every field as soon
+    as one is accessed, it finds and decodes only the fields that are
+    accessed, and remembers them. Embedded documents are
+    :class:`LazyDocument` instances too. Iterating over all the fields,
+    as :class:`~flask_pymongo.helpers.BSONProvider` does to serialize the
+    document as JSON, decodes the rest of the document at once.
+
+    Use :meth:`Collection.lazy` to read documents of a collection as
+    :class:`LazyDocument` instances, or pass ``document_class=LazyDocument``
+    to :class:`~flask_pymongo.PyMongo` to read all documents this way.
+
+    .. code-block:: python
+
+        @app.route("/user/<username>")
+        def user_profile(username):
+            user = mongo.db.users.lazy().find_one_or_404({"_id": username})
+            return render_template("user.html", name=user["name"])
+
+    """
+
+    __slots__ = ("_offsets", "_position", "_values")
+
+    def __init__(self, bson_bytes: bytes | memoryview, codec_options: Any = None) -> None:
+        if codec_options is None:
+            codec_options = _LAZY_CODEC_OPTIONS
+        # Keep our own copy rather than a view of the whole server reply.
+        super().__init__(bytes(bson_bytes), codec_options)
+        self._offsets: dict[str, tuple[int, int]] = {}
+        self._position = 4
+        self._values: dict[str, Any] = {}
+
+    def _scan(self, key: str | None) -> None:
+        """Record the offsets of fields, up to ``key`` or to the end."""
+        raw: bytes = self.raw  # type: ignore[assignment]
+        end = len(raw) - 1
+        position = self._position
+        while position < end:
+            start = position
+            name_end = raw.index(b"\0", position + 1)
+            name = raw[position + 1 : name_end].decode("utf-8")
+            position = _element_end(raw, raw[start], name_end + 1)
+            self._offsets[name] = (start, position)
+            if name == key:
+                break
+        self._position = position
+
+    def _decode(self, key: str) -> Any:
+        start, stop = self._offsets[key]
+        element = self.raw[start:stop]
+        wrapped = (len(element) + 5).to_bytes(4, "little") + element + b"\0"
+        decoded: dict[str, Any] = {}
+        return _raw_to_dict(wrapped, 4, len(wrapped) - 1, self._codec_options, decoded)[key]
+
+    @property
+    def _codec_options(self) -> Any:
+        return self._RawBSONDocument__codec_options  # type: ignore[attr-defined]
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key not in self._offsets:
+            self._scan(key)
+        value = self._values[key] = self._decode(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        if isinstance(key, str) and key not in self._offsets:
+            self._scan(key)
+        return key in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        self._scan(None)
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        self._scan(None)
+        return len(self._offsets)
+
+    def items(self) -> ItemsView[str, Any]:
+        if len(self._values) < len(self):
+            raw = self.raw
+            values: dict[str, Any] = {}
+            self._values = _raw_to_dict(raw, 4, len(raw) - 1, self._codec_options, values)
+        return self._values.items()
+
+
+# The size of a BSON value of each fixed-size type.
+_FIXED_SIZES = {
+    0x01: 8,
+    0x06: 0,
+    0x07: 12,
+    0x08: 1,
+    0x09: 8,
+    0x0A: 0,
+    0x10: 4,
+    0x11: 8,
+    0x12: 8,
+    0x13: 16,
+    0x7F: 0,
+    0xFF: 0,
+}
+
+
+def _element_end(raw: bytes, element_type: int, position: int) -> int:
+    """Return the end of the BSON value of ``element_type`` at ``position``."""
+    size = _FIXED_SIZES.get(element_type)
+    if size is not None:
+        return position + size
+    if element_type in (0x02, 0x0D, 0x0E):  # string, code, symbol
+        return position + 4 + int.from_bytes(raw[position : position + 4], "little")
+    if element_type in (0x03, 0x04, 0x0F):  # document, array, code with scope
+        return position + int.from_bytes(raw[position : position + 4], "little")
+    if element_type == 0x05:  # binary
+        return position + 5 + int.from_bytes(raw[position : position + 4], "little")
+    if element_type == 0x0B:  # regular expression
+        return raw.index(b"\0", raw.index(b"\0", position) + 1) + 1
+    if element_type == 0x0C:  # DBPointer
+        return position + 16 + int.from_bytes(raw[position : position + 4], "little")
+    raise InvalidBSON(f"unknown BSON type {element_type:#x}")
+
+
+_LAZY_CODEC_OPTIONS: CodecOptions[Any] = CodecOptions(document_class=LazyDocument)
 
 
 class MongoClient(mongo_client.MongoClient[dict[str, Any]]):
@@ -39,6 +223,14 @@ class MongoClient(mongo_client.MongoClient[dict[str, Any]]):
 
     """
 
+    # Set by PyMongo.init_app() when MONGO_CONCURRENCY_LIMIT is set, for
+    # the operations of Collection listed in _LIMITED_METHODS.
+    _limiter: ConcurrencyLimiter | None = None
+    # Set by PyMongo.init_app(), for Collection.find_one_or_404() and
+    # Collection.find_one_cached().
+    _stale_cache: StaleCache | None = None
+    _shared_cache: SharedCache | None = None
+
     def __getattr__(self, name: str) -> Any:
         attr = super().__getattr__(name)
         if isinstance(attr, database.Database):
@@ -91,7 +283,35 @@ class Collection(collection.Collection[dict[str, Any]]):
             return Collection(db, item.name)
         return item
 
-    def find_one_or_404(self, *args: Any, **kwargs: Any) -> Any:
+    def _slot(self) -> AbstractContextManager[Any]:
+        limiter: ConcurrencyLimiter | None = getattr(self.database.client, "_limiter", None)
+        if limiter is None or not _limits_context():
+            return nullcontext()
+        return limiter.slot()
+
+    def lazy(self) -> Collection:
+        """Return this collection, reading documents as
+        :class:`LazyDocument` instances.
+
+        Documents are read from the server as before, but each field is
+        only decoded when it is accessed, which saves time and memory when
+        a view uses a few fields of large documents.
+
+        .. code-block:: python
+
+            user = mongo.db.users.lazy().find_one_or_404({"_id": username})
+
+        """
+        return Collection(
+            self.database,
+            self.name,
+            codec_options=self.codec_options.with_options(document_class=LazyDocument),
+            read_preference=self.read_preference,
+            write_concern=self.write_concern,
+            read_concern=self.read_concern,
+        )
+
+    def find_one_or_404(self, *args: Any, serve_stale: bool = False, **kwargs: Any) -> Any:
         """Find a single document or raise a 404.
 
         This is like :meth:`~pymongo.collection.Collection.find_one`, but
@@ -105,8 +325,504 @@ class Collection(collection.Collection[dict[str, Any]]):
                 user = mongo.db.users.find_one_or_404({"_id": username})
                 return render_template("user.html", user=user)
 
+        If ``serve_stale`` is true, the last result of the same query is
+        kept by :attr:`~flask_pymongo.PyMongo.stale_cache`, and returned
+        instead when the query is slow, or MongoDB is unavailable. See
+        :class:`~flask_pymongo.stale.StaleCache`.
+
         """
-        found = self.find_one(*args, **kwargs)
+        cache = getattr(self.database.client, "_stale_cache", None)
+        if serve_stale and cache is not None:
+            found = cache.find_one(self, *args, **kwargs)
+        else:
+            found = self.find_one(*args, **kwargs)
         if found is None:
             abort(404)
         return found
+
+    def find_one_cached(
+        self, filter: Any = None, *args: Any, ttl: float | None = None, **kwargs: Any
+    ) -> Any:
+        """Find a single document, as
+        :meth:`~pymongo.collection.Collection.find_one`, keeping the result
+        for ``ttl`` seconds in :attr:`~flask_pymongo.PyMongo.shared_cache`,
+        which is shared by all the processes on the host.
+
+        Use it for documents which are read often and may be a little out
+        of date, such as settings or feature flags. Without a shared cache,
+        every call queries the server.
+
+        .. code-block:: python
+
+            settings = mongo.db.settings.find_one_cached({"_id": "site"}, ttl=30)
+
+        :param float ttl: the number of seconds to keep the result; by
+           default, the ``MONGO_SHARED_CACHE_TTL`` configuration variable
+        """
+        cache = getattr(self.database.client, "_shared_cache", None)
+        if cache is None:
+            return self.find_one(filter, *args, **kwargs)
+        try:
+            key = f"find_one:{self.full_name}:{json_util.dumps([filter, args, kwargs])}"
+        except TypeError:
+            # A session, for one, cannot be part of the key.
+            return self.find_one(filter, *args, **kwargs)
+        try:
+            return cache.get(key, self.codec_options)
+        except KeyError:
+            found = self.find_one(filter, *args, **kwargs)
+            cache.set(key, found, ttl)
+            return found
+
+    def send_document(
+        self,
+        filter: Any,
+        projection: Any = None,
+        version_field: str | None = None,
+        last_modified_field: str | None = None,
+    ) -> Response:
+        """Respond with a single document as JSON, or raise a 404.
+
+        Like :meth:`~flask_pymongo.PyMongo.send_file`, the response
+        implements conditional GET semantics, so clients that already have
+        the current document get an empty 304 Not Modified response.
+
+        .. code-block:: python
+
+            @app.route("/user/<username>")
+            def user_profile(username):
+                return mongo.db.users.send_document(
+                    {"_id": username}, version_field="version"
+                )
+
+        If ``version_field`` or ``last_modified_field`` is given, the ETag or
+        Last-Modified header is taken from that field, and conditional
+        requests first fetch only those fields, so an unchanged document is
+        never fetched in full. Otherwise the ETag is a hash of the raw BSON
+        document, and a 304 response is sent without decoding the document
+        or encoding it as JSON.
+
+        :param dict filter: the query, as for
+           :meth:`~pymongo.collection.Collection.find_one`
+        :param projection: the fields to include in the response, as for
+           :meth:`~pymongo.collection.Collection.find_one`
+        :param str version_field: a field changed on every update of the
+           document, such as a version number
+        :param str last_modified_field: a :class:`~datetime.datetime` field
+           set to the time of the last update of the document
+        """
+        fields = [field for field in (version_field, last_modified_field) if field]
+        conditional = "If-None-Match" in request.headers or "If-Modified-Since" in request.headers
+        if fields and conditional:
+            stamp = self.find_one(filter, projection=dict.fromkeys(fields, True))
+            if stamp is None:
+                abort(404)
+            response = _conditional_response(
+                _version_etag(stamp, version_field), _get_path(stamp, last_modified_field)
+            )
+            if response.status_code == 304:
+                return response
+
+        raw_self = self.with_options(
+            codec_options=self.codec_options.with_options(document_class=RawBSONDocument)
+        )
+        raw = raw_self.find_one(filter, projection=projection)
+        if raw is None:
+            abort(404)
+        etag = _version_etag(raw, version_field) or hashlib.sha1(raw.raw).hexdigest()
+        last_modified = _get_path(raw, last_modified_field)
+        response = _conditional_response(etag, last_modified)
+        if response.status_code == 304:
+            return response
+
+        document = bson.decode(raw.raw, codec_options=self.codec_options)
+        response = current_app.response_class(
+            current_app.json.dumps(document), mimetype="application/json"
+        )
+        return _conditional_response(etag, last_modified, response)
+
+    def paginate(
+        self,
+        filter: Any = None,
+        sort: str | list[tuple[str, int]] = "_id",
+        page_size: int = 20,
+        after: str | None = None,
+        **kwargs: Any,
+    ) -> Page:
+        """Return a :class:`Page` of documents using keyset pagination.
+
+        Rather than skipping over the documents on earlier pages, each page
+        is found with a range query starting after the last document of the
+        previous page, so deep pages are as fast as the first one, given an
+        index on the sort keys. Ties are broken by ``_id``, which is added to
+        ``sort`` if it is not already there.
+
+        .. code-block:: python
+
+            @app.route("/articles")
+            def articles():
+                page = mongo.db.articles.paginate(
+                    {"published": True},
+                    sort=[("date", DESCENDING)],
+                    after=request.args.get("after"),
+                )
+                return jsonify(page)
+
+        An invalid ``after`` token, or a ``page_size`` less than 1, causes a
+        400 Bad Request HTTP status on the request.
+
+        Like those of :meth:`parallel_scan`, the ranges only match sort key
+        values of the same BSON type as those of the previous page's last
+        document, so documents whose sort keys are null, missing, or of
+        another type are skipped on later pages. Sort on fields which every
+        document has, with values of a single type.
+
+        :param dict filter: the query, as for
+           :meth:`~pymongo.collection.Collection.find`
+        :param sort: a key name to sort ascending by, or a list of
+           ``(key, direction)`` pairs
+        :param int page_size: the number of documents per page
+        :param str after: the ``next`` token of the previous page, or
+           ``None`` for the first page
+        :param kwargs: other arguments to
+           :meth:`~pymongo.collection.Collection.find`, such as
+           ``projection``, which must include the sort keys
+        """
+        if page_size < 1:
+            abort(400, description="The page size must be at least 1.")
+        if isinstance(sort, str):
+            sort = [(sort, ASCENDING)]
+        sort = list(sort)
+        if "_id" not in (key for key, _ in sort):
+            sort.append(("_id", sort[-1][1]))
+
+        query = filter or {}
+        if after is not None:
+            after_query = _keyset_query(sort, _decode_token(after, len(sort)))
+            query = {"$and": [query, after_query]} if query else after_query
+
+        documents = list(self.find(query, sort=sort, limit=page_size + 1, **kwargs))
+        next_token = None
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            next_token = _encode_token([_get_path(documents[-1], key) for key, _ in sort])
+        return Page(documents=documents, next=next_token)
+
+    def find_arrow(self, filter: Any, schema: Any, **kwargs: Any) -> Any:
+        """Find documents, and return them as a :class:`pyarrow.Table`.
+
+        Each batch of results is decoded from BSON straight into Arrow
+        columns by `PyMongoArrow <https://mongo-arrow.readthedocs.io/>`_,
+        without creating a :class:`dict` per document, and only the fields
+        in ``schema`` are fetched. This requires the ``arrow`` extra:
+        ``pip install Flask-PyMongo[arrow]``.
+
+        .. code-block:: python
+
+            @app.route("/stats")
+            def stats():
+                table = mongo.db.orders.find_arrow({"status": "paid"}, {"total": float})
+                return {"revenue": pyarrow.compute.sum(table["total"]).as_py()}
+
+        :param dict filter: the query, as for
+           :meth:`~pymongo.collection.Collection.find`
+        :param schema: a :class:`pymongoarrow.api.Schema`, or a mapping of
+           field names to types from which to build one
+        :param kwargs: other arguments to
+           :meth:`~pymongo.collection.Collection.find_raw_batches`
+        """
+        return columnar.find_table(self, filter, schema, **kwargs)
+
+    def find_numpy(self, filter: Any, schema: Any, **kwargs: Any) -> dict[str, Any]:
+        """Find documents, and return them as a :class:`dict` mapping field
+        names to NumPy arrays.
+
+        This is :meth:`find_arrow`, with each column converted to a
+        :class:`numpy.ndarray`.
+        """
+        table = columnar.find_table(self, filter, schema, **kwargs)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+
+    def send_columns(
+        self,
+        filter: Any,
+        schema: Any,
+        format: str = "arrow",
+        filename: str | None = None,
+        **kwargs: Any,
+    ) -> Response:
+        """Respond with documents as an Arrow IPC stream, or as CSV.
+
+        Documents are decoded batch by batch as in :meth:`find_arrow`, and
+        each batch is sent as soon as it is encoded, so an export of any
+        size is streamed in constant memory.
+
+        .. code-block:: python
+
+            @app.route("/orders.csv")
+            def export_orders():
+                return mongo.db.orders.send_columns(
+                    {}, {"_id": ObjectId, "total": float, "date": datetime}, format="csv"
+                )
+
+        :param dict filter: the query, as for
+           :meth:`~pymongo.collection.Collection.find`
+        :param schema: a :class:`pymongoarrow.api.Schema`, or a mapping of
+           field names to types from which to build one
+        :param str format: ``"arrow"`` or ``"csv"``
+        :param str filename: if given, send the response as an attachment
+           with this filename
+        :param kwargs: other arguments to
+           :meth:`~pymongo.collection.Collection.find_raw_batches`
+        """
+        if format == "arrow":
+            stream, mimetype = columnar.stream_ipc, "application/vnd.apache.arrow.stream"
+        elif format == "csv":
+            stream, mimetype = columnar.stream_csv, "text/csv"
+        else:
+            raise ValueError("'format' must be 'arrow' or 'csv'")
+        # Fail here, rather than once the response has started streaming.
+        schema = columnar.make_schema(schema)
+        batches = columnar.find_record_batches(self, filter, schema, **kwargs)
+        response = current_app.response_class(stream(batches, schema), mimetype=mimetype)
+        if filename is not None:
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    def parallel_scan(
+        self,
+        filter: Any = None,
+        partitions: int = 4,
+        callback: Callable[[Any], Any] | None = None,
+        workers: int | None = None,
+        checkpoint: str | None = None,
+        checkpoint_every: int = 1000,
+        progress: Callable[[ScanProgress], Any] | None = None,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        """Scan the collection with one cursor per ``_id`` range, on a pool
+        of threads, and iterate over the documents found.
+
+        The collection is split into ``partitions`` ranges of about equal
+        size, placed by ``$bucketAuto`` over a ``$sample`` of ``_id``
+        values, and each range is read
+        by its own thread and connection. Documents arrive in ``_id`` order
+        within each range, and in no particular order across ranges.
+
+        .. code-block:: python
+
+            @app.cli.command("rollup")
+            def rollup():
+                for _ in mongo.db.events.parallel_scan(
+                    {"processed": False}, partitions=8, callback=process_event
+                ):
+                    pass
+
+        If ``callback`` is given, it is called on each document by the
+        thread reading it, and its results are iterated over instead. With
+        a ``checkpoint`` name, the position reached in each range is saved
+        in the ``<collection>.scan_checkpoints`` collection every
+        ``checkpoint_every`` documents, and when the scan is interrupted,
+        so that a later scan with the same name resumes where this one
+        stopped. Documents are only counted as processed once the next one
+        is requested, so a resumed scan may repeat a few, but never skips
+        any. The checkpoint is removed when the scan completes. Resuming
+        with a different ``filter`` or number of ``partitions`` than the
+        checkpoint was saved with raises :class:`ValueError`.
+
+        Ranges are compared with ``$gte`` and ``$lt``, which only match
+        ``_id`` values of the same BSON type as the boundaries, so all
+        ``_id`` values should be of one type, such as
+        :class:`~bson.objectid.ObjectId`.
+
+        :param dict filter: the query, as for
+           :meth:`~pymongo.collection.Collection.find`
+        :param int partitions: the number of ranges to split the collection
+           into
+        :param callback: a function applied to each document
+        :param int workers: the number of threads; by default, one per range
+        :param str checkpoint: the name under which to save progress
+        :param int checkpoint_every: the number of documents between
+           checkpoints and calls to ``progress``
+        :param progress: a function called with a
+           :class:`~flask_pymongo.scan.ScanProgress` every
+           ``checkpoint_every`` documents, and whenever a range is done
+        :param kwargs: other arguments to
+           :meth:`~pymongo.collection.Collection.find`, such as
+           ``projection``, but not ``sort``, since each range is read in
+           ``_id`` order
+        """
+        if "sort" in kwargs:
+            raise ValueError("parallel_scan reads each range in _id order, and takes no 'sort'")
+        return scan.parallel_scan(
+            self,
+            filter,
+            partitions,
+            callback,
+            workers,
+            checkpoint,
+            checkpoint_every,
+            progress,
+            **kwargs,
+        )
+
+    def buffer_write(self, *requests: Any, ordered: bool = True) -> None:
+        """Queue write operations until the end of the app context.
+
+        Queued operations are sent to the server with one
+        :meth:`~pymongo.collection.Collection.bulk_write` per collection
+        when the app context is torn down, or earlier by calling
+        :meth:`~flask_pymongo.PyMongo.flush_writes`, saving a round trip
+        per operation. Writes queued with ``ordered=True`` and
+        ``ordered=False`` are sent as separate batches.
+
+        .. code-block:: python
+
+            from pymongo import InsertOne, UpdateOne
+
+
+            @app.route("/article/<ObjectId:article_id>")
+            def article(article_id):
+                mongo.db.audit.buffer_write(InsertOne({"viewed": article_id}))
+                mongo.db.counters.buffer_write(
+                    UpdateOne({"_id": article_id}, {"$inc": {"views": 1}}, upsert=True),
+                    ordered=False,
+                )
+                return render_template("article.html", ...)
+
+        Writes still queued when a request fails with an unhandled
+        exception are discarded. Failures while flushing at teardown are
+        logged to the app's logger, since the response has already been
+        sent.
+
+        :param requests: :class:`~pymongo.operations.InsertOne`,
+           :class:`~pymongo.operations.UpdateOne` or other bulk write
+           operations
+        :param bool ordered: send the operations as an ordered bulk write
+        """
+        buffers = g.setdefault("_pymongo_write_buffers", {})
+        key = (id(self.database.client), self.full_name, ordered)
+        if key not in buffers:
+            buffers[key] = (self, [])
+        buffers[key][1].extend(requests)
+
+
+# The Collection methods which send one command when called, and run in a
+# slot of the client's ConcurrencyLimiter while serving a request. Cursors
+# fetch their batches later, when iterated, and are not limited.
+_LIMITED_METHODS = (
+    "aggregate",
+    "bulk_write",
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "distinct",
+    "estimated_document_count",
+    "find_one",
+    "find_one_and_delete",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "insert_many",
+    "insert_one",
+    "replace_one",
+    "update_many",
+    "update_one",
+)
+
+
+def _limited(name: str) -> Callable[..., Any]:
+    method = getattr(collection.Collection, name)
+
+    @functools.wraps(method)
+    def limited(self: Collection, *args: Any, **kwargs: Any) -> Any:
+        with self._slot():
+            return method(self, *args, **kwargs)
+
+    return limited
+
+
+for _name in _LIMITED_METHODS:
+    setattr(Collection, _name, _limited(_name))
+
+
+def _get_path(document: Any, key: str | None) -> Any:
+    if key is None:
+        return None
+    for part in key.split("."):
+        document = document.get(part) if hasattr(document, "get") else None
+    return document
+
+
+def _version_etag(document: Any, version_field: str | None) -> str | None:
+    version = _get_path(document, version_field)
+    if version is None:
+        return None
+    return hashlib.sha1(bson.encode({"v": version})).hexdigest()
+
+
+def _conditional_response(
+    etag: str | None, last_modified: datetime | None, response: Response | None = None
+) -> Response:
+    if response is None:
+        response = current_app.response_class()
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.make_conditional(request)
+    return response
+
+
+def _keyset_query(sort: list[tuple[str, int]], values: list[Any]) -> dict[str, Any]:
+    """Match documents sorting after ``values`` in ``sort`` order."""
+    clauses = []
+    for i, (key, direction) in enumerate(sort):
+        clause: dict[str, Any] = {k: v for (k, _), v in zip(sort[:i], values[:i])}
+        clause[key] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def _encode_token(values: list[Any]) -> str:
+    return base64.urlsafe_b64encode(bson.encode({"v": values})).rstrip(b"=").decode("ascii")
+
+
+def _decode_token(token: str, length: int) -> list[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = bson.decode(raw)["v"]
+    except (BSONError, binascii.Error, KeyError, TypeError, ValueError):
+        abort(400)
+    if not isinstance(values, list) or len(values) != length:
+        abort(400)
+    return values
+
+
+def _flush_write_buffers(client: Any) -> list[tuple[Any, dict[str, Any]]]:
+    """Send the writes buffered for ``client``, and return their failures."""
+    buffers = g.get("_pymongo_write_buffers")
+    if not buffers:
+        return []
+
+    failures: list[tuple[Any, dict[str, Any]]] = []
+    for key in [key for key in buffers if key[0] == id(client)]:
+        coll, requests = buffers.pop(key)
+        try:
+            coll.bulk_write(requests, ordered=key[2])
+        except BulkWriteError as exc:
+            for error in exc.details.get("writeErrors", []):
+                failures.append((requests[error["index"]], error))
+            for error in exc.details.get("writeConcernErrors", []):
+                failures.append((None, error))
+        except PyMongoError as exc:
+            # Not sent, as when the server is unreachable: report the batch,
+            # and send the other collections' buffers.
+            failures.append((None, {"errmsg": str(exc), "ns": coll.full_name}))
+    return failures
+
+
+def _discard_write_buffers(client: Any) -> None:
+    buffers = g.get("_pymongo_write_buffers")
+    if buffers:
+        for key in [key for key in buffers if key[0] == id(client)]:
+            del buffers[key]
@@ -0,0 +1,232 @@
+# Copyright (c) 2011-2017, Dan Crosta
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+from __future__ import annotations
+
+__all__ = ("BackgroundWriter",)
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any
+
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class _Flush:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """Inserts documents from a background thread, off the request path.
+
+    Documents passed to :meth:`insert` are queued and written with
+    :meth:`~pymongo.collection.Collection.insert_many` by a daemon thread,
+    in batches of up to ``batch_size`` documents, at least every
+    ``flush_interval`` seconds. Use it for analytics and event
+    logging, where losing a write is acceptable but waiting for it is not.
+
+    .. code-block:: python
+
+        @app.route("/article/<ObjectId:article_id>")
+        def article(article_id):
+            mongo.writer.insert("events", {"type": "view", "article": article_id})
+            return render_template("article.html", ...)
+
+    At most ``max_queue_size`` documents may be waiting to be written;
+    further documents are dropped (or, with ``block=True``, wait for room).
+    The thread is started on first use, and again in a forked child
+    process, so a writer may be created before a pre-forking server forks.
+    Pending documents are flushed when the process exits.
+
+    A :class:`BackgroundWriter` is created by :meth:`~flask_pymongo.PyMongo.init_app`
+    as :attr:`~flask_pymongo.PyMongo.writer` if the URI names a database,
+    configured by the ``MONGO_WRITER_MAX_QUEUE_SIZE``,
+    ``MONGO_WRITER_BATCH_SIZE`` and ``MONGO_WRITER_FLUSH_INTERVAL`` Flask
+    configuration variables.
+
+    :param database: the database to write to
+    :param int max_queue_size: the maximum number of unwritten documents
+    :param int batch_size: the maximum number of documents per
+       ``insert_many``
+    :param float flush_interval: the maximum number of seconds a document
+       waits for its batch to fill
+    """
+
+    def __init__(
+        self,
+        database: Database[Any],
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.database = database
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._registered = False
+        self._queue: queue.SimpleQueue[Any] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._unwritten = 0
+        self._counters = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Counts of documents ``queued``, ``written``, ``dropped`` because
+        the queue was full, and ``failed`` to be written, plus the number
+        currently ``pending``.
+        """
+        with self._lock:
+            return dict(self._counters, pending=self._unwritten)
+
+    def insert(
+        self, collection: str, document: Any, block: bool = False, timeout: float | None = None
+    ) -> bool:
+        """Queue ``document`` to be inserted into ``collection``.
+
+        Return ``True`` if the document was queued, or ``False`` if it was
+        dropped because the queue was full.
+
+        :param str collection: the name of the collection to insert into
+        :param dict document: the document to insert
+        :param bool block: if the queue is full, wait for room instead of
+           dropping the document
+        :param float timeout: the maximum number of seconds to wait for room
+           when ``block`` is true
+        """
+        self._ensure_started()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._unwritten < self.max_queue_size:
+                    self._unwritten += 1
+                    self._counters["queued"] += 1
+                    break
+                if not block or (deadline is not None and time.monotonic() >= deadline):
+                    self._counters["dropped"] += 1
+                    return False
+            time.sleep(0.01)
+        self._queue.put((collection, document))
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Write all queued documents now.
+
+        Return ``True`` once they are written, or ``False`` if ``timeout``
+        seconds pass first.
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """Write all queued documents and stop the thread."""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = self._pid = None
+
+    def _ensure_started(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if not self._registered:
+                atexit.register(self.close)
+                self._registered = True
+            if self._thread is not None:
+                # Forked: the parent's queue and thread are not ours.
+                self._queue = queue.SimpleQueue()
+                self._unwritten = 0
+            self._thread = threading.Thread(
+                target=self._run, name="flask_pymongo.BackgroundWriter", daemon=True
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self) -> None:
+        batches: dict[str, list[Any]] = {}
+        size = 0
+        deadline: float | None = None
+        while True:
+            wait = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                collection, document = item
+                batches.setdefault(collection, []).append(document)
+                size += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if size < self.batch_size:
+                    continue
+
+            try:
+                self._write(batches)
+            finally:
+                batches, size, deadline = {}, 0, None
+                if isinstance(item, _Flush):
+                    item.done.set()
+            if item is _STOP:
+                return
+
+    def _write(self, batches: dict[str, list[Any]]) -> None:
+        for collection, documents in batches.items():
+            written = len(documents)
+            try:
+                self.database[collection].insert_many(documents, ordered=False)
+            except BulkWriteError as exc:
+                written = exc.details.get("nInserted", 0)
+                logger.error("Background insert into %r failed: %s", collection, exc)
+            except Exception as exc:
+                # Such as InvalidDocument, which is not a PyMongoError: one
+                # bad document must not stop the thread.
+                written = 0
+                logger.error("Background insert into %r failed: %s", collection, exc)
+            with self._lock:
+                self._unwritten -= len(documents)
+                self._counters["written"] += written
+                self._counters["failed"] += len(documents) - written
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+from flask_pymongo.changes import ChangeHub
+from flask_pymongo.wrappers import MongoClient
+
+from .util import FlaskPyMongoTest
+
+
+class ChangeStreamTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.cx is not None
+        if "setName" not in self.mongo.cx.admin.command("hello"):
+            pytest.skip("change streams require a replica set")
+        assert self.mongo.db is not None
+        self.mongo.db.create_collection("messages")
+
+    def test_subscriptions_share_a_stream(self):
+        assert self.mongo.db is not None
+        everything = self.mongo.subscribe("messages")
+        room_b = self.mongo.subscribe(
+            "messages", filter=lambda change: change["fullDocument"]["room"] == "b"
+        )
+        assert len(self.mongo._changes.streams) == 1
+        self.mongo.db.messages.insert_many([{"room": "a"}, {"room": "b"}])
+
+        assert everything.get(timeout=5)["fullDocument"]["room"] == "a"
+        assert everything.get(timeout=5)["fullDocument"]["room"] == "b"
+        assert room_b.get(timeout=5)["fullDocument"]["room"] == "b"
+
+        everything.close()
+        room_b.close()
+        assert self.mongo._changes.streams == {}
+
+    def test_it_disconnects_slow_subscribers(self):
+        assert self.mongo.db is not None
+        with self.mongo.subscribe("messages", max_queue=1, on_overflow="disconnect") as slow:
+            self.mongo.db.messages.insert_many([{"room": "a"}, {"room": "b"}])
+            with self.mongo.subscribe("messages") as other:
+                other.get(timeout=5)
+
+            assert slow.closed
+
+    def test_send_changes(self):
+        @self.app.route("/live")
+        def live():
+            return self.mongo.send_changes("messages", heartbeat=0.1)
+
+        response = self.app.test_client().get("/live", buffered=False)
+        assert response.mimetype == "text/event-stream"
+        events = response.iter_encoded()
+        assert next(events) == b": subscribed\n\n"
+
+        assert self.mongo.db is not None
+        self.mongo.db.messages.insert_one({"_id": 1, "room": "a"})
+
+        event = next(events)
+        while event == b": heartbeat\n\n":
+            event = next(events)
+        assert event.startswith(b"id: ")
+        assert b'"fullDocument": {"_id": 1, "room": "a"}' in event
+        response.close()
+
+    def test_send_changes_unsubscribes_unread_responses(self):
+        @self.app.route("/live")
+        def live():
+            return self.mongo.send_changes("messages")
+
+        response = self.app.test_client().head("/live")
+        assert response.status_code == 200
+        response.close()
+
+        assert self.mongo._changes.streams == {}
+
+
+class ChangeStreamErrorTest(FlaskPyMongoTest):
+    def test_it_raises_when_the_stream_cannot_be_opened(self):
+        down = MongoClient("mongodb://localhost:1", serverSelectionTimeoutMS=50)
+        self.addCleanup(down.close)
+        hub = ChangeHub()
+
+        with pytest.raises(ServerSelectionTimeoutError):
+            hub.subscribe(down[self.dbname].messages)
+
+        assert hub.streams == {}
+
+    def test_it_raises_when_the_stream_opens_too_slowly(self):
+        down = MongoClient("mongodb://localhost:1", serverSelectionTimeoutMS=1000)
+        self.addCleanup(down.close)
+        hub = ChangeHub()
+
+        with pytest.raises(TimeoutError):
+            hub.subscribe(down[self.dbname].messages, ready_timeout=0.05)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from .util import FlaskPyMongoTest
+
+pyarrow_ipc = pytest.importorskip("pyarrow.ipc")
+pytest.importorskip("pymongoarrow")
+
+
+class ColumnarTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        self.schema = {"n": int, "x": float, "name": str}
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_many(
+            [{"n": n, "x": n / 2, "name": f"thing {n}", "other": [n]} for n in range(1000)]
+        )
+
+    def test_find_arrow(self):
+        assert self.mongo.db is not None
+        table = self.mongo.db.things.find_arrow({"n": {"$lt": 500}}, self.schema, batch_size=100)
+
+        assert table.column_names == ["n", "x", "name"]
+        assert table.num_rows == 500
+        assert table.column("x").to_pylist()[:3] == [0.0, 0.5, 1.0]
+
+    def test_find_numpy(self):
+        assert self.mongo.db is not None
+        columns = self.mongo.db.things.find_numpy({}, {"n": int}, sort=[("n", -1)])
+
+        assert list(columns) == ["n"]
+        assert columns["n"].sum() == sum(range(1000))
+        assert columns["n"][0] == 999
+
+    def test_send_columns_as_arrow(self):
+        assert self.mongo.db is not None
+        resp = self.mongo.db.things.send_columns({}, self.schema, batch_size=100)
+
+        assert resp.mimetype == "application/vnd.apache.arrow.stream"
+        table = pyarrow_ipc.open_stream(resp.get_data()).read_all()
+        assert table.num_rows == 1000
+        assert table.column("name").to_pylist()[-1] == "thing 999"
+
+    def test_send_columns_as_csv(self):
+        assert self.mongo.db is not None
+        resp = self.mongo.db.things.send_columns(
+            {"n": {"$lt": 2}}, self.schema, format="csv", filename="things.csv", sort=[("n", 1)]
+        )
+
+        assert resp.mimetype == "text/csv"
+        assert resp.headers["Content-Disposition"] == "attachment; filename=things.csv"
+        assert resp.get_data() == b'"n","x","name"\n0,0,"thing 0"\n1,0.5,"thing 1"\n'
+
+    def test_send_columns_rejects_unknown_formats(self):
+        assert self.mongo.db is not None
+        with pytest.raises(ValueError):
+            self.mongo.db.things.send_columns({}, self.schema, format="xml")
+
+    def test_send_columns_rejects_invalid_schemas_before_responding(self):
+        assert self.mongo.db is not None
+        with pytest.raises(ValueError):
+            self.mongo.db.things.send_columns({}, {"n": object})
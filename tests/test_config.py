@@ -9,7 +9,7 @@ import pytest
 
 import flask_pymongo
 
-from .util import FlaskRequestTest
+from .util import FlaskPyMongoTest, FlaskRequestTest
 
 
 class CouldNotConnect(Exception):
@@ -118,6 +118,67 @@ class FlaskPyMongoConfigTest(FlaskRequestTest):
 
         assert mongo.db is None
 
+    def test_db_can_be_assigned(self):
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert mongo.cx is not None
+
+        mongo.db = mongo.cx.other
+
+        assert mongo.db is not None
+        assert mongo.db.name == "other"
+
+
+class RequestTimeoutTest(FlaskPyMongoTest):
+    def make_mongo(self, **config):
+        self.app.config.update(config)
+        mongo = flask_pymongo.PyMongo(self.app, f"mongodb://localhost:{self.port}/{self.dbname}")
+        assert mongo.cx is not None
+        self.addCleanup(mongo.cx.close)
+
+        @self.app.route("/slow")
+        def slow():
+            assert mongo.db is not None
+            time.sleep(0.05)
+            return {"found": mongo.db.things.find_one() is not None}
+
+        @self.app.route("/duplicate")
+        def duplicate():
+            assert mongo.db is not None
+            mongo.db.things.insert_one({"_id": "thing"})
+            mongo.db.things.insert_one({"_id": "thing"})
+            return "unreachable"
+
+        return mongo
+
+    def test_it_fails_operations_past_the_budget(self):
+        self.make_mongo(MONGO_REQUEST_TIMEOUT=0.01)
+
+        assert self.app.test_client().get("/slow").status_code == 503
+
+    def test_it_takes_the_budget_from_a_header(self):
+        self.make_mongo(MONGO_TIMEOUT_HEADER="X-Timeout-Ms", MONGO_TIMEOUT_STATUS=504)
+        client = self.app.test_client()
+
+        assert client.get("/slow", headers={"X-Timeout-Ms": "10"}).status_code == 504
+        assert client.get("/slow", headers={"X-Timeout-Ms": "5000"}).json == {"found": False}
+        assert client.get("/slow").json == {"found": False}
+
+    def test_it_uses_the_smaller_budget(self):
+        self.make_mongo(MONGO_REQUEST_TIMEOUT=5, MONGO_TIMEOUT_HEADER="X-Timeout-Ms")
+
+        response = self.app.test_client().get("/slow", headers={"X-Timeout-Ms": "10"})
+        assert response.status_code == 503
+
+    def test_it_leaves_other_errors_alone(self):
+        self.make_mongo(MONGO_REQUEST_TIMEOUT=5)
+
+        assert self.app.test_client().get("/duplicate").status_code == 500
+
+    def test_it_rejects_unknown_statuses(self):
+        with pytest.raises(ValueError):
+            self.make_mongo(MONGO_REQUEST_TIMEOUT=5, MONGO_TIMEOUT_STATUS=299)
+
 
 def _wait_until_connected(mongo, timeout=1.0):
     start = time.time()
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import itertools
+import tarfile
+import threading
 import warnings
+import zipfile
 from hashlib import md5, sha1
 from io import BytesIO
 
 import pytest
 from bson.objectid import ObjectId
 from gridfs import GridFS
-from werkzeug.exceptions import NotFound
+from werkzeug.exceptions import BadRequest, Conflict, NotFound, RequestEntityTooLarge
+
+from flask_pymongo.archive import _prefetch
 
 from .util import FlaskPyMongoTest
 
@@ -124,3 +130,298 @@ class TestSendFile(GridFSCleanupMixin, FlaskPyMongoTest):
     def test_it_streams_results(self):
         resp = self.mongo.send_file("myfile.txt")
         assert resp.is_streamed
+
+
+class TestSendFileById(GridFSCleanupMixin, FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        self.myfile = BytesIO(b"a" * 500 * 1024)
+        self.file_id = self.mongo.save_file("myfile.txt", self.myfile)
+        self.sha1 = sha1(self.myfile.getvalue()).hexdigest()
+
+        @self.app.route("/files/<ObjectId:file_id>/<sha1>/<path:filename>")
+        def get_file(file_id, sha1, filename):
+            return self.mongo.send_file_by_id(file_id, sha1=sha1)
+
+    def test_it_404s_for_missing_files(self):
+        with pytest.raises(NotFound):
+            self.mongo.send_file_by_id(ObjectId())
+
+    def test_it_404s_for_the_wrong_sha1(self):
+        with pytest.raises(NotFound):
+            self.mongo.send_file_by_id(self.file_id, sha1="0" * 40)
+
+    def test_it_sends_immutable_files(self):
+        resp = self.mongo.send_file_by_id(self.file_id, sha1=self.sha1)
+        assert resp.content_type.startswith("text/plain")
+        assert resp.content_length == len(self.myfile.getvalue())
+        assert resp.cache_control.immutable
+        assert resp.cache_control.max_age == 31536000
+
+    def test_it_builds_urls(self):
+        url = self.mongo.file_url("get_file", self.file_id)
+        assert url == f"/files/{self.file_id}/{self.sha1}/myfile.txt"
+
+        resp = self.app.test_client().get(url)
+        assert resp.status_code == 200
+        assert resp.get_data() == self.myfile.getvalue()
+
+
+class TestSaveStream(GridFSCleanupMixin, FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        # make it bigger than 1 gridfs chunk
+        self.data = b"a" * 500 * 1024
+
+    def test_it_saves_multipart_files(self):
+        form = {"name": "value", "file": (BytesIO(self.data), "my-file.txt")}
+        with self.app.test_request_context(method="POST", data=form):
+            file_id = self.mongo.save_stream()
+
+        assert self.mongo.db is not None
+        gridfile = GridFS(self.mongo.db).get(file_id)
+        assert gridfile.filename == "my-file.txt"
+        assert gridfile.content_type == "text/plain"
+        assert gridfile.read() == self.data
+        assert gridfile.sha1 == sha1(self.data).hexdigest()
+
+    def test_it_saves_raw_bodies(self):
+        with self.app.test_request_context(
+            method="POST", data=self.data, content_type="application/octet-stream"
+        ):
+            file_id = self.mongo.save_stream("my-file", foo="bar")
+
+        assert self.mongo.db is not None
+        gridfile = GridFS(self.mongo.db).get(file_id)
+        assert gridfile.read() == self.data
+        assert gridfile.content_type == "application/octet-stream"
+        assert gridfile.foo == "bar"
+
+    def test_it_400s_without_the_file_field(self):
+        form = {"other": (BytesIO(self.data), "my-file.txt")}
+        with self.app.test_request_context(method="POST", data=form):
+            with pytest.raises(BadRequest):
+                self.mongo.save_stream()
+
+    def test_it_400s_for_files_without_a_filename(self):
+        form = {"file": (BytesIO(self.data), "")}
+        with self.app.test_request_context(method="POST", data=form):
+            with pytest.raises(BadRequest):
+                self.mongo.save_stream()
+
+    def test_it_400s_for_truncated_bodies(self):
+        body = (
+            b'--b\r\nContent-Disposition: form-data; name="file"; filename="my-file.txt"\r\n\r\n'
+            + self.data
+        )
+        content_type = "multipart/form-data; boundary=b"
+        with self.app.test_request_context(method="POST", data=body, content_type=content_type):
+            with pytest.raises(BadRequest):
+                self.mongo.save_stream()
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.fs.files.count_documents({}) == 0
+        assert self.mongo.db.fs.chunks.count_documents({}) == 0
+
+    def test_it_enforces_max_size(self):
+        form = {"file": (BytesIO(self.data), "my-file.txt")}
+        with self.app.test_request_context(method="POST", data=form):
+            with pytest.raises(RequestEntityTooLarge):
+                self.mongo.save_stream(max_size=300 * 1024)
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.fs.files.count_documents({}) == 0
+        assert self.mongo.db.fs.chunks.count_documents({}) == 0
+
+
+class TestResumableUploads(GridFSCleanupMixin, FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        # make it bigger than 1 gridfs chunk
+        self.data = bytes(range(256)) * 2048
+        self.uploads = self.mongo.resumable_uploads()
+
+    def test_it_assembles_appended_ranges(self):
+        upload_id = self.uploads.create("my-file.txt", foo="bar")
+        offset = self.uploads.append(upload_id, self.data[:1000], 0)
+        offset = self.uploads.append(upload_id, BytesIO(self.data[1000:300000]), offset)
+        assert self.uploads.offset(upload_id) == 300000
+        self.uploads.append(upload_id, self.data[300000:], offset)
+        file_id = self.uploads.finalize(upload_id)
+
+        assert self.mongo.db is not None
+        gridfile = GridFS(self.mongo.db).get(file_id)
+        assert gridfile.filename == "my-file.txt"
+        assert gridfile.content_type == "text/plain"
+        assert gridfile.foo == "bar"
+        assert gridfile.read() == self.data
+
+        chunk_digests = b"".join(
+            sha1(self.data[i : i + gridfile.chunk_size]).digest()
+            for i in range(0, len(self.data), gridfile.chunk_size)
+        )
+        assert gridfile.etag == f"{sha1(chunk_digests).hexdigest()}-3"
+        assert not hasattr(gridfile, "sha1")
+
+        with pytest.raises(NotFound):
+            self.uploads.offset(upload_id)
+
+    def test_it_409s_for_the_wrong_offset(self):
+        upload_id = self.uploads.create("my-file.txt")
+        self.uploads.append(upload_id, self.data[:1000], 0)
+        with pytest.raises(Conflict):
+            self.uploads.append(upload_id, self.data[500:1000], 500)
+
+    def test_it_409s_while_another_append_is_running(self):
+        upload_id = self.uploads.create("my-file.txt")
+        self.uploads._claim(upload_id, 0)
+
+        with pytest.raises(Conflict):
+            self.uploads.append(upload_id, self.data[:1000], 0)
+        with pytest.raises(Conflict):
+            self.uploads.finalize(upload_id)
+
+    def test_it_removes_chunks_of_failed_appends(self):
+        assert self.mongo.db is not None
+        upload_id = self.uploads.create("my-file.txt", chunk_size=1000)
+        self.uploads.append(upload_id, self.data[:1500], 0)
+        # Left by an append which failed after writing further chunks.
+        self.mongo.db.fs.chunks.insert_one({"files_id": upload_id, "n": 5, "data": b"x"})
+
+        file_id = self.uploads.finalize(upload_id)
+
+        assert self.mongo.db.fs.chunks.count_documents({"files_id": file_id}) == 2
+        assert GridFS(self.mongo.db).get(file_id).read() == self.data[:1500]
+
+    def test_it_404s_for_unknown_uploads(self):
+        with pytest.raises(NotFound):
+            self.uploads.append(ObjectId(), self.data, 0)
+
+    def test_it_enforces_max_size(self):
+        self.app.config["MONGO_MAX_UPLOAD_SIZE"] = 1000
+        uploads = self.mongo.resumable_uploads()
+        upload_id = uploads.create("my-file.txt")
+        with pytest.raises(RequestEntityTooLarge):
+            uploads.append(upload_id, self.data, 0)
+
+    def test_it_cleans_up_expired_uploads(self):
+        uploads = self.mongo.resumable_uploads(expire_after=-1)
+        upload_id = uploads.create("my-file.txt")
+        uploads.append(upload_id, self.data, 0)
+        live_id = self.uploads.create("other-file.txt")
+
+        assert uploads.cleanup() == 1
+        assert self.mongo.db is not None
+        assert self.mongo.db.fs.chunks.count_documents({"files_id": upload_id}) == 0
+        assert self.uploads.offset(live_id) == 0
+
+
+class TestSendArchive(GridFSCleanupMixin, FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        self.files = {
+            "a.txt": b"a" * 300 * 1024,
+            "b.bin": bytes(range(256)) * 10,
+            "empty": b"",
+        }
+        for filename, data in self.files.items():
+            self.mongo.save_file(filename, BytesIO(b"old revision"))
+            self.mongo.save_file(filename, BytesIO(data), tag="archive")
+
+    def test_it_sends_stored_zips(self):
+        resp = self.mongo.send_archive(list(self.files))
+        data = b"".join(resp.iter_encoded())
+
+        assert resp.mimetype == "application/zip"
+        assert resp.content_length == len(data)
+        archive = zipfile.ZipFile(BytesIO(data))
+        assert archive.testzip() is None
+        for filename, contents in self.files.items():
+            assert archive.read(filename) == contents
+
+    def test_it_sends_deflated_zips(self):
+        resp = self.mongo.send_archive({"tag": "archive"}, deflate=True)
+        data = b"".join(resp.iter_encoded())
+
+        assert resp.content_length is None
+        archive = zipfile.ZipFile(BytesIO(data))
+        for filename, contents in self.files.items():
+            assert archive.read(filename) == contents
+            assert archive.getinfo(filename).compress_type == zipfile.ZIP_DEFLATED
+
+    def test_it_sends_tars(self):
+        resp = self.mongo.send_archive(list(self.files), format="tar")
+        data = b"".join(resp.iter_encoded())
+
+        assert resp.mimetype == "application/x-tar"
+        assert resp.content_length == len(data)
+        archive = tarfile.open(fileobj=BytesIO(data))
+        for filename, contents in self.files.items():
+            member = archive.extractfile(filename)
+            assert member is not None
+            assert member.read() == contents
+
+    def test_it_404s_for_missing_files(self):
+        with pytest.raises(NotFound):
+            self.mongo.send_archive(["a.txt", "nonexistent.txt"])
+
+    def test_prefetching_closes_abandoned_iterators(self):
+        closed = threading.Event()
+
+        def numbers():
+            try:
+                yield from itertools.count()
+            finally:
+                closed.set()
+
+        items = _prefetch(numbers(), 2)
+        next(items)
+        items.close()
+
+        assert closed.wait(5)
+
+
+class TestPruneGridFS(GridFSCleanupMixin, FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        for revision in range(3):
+            self.mongo.save_file("a.txt", BytesIO(b"a%d" % revision))
+        self.mongo.save_file("b.txt", BytesIO(b"b"))
+
+    def test_it_keeps_the_latest_revisions(self):
+        result = self.mongo.prune_gridfs(keep=2, pause=0)
+
+        assert result.revisions == 1
+        assert self.mongo.db is not None
+        gridfs = GridFS(self.mongo.db)
+        assert gridfs.get_version("a.txt", 0).read() == b"a1"
+        assert gridfs.get_version("a.txt", -1).read() == b"a2"
+        assert gridfs.get_version("b.txt").read() == b"b"
+        assert self.mongo.db.fs.chunks.count_documents({}) == 3
+
+    def test_it_deletes_orphaned_chunks(self):
+        assert self.mongo.db is not None
+        gridout = GridFS(self.mongo.db).find_one({"filename": "b.txt"})
+        assert gridout is not None
+        file_id = gridout._id
+        self.mongo.db.fs.files.delete_one({"_id": file_id})
+        upload_id = self.mongo.resumable_uploads().create("c.txt", chunk_size=1)
+        self.mongo.resumable_uploads().append(upload_id, b"cc", 0)
+
+        assert self.mongo.prune_gridfs(keep=3, pause=0) == (0, 0)
+        result = self.mongo.prune_gridfs(keep=3, min_age=-60, pause=0, dry_run=True)
+        assert result == (0, 1)
+        assert self.mongo.db.fs.chunks.count_documents({"files_id": file_id}) == 1
+
+        self.mongo.prune_gridfs(keep=3, min_age=-60, pause=0)
+        assert self.mongo.db.fs.chunks.count_documents({"files_id": file_id}) == 0
+        assert self.mongo.db.fs.chunks.count_documents({"files_id": upload_id}) == 2
+
+    def test_it_requires_a_revision(self):
+        with pytest.raises(ValueError):
+            self.mongo.prune_gridfs(keep=0)
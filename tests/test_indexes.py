@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+from pymongo import DESCENDING, GEOSPHERE, TEXT
+
+import flask_pymongo
+
+from .util import FlaskPyMongoTest
+
+
+class IndexTest(FlaskPyMongoTest):
+    def statuses(self, report):
+        return {
+            (status.namespace.split(".", 1)[1], status.name): status.status for status in report
+        }
+
+    def test_it_reports_missing_indexes(self):
+        self.mongo.declare_index("users", "email", unique=True)
+
+        assert self.statuses(self.mongo.check_indexes()) == {("users", "email_1"): "missing"}
+
+    def test_it_creates_missing_indexes(self):
+        self.mongo.declare_index("users", [("email", DESCENDING)], unique=True)
+
+        report = self.mongo.ensure_indexes()
+
+        assert self.statuses(report) == {("users", "email_-1"): "created"}
+        assert self.statuses(self.mongo.check_indexes()) == {("users", "email_-1"): "ok"}
+
+    def test_it_reports_created_indexes_once(self):
+        self.mongo.declare_index("posts", [("title", TEXT), ("body", TEXT)], weights={"title": 5})
+        self.mongo.declare_index("places", [("location", GEOSPHERE)])
+
+        assert self.statuses(self.mongo.ensure_indexes()) == {
+            ("posts", "title_text_body_text"): "created",
+            ("places", "location_2dsphere"): "created",
+        }
+        assert self.statuses(self.mongo.ensure_indexes()) == {
+            ("posts", "title_text_body_text"): "ok",
+            ("places", "location_2dsphere"): "ok",
+        }
+
+    def test_it_warns_about_missing_indexes_on_the_first_request(self):
+        self.app.config["MONGO_CHECK_INDEXES"] = True
+        mongo = flask_pymongo.PyMongo(self.app, f"mongodb://localhost:{self.port}/{self.dbname}")
+        mongo.declare_index("users", "email")
+
+        with self.assertLogs(self.app.logger, "WARNING") as logs:
+            self.app.test_client().get("/")
+        assert mongo.cx is not None
+        mongo.cx.close()
+
+        assert any("email_1" in line and "missing" in line for line in logs.output)
+
+    def test_it_reports_drift(self):
+        assert self.mongo.db is not None
+        self.mongo.db.users.create_index("email")
+        self.mongo.db.users.create_index("name")
+        self.mongo.declare_index("users", "email", unique=True)
+
+        assert self.statuses(self.mongo.check_indexes()) == {
+            ("users", "email_1"): "changed",
+            ("users", "name_1"): "undeclared",
+        }
+
+    def test_it_declares_gridfs_indexes(self):
+        self.mongo.declare_gridfs_indexes()
+        self.mongo.save_file("my-file", BytesIO(b"these are the bytes"))
+
+        assert self.statuses(self.mongo.check_indexes()) == {
+            ("fs.files", "filename_1_uploadDate_1"): "ok",
+            ("fs.chunks", "files_id_1_n_1"): "ok",
+        }
+
+    def test_the_cli_command_creates_indexes(self):
+        self.mongo.declare_index("users", "email")
+        runner = self.app.test_cli_runner()
+
+        result = runner.invoke(args=["mongo", "ensure-indexes", "--dry-run"])
+        assert result.exit_code == 1
+        assert "missing" in result.output
+
+        result = runner.invoke(args=["mongo", "ensure-indexes"])
+        assert result.exit_code == 0
+        assert "created" in result.output
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import json
 
-from bson import ObjectId
+from bson import SON, ObjectId
+from bson.json_util import JSONOptions
 from flask import jsonify
 
+import flask_pymongo
+
 from .util import FlaskPyMongoTest
 
 
@@ -27,3 +30,22 @@ class JSONTest(FlaskPyMongoTest):
         resp = jsonify(curs)
         dumped = json.loads(resp.get_data().decode("utf-8"))
         self.assertEqual([{"foo": "bar"}, {"foo": "baz"}], dumped)
+
+    def test_it_decodes_json(self):
+        loaded = self.app.json.loads(b'{"foo": ["bar", 1]}')
+        self.assertEqual(loaded, {"foo": ["bar", 1]})
+
+    def test_it_decodes_extended_json(self):
+        loaded = self.app.json.loads('{"id": {"$oid": "5cf29abb5167a14c9e6e12c4"}}')
+        self.assertEqual(loaded, {"id": ObjectId("5cf29abb5167a14c9e6e12c4")})
+
+    def test_it_decodes_escaped_extended_json(self):
+        loaded = self.app.json.loads(b'{"id": {"\\u0024oid": "5cf29abb5167a14c9e6e12c4"}}')
+        self.assertEqual(loaded, {"id": ObjectId("5cf29abb5167a14c9e6e12c4")})
+
+    def test_it_uses_json_options(self):
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri, json_options=JSONOptions(document_class=SON))
+        self.addCleanup(mongo.cx.close)  # type:ignore[union-attr]
+
+        self.assertIsInstance(self.app.json.loads('{"foo": "bar"}'), SON)
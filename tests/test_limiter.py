@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from pymongo.errors import NetworkTimeout
+
+import flask_pymongo
+from flask_pymongo.limiter import ConcurrencyLimiter, LimitExceeded
+
+from .util import FlaskPyMongoTest
+
+
+class ConcurrencyLimiterTest(FlaskPyMongoTest):
+    def test_it_grows_while_saturated(self):
+        limiter = ConcurrencyLimiter(initial_limit=2, max_limit=8, max_wait=5, tolerance=10)
+
+        def work():
+            for _ in range(50):
+                with limiter.slot():
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert limiter.stats == {"limit": 8, "in_flight": 0, "rejected": 0}
+
+    def test_it_shrinks_on_slow_operations(self):
+        limiter = ConcurrencyLimiter(initial_limit=10)
+        limiter.acquire()
+        limiter.release(0.001)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(0.01)
+            time.sleep(0.02)
+
+        assert limiter.stats["limit"] < 10
+
+    def test_it_shrinks_on_timeouts(self):
+        limiter = ConcurrencyLimiter(initial_limit=10)
+
+        with pytest.raises(NetworkTimeout):
+            with limiter.slot():
+                raise NetworkTimeout("timed out")
+
+        assert limiter.stats["limit"] == 9
+        assert limiter.stats["in_flight"] == 0
+
+    def test_it_rejects_after_waiting(self):
+        limiter = ConcurrencyLimiter(initial_limit=1, max_wait=0.01)
+        limiter.acquire()
+
+        with pytest.raises(LimitExceeded):
+            limiter.acquire()
+
+        assert limiter.stats == {"limit": 1, "in_flight": 1, "rejected": 1}
+
+    def test_it_limits_operations(self):
+        self.app.config["MONGO_CONCURRENCY_LIMIT"] = 1
+        self.app.config["MONGO_CONCURRENCY_MAX_WAIT"] = 0.01
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert mongo.cx is not None
+        self.addCleanup(mongo.cx.close)
+        assert mongo.limiter is not None
+
+        @self.app.route("/things")
+        def things():
+            assert mongo.db is not None
+            return {"count": mongo.db.things.count_documents({})}
+
+        client = self.app.test_client()
+        assert client.get("/things").json == {"count": 0}
+        mongo.limiter.acquire()
+        assert client.get("/things").status_code == 503
+        assert mongo.limiter.stats["rejected"] == 1
+
+    def test_it_grows_past_the_default_max_limit(self):
+        self.app.config["MONGO_CONCURRENCY_LIMIT"] = 500
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert mongo.cx is not None
+        self.addCleanup(mongo.cx.close)
+        assert mongo.limiter is not None
+
+        assert mongo.limiter.stats["limit"] == 500
+        assert mongo.limiter.max_limit == 500
+
+    def test_it_does_not_limit_background_threads(self):
+        self.app.config["MONGO_CONCURRENCY_LIMIT"] = 1
+        self.app.config["MONGO_CONCURRENCY_MAX_WAIT"] = 0.01
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert mongo.cx is not None
+        self.addCleanup(mongo.cx.close)
+        assert mongo.limiter is not None
+        assert mongo.db is not None
+        things = mongo.db.things
+        counts = []
+
+        mongo.limiter.acquire()
+        with pytest.raises(LimitExceeded):
+            things.count_documents({})
+        thread = threading.Thread(target=lambda: counts.append(things.count_documents({})))
+        thread.start()
+        thread.join()
+
+        assert counts == [0]
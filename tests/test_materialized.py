@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from bson import ObjectId
+
+from flask_pymongo import wrappers
+
+from .util import FlaskPyMongoTest
+
+PIPELINE = [{"$group": {"_id": "$day", "total": {"$sum": "$amount"}}}]
+
+
+class MaterializedViewTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.cx is not None
+        if tuple(self.mongo.cx.server_info()["versionArray"]) < (4, 2):
+            pytest.skip("materialized views require MongoDB 4.2")
+        assert self.mongo.db is not None
+        self.mongo.db.orders.insert_many(
+            [
+                {"day": 1, "amount": 10},
+                {"day": 1, "amount": 5},
+                {"day": 2, "amount": 7},
+            ]
+        )
+        self.view = self.mongo.materialize("sales_by_day", "orders", PIPELINE)
+
+    def totals(self):
+        return {doc["_id"]: doc["total"] for doc in self.view.collection.find()}
+
+    def test_it_is_registered_by_name(self):
+        assert self.mongo.materialized("sales_by_day") is self.view
+        assert isinstance(self.view.collection, wrappers.Collection)
+
+    def test_refresh_writes_the_results(self):
+        assert self.view.status().stale
+
+        assert self.view.refresh()
+
+        assert self.totals() == {1: 15, 2: 7}
+        status = self.view.status()
+        assert status.refreshed_at is not None
+        assert status.age is not None and status.age >= 0
+        assert status.duration is not None
+        assert not status.stale
+
+    def test_refresh_removes_results_no_longer_produced(self):
+        assert self.mongo.db is not None
+        self.view.refresh()
+        self.mongo.db.orders.delete_many({"day": 2})
+        self.mongo.db.orders.insert_one({"day": 3, "amount": 1})
+
+        self.view.refresh()
+
+        assert self.totals() == {1: 15, 3: 1}
+
+    def test_incremental_refresh_keeps_existing_results(self):
+        view = self.mongo.materialize(
+            "recent_sales",
+            "orders",
+            [{"$match": {"day": {"$gte": 2}}}, *PIPELINE],
+            incremental=True,
+        )
+        view.collection.insert_one({"_id": 0, "total": 3})
+
+        view.refresh()
+
+        assert {doc["_id"]: doc["total"] for doc in view.collection.find()} == {0: 3, 2: 7}
+
+    def test_refresh_is_skipped_while_another_is_running(self):
+        assert self.view._acquire(ObjectId())
+
+        assert not self.view.refresh()
+        assert self.totals() == {}
+
+    def test_an_expired_lease_can_only_be_released_by_its_new_owner(self):
+        assert self.mongo.db is not None
+        view = self.mongo.materialize("expiring_sales", "orders", PIPELINE, lease=-1)
+        owner, other = ObjectId(), ObjectId()
+        assert view._acquire(owner)
+        assert view._acquire(other)
+
+        assert not view._renew(owner)
+        view._release(owner, {"refreshedAt": None})
+
+        meta = self.mongo.db.materialized_views.find_one({"_id": "expiring_sales"})
+        assert meta is not None
+        assert meta["leaseOwner"] == other
+        assert "refreshedAt" not in meta
+
+    def test_scheduled_views_are_refreshed_when_read(self):
+        view = self.mongo.materialize("scheduled_sales", "orders", PIPELINE, every=60)
+        assert view.max_age == 120
+
+        view.collection.find_one()
+        deadline = time.monotonic() + 5
+        while view.status().refreshed_at is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert view.status().refreshed_at is not None
+
+    def test_cli_refreshes_views(self):
+        result = self.app.test_cli_runner().invoke(args=["mongo", "refresh-materialized"])
+
+        assert result.exit_code == 0
+        assert "sales_by_day" in result.output
+        assert self.totals() == {1: 15, 2: 7}
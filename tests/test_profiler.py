@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import json
+
+import flask_pymongo
+from flask_pymongo.profiler import query_shape
+
+from .util import FlaskRequestTest
+
+
+class QueryShapeTest(FlaskRequestTest):
+    def test_it_removes_values(self):
+        shape = query_shape("find", {"find": "users", "filter": {"age": {"$gt": 21}, "name": "x"}})
+        assert json.loads(shape) == {"filter": {"age": {"$gt": "?"}, "name": "?"}}
+
+    def test_it_ignores_key_order_and_values(self):
+        one = query_shape("find", {"filter": {"a": 1, "b": {"$in": [1, 2]}}, "sort": {"c": 1}})
+        two = query_shape("find", {"filter": {"b": {"$in": [3]}, "a": 2}, "sort": {"c": 1}})
+        assert one == two
+
+    def test_it_keeps_sort_directions(self):
+        one = query_shape("find", {"filter": {}, "sort": {"c": 1}})
+        two = query_shape("find", {"filter": {}, "sort": {"c": -1}})
+        assert one != two
+
+    def test_it_shapes_pipelines(self):
+        shape = query_shape(
+            "aggregate",
+            {"pipeline": [{"$match": {"a": 1}}, {"$group": {"_id": "$a", "n": {"$sum": 1}}}]},
+        )
+        assert json.loads(shape) == {"pipeline": [{"$match": {"a": "?"}}, {"$group": "?"}]}
+
+
+class QueryProfilerTest(FlaskRequestTest):
+    def setUp(self):
+        super().setUp()
+
+        self.app.config["MONGO_PROFILE"] = True
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        self.mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_many([{"n": i} for i in range(10)])
+
+    def tearDown(self):
+        assert self.mongo.cx is not None
+        self.mongo.cx.drop_database(self.dbname)
+        self.mongo.cx.close()
+        super().tearDown()
+
+    def test_it_aggregates_by_shape(self):
+        assert self.mongo.db is not None and self.mongo.profiler is not None
+        for i in range(3):
+            self.mongo.db.things.find_one({"n": i})
+
+        [stats] = [s for s in self.mongo.profiler.report() if s.command_name == "find"]
+        assert stats.namespace == f"{self.dbname}.things"
+        assert stats.count == 3
+        assert stats.total_ms > 0
+
+    def test_it_flags_collection_scans(self):
+        assert self.mongo.db is not None and self.mongo.profiler is not None
+        self.mongo.db.things.find_one({"n": 5})
+
+        [stats] = [s for s in self.mongo.profiler.explain(top=10) if s.command_name == "find"]
+        assert "COLLSCAN" in stats.flags
+
+    def test_the_cli_command_reports_shapes(self):
+        assert self.mongo.db is not None
+        self.mongo.db.command("profile", 2)
+        self.addCleanup(self.mongo.db.command, "profile", 0)
+        self.mongo.db.things.find_one({"n": 5})
+
+        result = self.app.test_cli_runner().invoke(args=["mongo", "profile", "--explain"])
+
+        assert result.exit_code == 0, result.output
+        assert '{"filter": {"n": "?"}}' in result.output
+        assert "COLLSCAN" in result.output
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import pytest
+from pymongo.read_preferences import Nearest, Primary, SecondaryPreferred
+
+from .util import FlaskPyMongoTest
+
+
+class ReadPreferenceTest(FlaskPyMongoTest):
+    def test_it_applies_inside_the_block(self):
+        with self.mongo.read_preference("secondaryPreferred", max_staleness=120):
+            assert self.mongo.db is not None
+            pref = self.mongo.db.things.read_preference
+            assert pref == SecondaryPreferred(max_staleness=120)
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.things.read_preference == Primary()
+
+    def test_it_decorates_views(self):
+        @self.mongo.read_preference(Nearest())
+        def view():
+            assert self.mongo.db is not None
+            return self.mongo.db.things.read_preference
+
+        assert view() == Nearest()
+        assert view() == Nearest()
+
+    def test_it_rejects_unknown_modes(self):
+        with pytest.raises(ValueError):
+            with self.mongo.read_preference("mostlyPrimary"):
+                pass
+
+    def test_it_starts_a_causal_session(self):
+        assert self.mongo.db is not None
+        with self.mongo.read_preference("secondaryPreferred", causal_consistency=True) as session:
+            assert session is not None
+            assert session.options.causal_consistency
+            self.mongo.db.things.insert_one({"_id": "thing"}, session=session)
+            assert self.mongo.db.things.find_one({"_id": "thing"}, session=session) is not None
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from flask import session
+
+import flask_pymongo
+from flask_pymongo.sessions import MongoSessionInterface
+
+from .util import FlaskPyMongoTest
+
+
+class MongoSessionInterfaceTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.cx is not None
+        self.addCleanup(self.mongo.cx.close)
+        self.app.config["MONGO_SESSION_COLLECTION"] = "sessions"
+        self.app.config["MONGO_SESSION_REFRESH_THRESHOLD"] = 60
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        self.mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert self.mongo.db is not None
+        self.sessions = self.mongo.db.sessions
+
+        @self.app.route("/login")
+        def login():
+            session["user"] = "ada"
+            return ""
+
+        @self.app.route("/whoami")
+        def whoami():
+            return session.get("user", "nobody")
+
+        @self.app.route("/logout")
+        def logout():
+            session.clear()
+            return ""
+
+        self.client = self.app.test_client()
+
+    def test_it_is_installed_by_init_app(self):
+        assert isinstance(self.app.session_interface, MongoSessionInterface)
+        statuses = {status.name: status.status for status in self.mongo.check_indexes()}
+        assert statuses["expiresAt_1"] == "missing"
+
+    def test_it_stores_sessions(self):
+        assert self.client.get("/whoami").text == "nobody"
+        assert self.sessions.count_documents({}) == 0
+
+        self.client.get("/login")
+
+        assert self.client.get("/whoami").text == "ada"
+        doc = self.sessions.find_one()
+        assert doc is not None
+        assert doc["data"] == {"user": "ada"}
+        cookie = self.client.get_cookie("session")
+        assert cookie is not None
+        assert cookie.value == doc["_id"]
+
+    def test_it_does_not_rewrite_unmodified_sessions(self):
+        self.client.get("/login")
+        doc = self.sessions.find_one()
+        assert doc is not None
+
+        response = self.client.get("/whoami")
+
+        assert "Set-Cookie" not in response.headers
+        assert self.sessions.find_one() == doc
+
+    def test_it_refreshes_expiry_past_the_threshold(self):
+        self.client.get("/login")
+        expires_at = self.sessions.find_one()["expiresAt"] - timedelta(seconds=120)
+        self.sessions.update_one({}, {"$set": {"expiresAt": expires_at}})
+
+        response = self.client.get("/whoami")
+
+        assert "Set-Cookie" in response.headers
+        assert self.sessions.find_one()["expiresAt"] > expires_at + timedelta(seconds=60)
+
+    def test_it_deletes_cleared_sessions(self):
+        self.client.get("/login")
+
+        self.client.get("/logout")
+
+        assert self.sessions.count_documents({}) == 0
+        assert self.client.get("/whoami").text == "nobody"
+
+    def test_it_ignores_expired_sessions(self):
+        self.client.get("/login")
+        self.sessions.update_one({}, {"$set": {"expiresAt": datetime(2000, 1, 1)}})
+
+        assert self.client.get("/whoami").text == "nobody"
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+import pytest
+
+import flask_pymongo
+from flask_pymongo.shared_cache import SharedCache
+
+from .util import FlaskPyMongoTest
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the shared cache requires POSIX")
+class SharedCacheTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, "cache")
+        self.addCleanup(os.rmdir, directory)
+
+        def remove() -> None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+        self.addCleanup(remove)
+
+    def test_it_shares_entries_between_instances(self):
+        writer = SharedCache(self.path, size=64 * 1024, slot_size=512)
+        reader = SharedCache(self.path, size=64 * 1024, slot_size=512)
+
+        assert writer.set("key", {"value": 1})
+        assert reader.get("key") == {"value": 1}
+
+        reader.delete("key")
+        with pytest.raises(KeyError):
+            writer.get("key")
+
+    def test_clear_invalidates_every_entry(self):
+        cache = SharedCache(self.path, size=64 * 1024, slot_size=512)
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        SharedCache(self.path, size=64 * 1024, slot_size=512).clear()
+
+        for key in ("a", "b"):
+            with pytest.raises(KeyError):
+                cache.get(key)
+
+    def test_it_is_bounded(self):
+        cache = SharedCache(self.path, size=64 * 1024, slot_size=512)
+        for i in range(1000):
+            cache.set(f"key-{i}", i)
+
+        assert os.path.getsize(self.path) <= 64 * 1024
+        assert not cache.set("large", "x" * 1024)
+        assert cache.get("key-999") == 999
+
+    def test_it_keeps_the_layout_of_an_existing_file(self):
+        first = SharedCache(self.path, size=64 * 1024, slot_size=512)
+        first.set("key", 1)
+
+        second = SharedCache(self.path, size=128 * 1024, slot_size=1024)
+
+        assert second.get("key") == 1
+        assert second.slot_size == 512
+        assert os.path.getsize(self.path) <= 64 * 1024
+        assert first.get("key") == 1
+
+    def test_it_expires_entries(self):
+        cache = SharedCache(self.path, size=64 * 1024, slot_size=512)
+        cache.set("key", 1, ttl=-1)
+
+        with pytest.raises(KeyError):
+            cache.get("key")
+
+    def test_it_caches_send_file_and_find_one(self):
+        self.app.config["MONGO_SHARED_CACHE_PATH"] = self.path
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+        mongo = flask_pymongo.PyMongo(self.app, uri)
+        assert mongo.cx is not None and mongo.db is not None
+        self.addCleanup(mongo.cx.close)
+        assert mongo.shared_cache is not None
+
+        mongo.save_file("file.txt", BytesIO(b"first"))
+        assert mongo.send_file("file.txt").get_data() == b"first"
+        assert mongo.send_file("file.txt").get_data() == b"first"
+        assert mongo.shared_cache.stats["hits"] == 1
+
+        mongo.save_file("file.txt", BytesIO(b"second"))
+        assert mongo.send_file("file.txt").get_data() == b"second"
+
+        uploads = mongo.resumable_uploads()
+        upload_id = uploads.create("file.txt")
+        uploads.append(upload_id, BytesIO(b"third"), 0)
+        uploads.finalize(upload_id)
+        assert mongo.send_file("file.txt").get_data() == b"third"
+
+        mongo.db.settings.insert_one({"_id": "site", "theme": "dark"})
+        assert mongo.db.settings.find_one_cached({"_id": "site"})["theme"] == "dark"
+        mongo.db.settings.delete_one({"_id": "site"})
+        assert mongo.db.settings.find_one_cached({"_id": "site"})["theme"] == "dark"
+
+
+@pytest.mark.skipif(sys.platform != "win32", reason="the shared cache is available")
+class SharedCacheUnavailableTest(FlaskPyMongoTest):
+    def test_it_raises_on_windows(self):
+        self.app.config["MONGO_SHARED_CACHE_PATH"] = os.path.join(tempfile.gettempdir(), "cache")
+        uri = f"mongodb://localhost:{self.port}/{self.dbname}"
+
+        with pytest.raises(ValueError, match="MONGO_SHARED_CACHE_PATH"):
+            flask_pymongo.PyMongo(self.app, uri)
@@ -1,8 +1,26 @@
 from __future__ import annotations
 
+import json
+import time
+from datetime import datetime
 from typing import Any
 
-from werkzeug.exceptions import HTTPException
+import pymongo
+import pytest
+from flask import jsonify
+from pymongo import DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import ServerSelectionTimeoutError
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound, ServiceUnavailable
+
+from flask_pymongo.helpers import requested_projection
+from flask_pymongo.scan import ScanProgress
+from flask_pymongo.stale import StaleCache
+from flask_pymongo.wrappers import (
+    BufferedWriteError,
+    LazyDocument,
+    MongoClient,
+    _flush_write_buffers,
+)
 
 from .util import FlaskPyMongoTest
 
@@ -22,3 +40,389 @@ class CollectionTest(FlaskPyMongoTest):
         # now it should not raise
         thing: dict[str, Any] = self.mongo.db.things.find_one_or_404({"_id": "thing"})
         assert thing["val"] == "foo"
+
+
+class StaleCacheTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_one({"_id": "thing", "val": "foo"})
+
+        # The same collection, on a client which cannot reach the server.
+        self.down = MongoClient("mongodb://localhost:1", serverSelectionTimeoutMS=50)
+        self.addCleanup(self.down.close)
+        self.down._stale_cache = self.mongo.stale_cache
+
+    def test_it_serves_fresh_documents(self):
+        assert self.mongo.db is not None
+        things = self.mongo.db.things
+        assert things.find_one_or_404({"_id": "thing"}, serve_stale=True)["val"] == "foo"
+
+        things.update_one({"_id": "thing"}, {"$set": {"val": "bar"}})
+
+        assert things.find_one_or_404({"_id": "thing"}, serve_stale=True)["val"] == "bar"
+        assert self.mongo.stale_cache is not None
+        assert self.mongo.stale_cache.stats["fresh"] == 2
+
+    def test_it_serves_stale_documents_when_unavailable(self):
+        assert self.mongo.db is not None
+        self.mongo.db.things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        thing = self.down[self.dbname].things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        assert thing["val"] == "foo"
+        assert self.mongo.stale_cache is not None
+        assert self.mongo.stale_cache.stats["stale"] == 1
+        with pytest.raises(ServerSelectionTimeoutError):
+            self.down[self.dbname].things.find_one_or_404({"_id": "other"}, serve_stale=True)
+
+    def test_it_opens_the_circuit(self):
+        self.down._stale_cache = cache = StaleCache(failure_threshold=1)
+        things = self.down[self.dbname].things
+
+        with pytest.raises(ServerSelectionTimeoutError):
+            things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        assert cache.circuit_open
+        with pytest.raises(ServiceUnavailable):
+            things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+    def test_it_reports_the_circuit_half_open(self):
+        self.down._stale_cache = cache = StaleCache(failure_threshold=1, reset_timeout=0.05)
+
+        with pytest.raises(ServerSelectionTimeoutError):
+            self.down[self.dbname].things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        assert cache.circuit_open
+        time.sleep(0.1)
+        assert not cache.circuit_open
+
+    def test_it_refreshes_within_the_request_deadline(self):
+        assert self.mongo.db is not None
+        things = self.mongo.db.things
+        things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        with pymongo.timeout(0.001):
+            time.sleep(0.01)
+            thing = things.find_one_or_404({"_id": "thing"}, serve_stale=True)
+
+        assert thing["val"] == "foo"
+        assert self.mongo.stale_cache is not None
+        assert self.mongo.stale_cache.stats["stale"] == 1
+
+
+class BufferWriteTest(FlaskPyMongoTest):
+    def test_it_writes_on_flush(self):
+        assert self.mongo.db is not None
+        self.mongo.db.things.buffer_write(InsertOne({"_id": 1}), InsertOne({"_id": 2}))
+        self.mongo.db.things.buffer_write(UpdateOne({"_id": 1}, {"$set": {"a": 1}}))
+        assert self.mongo.db.things.count_documents({}) == 0
+
+        self.mongo.flush_writes()
+
+        assert self.mongo.db.things.find_one({"_id": 1}) == {"_id": 1, "a": 1}
+        assert self.mongo.db.things.count_documents({}) == 2
+
+    def test_it_writes_on_teardown(self):
+        assert self.mongo.db is not None
+        with self.app.app_context():
+            self.mongo.db.things.buffer_write(InsertOne({"_id": 1}), ordered=False)
+
+        assert self.mongo.db.things.count_documents({}) == 1
+
+    def test_it_discards_writes_on_error(self):
+        assert self.mongo.db is not None
+        with pytest.raises(ValueError), self.app.app_context():
+            self.mongo.db.things.buffer_write(InsertOne({"_id": 1}))
+            raise ValueError("boom")
+
+        assert self.mongo.db.things.count_documents({}) == 0
+
+    def test_it_maps_failures_to_operations(self):
+        assert self.mongo.db is not None
+        duplicate = InsertOne({"_id": 1})
+        self.mongo.db.things.buffer_write(InsertOne({"_id": 1}), duplicate, ordered=False)
+        self.mongo.db.others.buffer_write(InsertOne({"_id": 1}))
+
+        with pytest.raises(BufferedWriteError) as exc_info:
+            self.mongo.flush_writes()
+
+        [(request, error)] = exc_info.value.failures
+        assert request is duplicate
+        assert error["code"] == 11000
+        assert self.mongo.db.others.count_documents({}) == 1
+
+    def test_it_reports_batches_which_could_not_be_sent(self):
+        down = MongoClient("mongodb://localhost:1", serverSelectionTimeoutMS=50)
+        self.addCleanup(down.close)
+        down[self.dbname].things.buffer_write(InsertOne({"_id": 1}))
+        down[self.dbname].others.buffer_write(InsertOne({"_id": 1}))
+
+        failures = _flush_write_buffers(down)
+
+        assert [request for request, _ in failures] == [None, None]
+        assert {error["ns"] for _, error in failures} == {
+            f"{self.dbname}.things",
+            f"{self.dbname}.others",
+        }
+
+
+class PaginateTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_many([{"_id": i, "n": i // 3} for i in range(10)])
+
+    def test_it_pages_through_all_documents(self):
+        assert self.mongo.db is not None
+        seen: list[int] = []
+        after = None
+        while True:
+            page = self.mongo.db.things.paginate(sort=[("n", DESCENDING)], page_size=4, after=after)
+            seen.extend(doc["_id"] for doc in page.documents)
+            if page.next is None:
+                break
+            after = page.next
+
+        assert seen == [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]
+
+    def test_it_applies_the_filter(self):
+        assert self.mongo.db is not None
+        page = self.mongo.db.things.paginate({"n": {"$gte": 2}}, sort="n", page_size=2)
+        page = self.mongo.db.things.paginate(
+            {"n": {"$gte": 2}}, sort="n", page_size=2, after=page.next
+        )
+
+        assert [doc["_id"] for doc in page.documents] == [8, 9]
+        assert page.next is None
+
+    def test_it_rejects_invalid_tokens(self):
+        assert self.mongo.db is not None
+        with pytest.raises(BadRequest):
+            self.mongo.db.things.paginate(after="not-a-token")
+
+    def test_it_rejects_empty_pages(self):
+        assert self.mongo.db is not None
+        with pytest.raises(BadRequest):
+            self.mongo.db.things.paginate(page_size=0)
+
+    def test_it_jsonifies_pages(self):
+        assert self.mongo.db is not None
+        page = self.mongo.db.things.paginate(page_size=1)
+
+        dumped = json.loads(jsonify(page).get_data())
+        assert dumped == {"documents": [{"_id": 0, "n": 0}], "next": page.next}
+
+
+class RequestedProjectionTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.db is not None
+        self.mongo.db.users.insert_one(
+            {
+                "_id": "alice",
+                "name": "Alice",
+                "password": "secret",
+                "address": {"city": "Paris", "street": "Rue de Rivoli"},
+            }
+        )
+
+    def find(self, query_string, **kwargs):
+        assert self.mongo.db is not None
+        with self.app.test_request_context(f"/?{query_string}"):
+            projection = requested_projection(["name", "address"], **kwargs)
+            return self.mongo.db.users.find_one_or_404("alice", projection=projection)
+
+    def test_it_returns_only_the_requested_fields(self):
+        user = self.find("fields=name,address.city")
+
+        assert user == {"_id": "alice", "name": "Alice", "address": {"city": "Paris"}}
+
+    def test_it_returns_whole_documents_by_default(self):
+        assert self.find("")["password"] == "secret"
+        assert self.find("", default=["name"]) == {"_id": "alice", "name": "Alice"}
+
+    def test_it_rejects_fields_not_allowed(self):
+        with pytest.raises(BadRequest):
+            self.find("fields=name,password")
+        with pytest.raises(BadRequest):
+            self.find("fields=addr")
+
+    def test_it_rejects_malformed_paths(self):
+        for fields in ("address.", "address..city", "address.$city", "$address"):
+            with self.app.test_request_context(f"/?fields={fields}"):
+                with pytest.raises(BadRequest):
+                    requested_projection(["address"])
+
+    def test_it_merges_overlapping_and_required_fields(self):
+        with self.app.test_request_context("/?fields=address.city,address,"):
+            projection = requested_projection(["address"], required=["name"])
+
+        assert projection == {"address": True, "name": True}
+
+
+class SendDocumentTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_one({"_id": "thing", "val": "foo", "version": 1})
+
+    def test_it_404s_for_missing_documents(self):
+        assert self.mongo.db is not None
+        with pytest.raises(NotFound):
+            self.mongo.db.things.send_document({"_id": "nothing"})
+
+    def test_it_sends_json(self):
+        assert self.mongo.db is not None
+        resp = self.mongo.db.things.send_document({"_id": "thing"}, projection={"val": True})
+
+        assert resp.status_code == 200
+        assert resp.json == {"_id": "thing", "val": "foo"}
+
+    def test_it_supports_conditional_gets(self):
+        assert self.mongo.db is not None
+        etag = self.mongo.db.things.send_document({"_id": "thing"}).get_etag()[0]
+
+        with self.app.test_request_context(headers={"If-None-Match": etag}):
+            resp = self.mongo.db.things.send_document({"_id": "thing"})
+            assert resp.status_code == 304
+
+        self.mongo.db.things.update_one({"_id": "thing"}, {"$set": {"val": "bar"}})
+        with self.app.test_request_context(headers={"If-None-Match": etag}):
+            resp = self.mongo.db.things.send_document({"_id": "thing"})
+            assert resp.status_code == 200
+
+    def test_it_uses_the_version_field(self):
+        assert self.mongo.db is not None
+        send = self.mongo.db.things.send_document
+        etag = send({"_id": "thing"}, version_field="version").get_etag()[0]
+
+        self.mongo.db.things.update_one({"_id": "thing"}, {"$set": {"val": "bar"}})
+        with self.app.test_request_context(headers={"If-None-Match": etag}):
+            assert send({"_id": "thing"}, version_field="version").status_code == 304
+
+        self.mongo.db.things.update_one({"_id": "thing"}, {"$inc": {"version": 1}})
+        with self.app.test_request_context(headers={"If-None-Match": etag}):
+            assert send({"_id": "thing"}, version_field="version").status_code == 200
+
+    def test_it_uses_the_last_modified_field(self):
+        assert self.mongo.db is not None
+        modified = datetime(2025, 1, 29, 12, 0, 0)
+        self.mongo.db.things.update_one({"_id": "thing"}, {"$set": {"modified": modified}})
+        headers = {"If-Modified-Since": "Wed, 29 Jan 2025 12:00:00 GMT"}
+
+        with self.app.test_request_context(headers=headers):
+            resp = self.mongo.db.things.send_document(
+                {"_id": "thing"}, last_modified_field="modified"
+            )
+            assert resp.status_code == 304
+
+
+class ParallelScanTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.db is not None
+        self.mongo.db.things.insert_many([{"_id": n, "odd": n % 2} for n in range(2000)])
+
+    def test_it_scans_every_document(self):
+        assert self.mongo.db is not None
+        found = self.mongo.db.things.parallel_scan({"odd": 1}, partitions=4)
+
+        assert sorted(doc["_id"] for doc in found) == list(range(1, 2000, 2))
+
+    def test_it_applies_a_callback(self):
+        assert self.mongo.db is not None
+        reports: list[ScanProgress] = []
+        results = self.mongo.db.things.parallel_scan(
+            partitions=3, callback=lambda doc: doc["_id"] * 2, progress=reports.append
+        )
+
+        assert sorted(results) == list(range(0, 4000, 2))
+        assert reports[-1] == (2000, 3, 3)
+
+    def test_it_resumes_from_checkpoints(self):
+        assert self.mongo.db is not None
+        scan = self.mongo.db.things.parallel_scan(checkpoint="job", checkpoint_every=100)
+        first = [next(scan)["_id"] for _ in range(500)]
+        scan.close()
+        assert self.mongo.db["things.scan_checkpoints"].count_documents({}) == 1
+
+        rest = [doc["_id"] for doc in self.mongo.db.things.parallel_scan(checkpoint="job")]
+        assert set(first) | set(rest) == set(range(2000))
+        assert len(first) + len(rest) < 2000 + 4
+        assert self.mongo.db["things.scan_checkpoints"].count_documents({}) == 0
+
+    def test_it_refuses_checkpoints_of_other_scans(self):
+        assert self.mongo.db is not None
+        scan = self.mongo.db.things.parallel_scan(
+            {"odd": 1}, checkpoint="job", checkpoint_every=100
+        )
+        next(scan)
+        scan.close()
+
+        with pytest.raises(ValueError):
+            next(self.mongo.db.things.parallel_scan({"odd": 0}, checkpoint="job"))
+        with pytest.raises(ValueError):
+            next(self.mongo.db.things.parallel_scan({"odd": 1}, partitions=2, checkpoint="job"))
+        assert next(self.mongo.db.things.parallel_scan({"odd": 1}, checkpoint="job"))["odd"] == 1
+
+    def test_it_rejects_a_sort(self):
+        assert self.mongo.db is not None
+        with pytest.raises(ValueError):
+            self.mongo.db.things.parallel_scan(sort=[("_id", DESCENDING)])
+
+    def test_it_raises_callback_errors(self):
+        assert self.mongo.db is not None
+
+        def process(doc: Any) -> Any:
+            if doc["_id"] == 1000:
+                raise ValueError("boom")
+            return doc
+
+        with pytest.raises(ValueError):
+            list(self.mongo.db.things.parallel_scan(callback=process))
+
+
+class LazyDocumentTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        self.document = {
+            "_id": "ada",
+            "name": "Ada",
+            "address": {"city": "London", "lines": ["1 Street"]},
+            "created": datetime(2020, 1, 1),
+            "history": [{"n": n} for n in range(100)],
+        }
+        assert self.mongo.db is not None
+        self.mongo.db.users.insert_one(self.document)
+
+    def test_find_one_or_404(self):
+        assert self.mongo.db is not None
+        user = self.mongo.db.users.lazy().find_one_or_404({"_id": "ada"})
+
+        assert isinstance(user, LazyDocument)
+        assert user["name"] == "Ada"
+        assert isinstance(user["address"], LazyDocument)
+        assert user["address"]["lines"] == ["1 Street"]
+        assert user.get("missing") is None
+        assert "created" in user
+        assert list(user) == list(self.document)
+        assert len(user) == len(self.document)
+
+        with pytest.raises(NotFound):
+            self.mongo.db.users.lazy().find_one_or_404({"_id": "bob"})
+
+    def test_it_serializes_to_json(self):
+        assert self.mongo.db is not None
+        user = self.mongo.db.users.lazy().find_one({"_id": "ada"})
+        assert user is not None
+        user["name"]
+
+        assert json.loads(jsonify(user).get_data()) == json.loads(
+            jsonify(self.mongo.db.users.find_one({"_id": "ada"})).get_data()
+        )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from flask_pymongo.writer import BackgroundWriter
+
+from .util import FlaskPyMongoTest
+
+
+class BackgroundWriterTest(FlaskPyMongoTest):
+    def setUp(self):
+        super().setUp()
+
+        assert self.mongo.db is not None
+        self.writer = BackgroundWriter(self.mongo.db, max_queue_size=2, flush_interval=60)
+        self.addCleanup(self.writer.close)
+
+    def test_it_is_created_by_init_app(self):
+        assert isinstance(self.mongo.writer, BackgroundWriter)
+
+    def test_it_writes_on_flush(self):
+        assert self.writer.insert("events", {"n": 1})
+        assert self.writer.insert("events", {"n": 2})
+
+        assert self.writer.flush(timeout=5)
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.events.count_documents({}) == 2
+        assert self.writer.stats["written"] == 2
+
+    def test_it_drops_when_full(self):
+        assert self.writer.insert("events", {"n": 1})
+        assert self.writer.insert("events", {"n": 2})
+        assert not self.writer.insert("events", {"n": 3})
+        assert not self.writer.insert("events", {"n": 4}, block=True, timeout=0.05)
+
+        stats = self.writer.stats
+        assert stats["queued"] == 2
+        assert stats["dropped"] == 2
+        assert stats["pending"] == 2
+
+    def test_it_survives_unencodable_documents(self):
+        assert self.writer.insert("bad", {"n": object()})
+        assert self.writer.flush(timeout=5)
+
+        assert self.writer.insert("events", {"n": 1})
+        assert self.writer.flush(timeout=5)
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.events.count_documents({}) == 1
+        stats = self.writer.stats
+        assert stats["failed"] == 1
+        assert stats["written"] == 1
+        assert stats["pending"] == 0
+
+    def test_it_writes_on_close(self):
+        self.writer.insert("events", {"n": 1})
+
+        self.writer.close()
+
+        assert self.mongo.db is not None
+        assert self.mongo.db.events.count_documents({}) == 1